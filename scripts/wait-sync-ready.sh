@@ -1,93 +1,126 @@
 #!/usr/bin/env bash
-# Wait until sync daemon has fully pulled and linked
-# Conditions:
-#  1) HIST_DIR is a valid git repo with origin set
-#  2) local HEAD equals origin/<branch>
-#  3) All targets have been symlinked at BASE (best effort)
+# Wait until sync daemon has reached a readiness stage
+# Stages (see sync/core/readiness.py):
+#  starting -> remote_ready (HEAD == origin/<branch>) -> linked (targets symlinked) -> synced
+# The daemon publishes the stage itself; we block on its long-poll API instead of running git:
+#  1) GET /sync/api/ready?stage=<stage>&timeout=<s> (200 = reached, 503 = not yet)
+#  2) without curl: read the ready file it writes atomically (stage=...), trusting it only
+#     while the writing daemon process is alive
+#
+# Env:
+#  WAIT_STAGE       stage to wait for (default linked; WAIT_SKIP_LINKS=true means remote_ready)
+#  WAIT_POLL        seconds per long-poll request (default 60)
+#  WAIT_TIMEOUT     seconds to wait for WAIT_STAGE (default 120; 0 = forever). After that the script
+#                   settles for remote_ready (HEAD aligned, as the old script did) so a stuck link
+#                   stage cannot keep the gated service down; remote_ready itself is always awaited
+#  SYNC_PORT        sync web port (default 5321)
+#  SYNC_READY_FILE  ready file (default $HIST_DIR/.sync.ready)
 
 set -Euo pipefail
 
-BASE=${BASE:-/}
 HIST_DIR=${HIST_DIR:-/home/steam/.sdv-backup}
-BRANCH=${GIT_BRANCH:-main}
-declare -a TARGETS=()
-
-# Default: only sync Stardew saves
-DEFAULT_TARGETS=(
-  home/steam/.config/StardewValley/Saves/
-)
+if [[ "${WAIT_SKIP_LINKS:-false}" == "true" ]]; then
+  STAGE=${WAIT_STAGE:-remote_ready}
+else
+  STAGE=${WAIT_STAGE:-linked}
+fi
+POLL=${WAIT_POLL:-60}
+TIMEOUT=${WAIT_TIMEOUT:-120}
+READY_URL="http://127.0.0.1:${SYNC_PORT:-5321}/sync/api/ready"
+READY_FILE=${SYNC_READY_FILE:-$HIST_DIR/.sync.ready}
 
 log() { printf '[%s] [wait-sync] %s\n' "$(date '+%F %T')" "$*"; }
 
-abs_path() {
-  local rel="$1"
-  if [[ "$rel" = /* ]]; then printf '%s' "$rel"; return; fi
-  if [[ "$BASE" = "/" ]]; then printf '/%s' "$rel"; else printf '%s/%s' "$BASE" "$rel"; fi
+stage_rank() {
+  case "$1" in
+    starting) echo 0 ;;
+    remote_ready) echo 1 ;;
+    linked) echo 2 ;;
+    synced) echo 3 ;;
+    *) echo -1 ;;
+  esac
 }
 
-load_targets() {
-  local cfg="$HIST_DIR/sync-config.json"
-  if [[ -f "$cfg" ]] && command -v jq >/dev/null 2>&1; then
-    mapfile -t TARGETS < <(jq -r 'try .targets[] // empty' "$cfg" 2>/dev/null | sed 's#^/##') || true
-  fi
-  if (( ${#TARGETS[@]} == 0 )); then
-    TARGETS=("${DEFAULT_TARGETS[@]}")
-  fi
+# 读取就绪文件中的 stage（仅用 bash 内建，不启动子进程）；写入进程已退出时视为无效
+file_stage() {
+  local key val stage="" pid=""
+  [[ -f "$READY_FILE" ]] || return 1
+  while IFS='=' read -r key val; do
+    case "$key" in
+      stage) stage=$val ;;
+      pid) pid=$val ;;
+    esac
+  done < "$READY_FILE"
+  [[ -n "$stage" && -n "$pid" && -d "/proc/$pid" ]] || return 1
+  printf '%s' "$stage"
 }
 
-targets_symlinked() {
-  local ok=0
-  for rel in "${TARGETS[@]}"; do
-    local rel_clean="${rel%/}"
-    local p; p="$(abs_path "$rel_clean")"
-    if [[ ! -L "$p" ]]; then 
-      ok=1
-    fi
-  done
-  return $ok
-}
-
-head_equals_remote() {
-  git -C "$HIST_DIR" rev-parse --git-dir >/dev/null 2>&1 || return 1
-  git -C "$HIST_DIR" rev-parse "origin/$BRANCH" >/dev/null 2>&1 || return 1
+# 就绪文件从 linked 起才写入：remote_ready 只能直接比较 HEAD 与 origin/<branch>
+head_aligned() {
   local h1 h2
-  h1=$(git -C "$HIST_DIR" rev-parse HEAD 2>/dev/null || echo "")
-  h2=$(git -C "$HIST_DIR" rev-parse "origin/$BRANCH" 2>/dev/null || echo "")
-  [[ -n "$h1" && "$h1" = "$h2" ]]
+  h1=$(git -C "$HIST_DIR" rev-parse -q --verify HEAD 2>/dev/null) || return 1
+  h2=$(git -C "$HIST_DIR" rev-parse -q --verify "origin/${GIT_BRANCH:-main}" 2>/dev/null) || return 1
+  [[ "$h1" == "$h2" ]]
 }
 
-load_targets
+WANT=$(stage_rank "$STAGE")
+if (( WANT < 0 )); then
+  log "未知阶段：$STAGE（可选 starting/remote_ready/linked/synced）"
+  exit 1
+fi
 
-log "等待同步完成：HIST_DIR=$HIST_DIR BRANCH=$BRANCH 目标数=${#TARGETS[@]}"
-until head_equals_remote; do
-  sleep 1
-done
-log "Git 已对齐远端 HEAD"
+FLOOR=$(stage_rank remote_ready)
+START=$SECONDS
 
-if [[ "${WAIT_SKIP_LINKS:-false}" == "true" ]]; then
-  log "已配置 WAIT_SKIP_LINKS=true，跳过符号链接检查"
-  exit 0
-fi
+# 超过 WAIT_TIMEOUT 后把等待目标降为 remote_ready（目标本身不高于它时不变）
+degrade() {
+  if (( TIMEOUT > 0 && SECONDS - START >= TIMEOUT && WANT > FLOOR )); then
+    log "等待阶段 $STAGE 超过 ${TIMEOUT}s，对齐远端（remote_ready）后先继续启动（守护进程稍后会完成）"
+    STAGE=remote_ready
+    WANT=$FLOOR
+  fi
+}
 
-# 链接检查（容忍失败，仅用于尽量确保链接完成）
-for i in {1..10}; do
-  targets_symlinked
-  result=$?
-  log "第 $i 次检查: targets_symlinked 返回值=$result"
-  if [[ $result -eq 0 ]]; then
-    log "目标符号链接已就绪"
-    exit 0
+# 单次长轮询的时长：不越过降级时刻
+poll_seconds() {
+  local left
+  if (( TIMEOUT > 0 && WANT > FLOOR )); then
+    left=$(( TIMEOUT - (SECONDS - START) ))
+    (( left < 1 )) && left=1
+    (( left < POLL )) && { echo "$left"; return; }
   fi
-  for rel in "${TARGETS[@]}"; do
-    rel_clean="${rel%/}"
-    p="$(abs_path "$rel_clean")"
-    if [[ -L "$p" ]]; then
-      log "  ✓ $p"
-    else
-      log "  ✗ $p"
-    fi
+  echo "$POLL"
+}
+
+log "等待同步守护进程到达阶段 $STAGE（HIST_DIR=$HIST_DIR）"
+if command -v curl >/dev/null 2>&1; then
+  last=""
+  while :; do
+    degrade
+    wait_s=$(poll_seconds)
+    resp=$(curl -s --max-time $((wait_s + 10)) -w $'\n%{http_code}' "${READY_URL}?stage=${STAGE}&timeout=${wait_s}" || true)
+    code=${resp##*$'\n'}
+    case "$code" in
+      200)
+        break ;;
+      503)
+        now=""
+        [[ "$resp" =~ \"stage\":\"([a-z_]+)\" ]] && now=${BASH_REMATCH[1]}
+        if [[ "$now" != "$last" ]]; then
+          log "当前阶段：${now:-未知}"
+          last=$now
+        fi ;;
+      *)
+        # 守护进程或 Web 服务尚未启动：连接被拒绝的开销很小，稍后重试
+        sleep 1 ;;
+    esac
   done
-  sleep 1
-done
-log "符号链接未全部就绪，先继续启动（守护进程稍后会完成）"
+else
+  log "未找到 curl，改为检查就绪文件 $READY_FILE"
+  until { cur=$(file_stage) && (( $(stage_rank "$cur") >= WANT )); } || { (( WANT <= FLOOR )) && head_aligned; }; do
+    sleep 1
+    degrade
+  done
+fi
+log "同步已就绪（阶段 $STAGE）"
 exit 0
@@ -0,0 +1,348 @@
+"""性能基准：用本地 `file://` 裸仓库代替 GitHub，测量冷启动与稳态同步。
+
+用法：
+    python -m sync.bench --slots 4 --file-size 2048 --empty-dirs 50 --cycles 5 --out bench.json
+    python -m sync.bench ... --baseline old.json     # 同时输出与旧结果的耗时比值
+    SYNC_ISOLATION=true python -m sync.bench --cpu-load 2   # 与合成游戏负载并行，比较隔离前后的帧耗时
+
+生成的存档树模仿星露谷 Saves：每个槽位 `<Farm>_<id>/` 下有主存档、`_old` 备份、
+SaveGameInfo(_old)，以及 `--empty-dirs` 个空目录（用于衡量 `track_empty_dirs`）。
+
+场景：
+- cold_empty_remote：远端为空，`ensure_remote_ready` + `link_and_track`（迁移、初始提交与推送）；
+- cold_existing_remote：全新 BASE/HIST_DIR，从已有远端拉取并链接（容器重建后的启动）；
+- track_empty_dirs_cold / track_empty_dirs_warm：目录缓存清空 / 命中时的空目录跟踪；
+- idle_cycle：无变化时的一轮 `pull_commit_push`；
+- dirty_cycle：改写一个存档后的一轮 `pull_commit_push`。
+
+稳态两个场景额外记录仓库锁的持有时间（远端由后台预取，基准中不启动预取线程，
+等价于预取已完成的情形）。
+
+每个场景记录耗时、启动的 git 子进程数（按子命令）以及场景结束时的峰值 RSS（本进程与子进程）。
+守护进程日志重定向到 stderr，未指定 `--out` 时 stdout 只输出 JSON。
+全局 git 配置被隔离到临时目录，不会污染本机 `~/.gitconfig`。
+
+`--cpu-load N` 在整个基准期间以普通优先级运行 N 个模拟游戏主循环的进程：每帧（60 Hz）做固定量的
+CPU 计算，记录每帧计算的实际耗时；结果 `cpu_load` 给出帧耗时的 p50/p99/最大值与超出帧预算的比例，
+同一参数下分别在 SYNC_ISOLATION 开/关时运行即可比较同步对游戏帧时间的影响。
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+SAVES_REL = "home/steam/.config/StardewValley/Saves/"
+
+
+# -------- 合成存档树 --------
+def _write_save(path: str, size: int, rng: random.Random) -> None:
+    """写入类似存档 XML 的内容（可压缩但不全相同），大小约为 size 字节。"""
+    parts: List[str] = ['<?xml version="1.0" encoding="utf-8"?><SaveGame>\n']
+    n = len(parts[0])
+    while n < size:
+        line = (
+            f"<Item><name>obj{rng.getrandbits(16)}</name><stack>{rng.getrandbits(8)}</stack>"
+            f"<quality>{rng.getrandbits(2)}</quality><tile x=\"{rng.getrandbits(7)}\" y=\"{rng.getrandbits(7)}\"/></Item>\n"
+        )
+        parts.append(line)
+        n += len(line)
+    data = "".join(parts).encode("utf-8")[:max(size - 12, 0)] + b"</SaveGame>\n"
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def generate_saves(root: str, slots: int, file_kib: int, empty_dirs: int, seed: int = 1) -> Dict[str, int]:
+    rng = random.Random(seed)
+    files = 0
+    total = 0
+    for i in range(slots):
+        name = f"Farm{i}_{rng.randrange(10 ** 8, 10 ** 9)}"
+        d = os.path.join(root, name)
+        os.makedirs(d, exist_ok=True)
+        main = file_kib * 1024
+        info = max(1024, main // 20)
+        for fn, size in ((name, main), (f"{name}_old", main), ("SaveGameInfo", info), ("SaveGameInfo_old", info)):
+            _write_save(os.path.join(d, fn), size, rng)
+            files += 1
+            total += size
+        for j in range(empty_dirs):
+            os.makedirs(os.path.join(d, "empty", f"d{j:04d}"), exist_ok=True)
+    return {"files": files, "bytes": total, "empty_dirs": slots * empty_dirs}
+
+
+def _dirty_one(saves_dir: str, rng: random.Random) -> str:
+    """像游戏存档一样整体重写一个槽位的主存档与 SaveGameInfo。"""
+    slots = sorted(n for n in os.listdir(saves_dir) if os.path.isdir(os.path.join(saves_dir, n)))
+    name = rng.choice(slots)
+    d = os.path.join(saves_dir, name)
+    for fn in (name, "SaveGameInfo"):
+        p = os.path.join(d, fn)
+        _write_save(p, os.path.getsize(p), rng)
+    return name
+
+
+# -------- 合成 CPU 负载（模拟游戏主循环） --------
+_TICK_SRC = r"""
+import json, signal, sys, time
+frame, work = 1 / 60, float(sys.argv[1])
+n = 20000
+while True:  # 标定：每帧的计算量约为 work 秒
+    t0 = time.perf_counter(); x = 0
+    for i in range(n): x += i * i
+    if time.perf_counter() - t0 >= work / 4: break
+    n *= 2
+n = int(n * work / (time.perf_counter() - t0))
+samples = []
+def done(*_):
+    print(json.dumps(samples)); sys.exit(0)
+signal.signal(signal.SIGTERM, done)
+next_t = time.perf_counter()
+while True:
+    t0 = time.perf_counter(); x = 0
+    for i in range(n): x += i * i
+    samples.append(time.perf_counter() - t0)
+    next_t += frame
+    time.sleep(max(0.0, next_t - time.perf_counter()))
+"""
+
+
+def start_cpu_load(procs: int, work: float = 0.006) -> List[subprocess.Popen]:
+    return [
+        subprocess.Popen([sys.executable, "-c", _TICK_SRC, str(work)], stdout=subprocess.PIPE, text=True)
+        for _ in range(procs)
+    ]
+
+
+def stop_cpu_load(procs: List[subprocess.Popen]) -> Dict[str, Any]:
+    ticks: List[float] = []
+    for p in procs:
+        p.terminate()
+        out, _ = p.communicate(timeout=30)
+        ticks += json.loads(out or "[]")
+    if not ticks:
+        return {"procs": len(procs), "ticks": 0}
+    ticks.sort()
+    budget = 1 / 60
+    return {
+        "procs": len(procs),
+        "ticks": len(ticks),
+        "tick_p50_ms": round(ticks[len(ticks) // 2] * 1000, 3),
+        "tick_p99_ms": round(ticks[min(len(ticks) - 1, int(len(ticks) * 0.99))] * 1000, 3),
+        "tick_max_ms": round(ticks[-1] * 1000, 3),
+        "over_budget_ratio": round(sum(1 for t in ticks if t > budget) / len(ticks), 4),
+    }
+
+
+# -------- 测量 --------
+def _peak_rss() -> Dict[str, int]:
+    return {
+        "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "peak_rss_children_kib": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+
+
+@contextlib.contextmanager
+def measure(results: Dict[str, Any], name: str) -> Iterator[Dict[str, Any]]:
+    from sync.core import metrics
+
+    before = metrics.GIT_COMMANDS.snapshot()
+    rec: Dict[str, Any] = {}
+    t0 = time.perf_counter()
+    yield rec
+    rec["seconds"] = round(time.perf_counter() - t0, 4)
+    after = metrics.GIT_COMMANDS.snapshot()
+    by = {k[0]: int(v - before.get(k, 0)) for k, v in after.items() if v - before.get(k, 0)}
+    rec["git_commands"] = sum(by.values())
+    rec["git_by_subcommand"] = dict(sorted(by.items()))
+    rec.update(_peak_rss())
+    results[name] = rec
+
+
+def summarize(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    secs = sorted(s["seconds"] for s in samples)
+    return {
+        "runs": len(samples),
+        "median_seconds": round(statistics.median(secs), 4),
+        "min_seconds": secs[0],
+        "max_seconds": secs[-1],
+        "git_commands_per_run": round(statistics.mean(s["git_commands"] for s in samples), 2),
+        "git_by_subcommand": samples[-1]["git_by_subcommand"],
+        "median_lock_hold_seconds": round(statistics.median(s["lock_hold_seconds"] for s in samples), 4),
+        **_peak_rss(),
+    }
+
+
+def _make_daemon(base: str, hist_dir: str):
+    from sync.core.config import Settings
+    from sync.daemon import SyncDaemon
+
+    st = Settings(
+        base=base, hist_dir=hist_dir, branch="main", github_pat="", github_repo="bench/bench",
+        targets=[SAVES_REL], excludes=[], ready_file=os.path.join(hist_dir, ".sync-ready"),
+    )
+    return SyncDaemon(settings=st)
+
+
+def _code_revision() -> str:
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=here, capture_output=True, text=True, check=False
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def run_bench(args: argparse.Namespace) -> Dict[str, Any]:
+    from sync.core import isolation, linker
+
+    work = args.workdir or tempfile.mkdtemp(prefix="sync-bench-")
+    os.makedirs(work, exist_ok=True)
+    remote = os.path.join(work, "remote.git")
+    os.environ["GIT_CONFIG_GLOBAL"] = os.path.join(work, "gitconfig")
+    os.environ["GIT_CONFIG_NOSYSTEM"] = "1"
+    os.environ["SYNC_REMOTE_URL"] = "file://" + remote
+    os.environ["SYNC_WATCH"] = "false"
+    subprocess.run(["git", "init", "-q", "--bare", "-b", "main", remote], check=True)
+    # GitHub 支持部分克隆过滤；本地裸仓库需显式允许，否则 --filter 会被忽略
+    subprocess.run(["git", "-C", remote, "config", "uploadpack.allowFilter", "true"], check=True)
+
+    # 负载进程先于降低优先级启动，保持普通优先级（相当于游戏服务器）
+    load = start_cpu_load(args.cpu_load) if args.cpu_load else []
+    isolation.current().apply_process()
+
+    base1 = os.path.join(work, "base1")
+    saves1 = os.path.join(base1, SAVES_REL)
+    tree = generate_saves(saves1, args.slots, args.file_size, args.empty_dirs, seed=args.seed)
+
+    results: Dict[str, Any] = {}
+    daemon = _make_daemon(base1, os.path.join(work, "hist1"))
+    with measure(results, "cold_empty_remote"):
+        daemon.ensure_remote_ready()
+        daemon.link_and_track()
+
+    linker._dir_cache.clear()
+    with measure(results, "track_empty_dirs_cold") as rec:
+        linker.track_empty_dirs(daemon.st.hist_dir, daemon.st.targets, daemon.st.matcher)
+        rec["stats"] = linker.last_track_stats()
+    with measure(results, "track_empty_dirs_warm") as rec:
+        linker.track_empty_dirs(daemon.st.hist_dir, daemon.st.targets, daemon.st.matcher)
+        rec["stats"] = linker.last_track_stats()
+
+    samples: Dict[str, List[Dict[str, Any]]] = {"idle_cycle": [], "dirty_cycle": []}
+    rng = random.Random(args.seed + 1)
+    for i in range(args.cycles):
+        tmp: Dict[str, Any] = {}
+        with measure(tmp, "idle") as rec:
+            daemon.pull_commit_push()
+            rec["lock_hold_seconds"] = daemon.lock_stats["sync"]["hold"]
+        samples["idle_cycle"].append(tmp["idle"])
+        _dirty_one(saves1, rng)
+        with measure(tmp, "dirty") as rec:
+            daemon.pull_commit_push()
+            rec["phases"] = dict(daemon.last_phases)
+            rec["lock_hold_seconds"] = daemon.lock_stats["sync"]["hold"]
+        samples["dirty_cycle"].append(tmp["dirty"])
+    for name, runs in samples.items():
+        results[name] = summarize(runs)
+    results["dirty_cycle"]["last_phases"] = samples["dirty_cycle"][-1]["phases"]
+    daemon.jobs.close()
+
+    daemon2 = _make_daemon(os.path.join(work, "base2"), os.path.join(work, "hist2"))
+    with measure(results, "cold_existing_remote") as rec:
+        daemon2.ensure_remote_ready()
+        rec["bootstrap"] = daemon2.status.snapshot()[0].get("bootstrap")
+        daemon2.link_and_track()
+    daemon2.jobs.close()
+
+    load_stats = stop_cpu_load(load) if load else None
+
+    git_version = subprocess.run(["git", "--version"], capture_output=True, text=True).stdout.strip()
+    report = {
+        "meta": {
+            "revision": _code_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "git": git_version,
+            "platform": platform.platform(),
+            "params": {
+                "slots": args.slots, "file_size_kib": args.file_size, "empty_dirs": args.empty_dirs,
+                "cycles": args.cycles, "seed": args.seed, "cpu_load": args.cpu_load,
+            },
+            "tree": tree,
+            "isolation": isolation.current().snapshot(),
+        },
+        "results": results,
+    }
+    if load_stats:
+        report["cpu_load"] = load_stats
+    if not args.keep and not args.workdir:
+        shutil.rmtree(work, ignore_errors=True)
+    return report
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Dict[str, Optional[float]]]:
+    """每个场景的耗时与 git 子进程数相对基线的比值（>1 表示变慢/变多）。"""
+    out: Dict[str, Dict[str, Optional[float]]] = {}
+    for name, cur in report["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old:
+            continue
+        key = "median_seconds" if "median_seconds" in cur else "seconds"
+        gkey = "git_commands_per_run" if "git_commands_per_run" in cur else "git_commands"
+        out[name] = {
+            "time_ratio": round(cur[key] / old[key], 3) if old.get(key) else None,
+            "git_ratio": round(cur[gkey] / old[gkey], 3) if old.get(gkey) else None,
+        }
+    cur_load, old_load = report.get("cpu_load"), baseline.get("cpu_load")
+    if cur_load and old_load and old_load.get("tick_p99_ms"):
+        out["cpu_load"] = {"tick_p99_ratio": round(cur_load["tick_p99_ms"] / old_load["tick_p99_ms"], 3)}
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(prog="python -m sync.bench", description="sync 冷启动与稳态同步基准")
+    p.add_argument("--slots", type=int, default=3, help="存档槽位数")
+    p.add_argument("--file-size", type=int, default=1024, help="主存档大小（KiB）")
+    p.add_argument("--empty-dirs", type=int, default=20, help="每个槽位下的空目录数")
+    p.add_argument("--cycles", type=int, default=5, help="空闲/脏同步各测量的轮数")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--workdir", help="工作目录（默认临时目录，结束后删除）")
+    p.add_argument("--keep", action="store_true", help="保留临时工作目录")
+    p.add_argument("--out", help="结果 JSON 写入的文件（默认 stdout）")
+    p.add_argument("--baseline", help="之前的结果 JSON，用于输出比值")
+    p.add_argument("--cpu-load", type=int, default=0, help="并行运行的合成游戏负载进程数")
+    args = p.parse_args(argv)
+
+    from sync.utils import logging as logbuf
+
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run_bench(args)
+        logbuf.flush()
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["compare"] = compare(report, json.load(f))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,39 +1,170 @@
 from __future__ import annotations
 
 import os
-from typing import Iterable
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Pattern, Tuple, Union
 
 from sync.utils.logging import log
 
 
-def is_excluded(rel_under_hist: str, excludes: Iterable[str]) -> bool:
-    rel = rel_under_hist.strip("./")
-    for ex in excludes:
-        exn = ex.strip("./")
-        if rel == exn or rel.startswith(exn + "/"):
-            return True
-    return False
+_GLOB_CHARS = frozenset("*?[")
+_END = ""  # trie 终止标记（路径分量不可能为空串）
+_MANAGED_HEADER = (
+    "# Managed by sync: regenerated from the exclude list on every settings load.\n"
+    "# Manual edits will be overwritten; edit excludes via /sync/api/excludes instead.\n"
+)
 
 
-def ensure_git_info_exclude(hist_dir: str, excludes: Iterable[str]) -> None:
+def _normalize(pattern: str) -> str:
+    p = pattern.strip()
+    while p.startswith("./"):
+        p = p[2:]
+    return p.strip("/")
+
+
+def _glob_to_regex(glob: str) -> str:
+    """gitignore 风格通配符转正则：`*`/`?` 不跨 `/`，`**` 可跨目录。"""
+    i, n, out = 0, len(glob), []
+    while i < n:
+        c = glob[i]
+        if c == "*":
+            if glob.startswith("**/", i):
+                out.append("(?:.*/)?")
+                i += 3
+                continue
+            if glob.startswith("**", i):
+                out.append(".*")
+                i += 2
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = glob.find("]", i + 1)
+            if j < 0:
+                out.append(re.escape(c))
+            else:
+                body = glob[i + 1:j]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = j + 1
+                continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+class ExcludeMatcher:
+    """编译后的排除规则。
+
+    - 字面量条目（不含通配符）放入按路径分量组织的前缀树，匹配代价与路径深度成正比；
+    - 含通配符的条目预编译为正则：包含 `/` 的相对仓库根锚定，否则匹配任意层级的名称；
+    - 条目命中某个祖先目录即视为整棵子树被排除（与 gitignore 目录语义一致）。
+    """
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        self.patterns: List[str] = []
+        self._trie: Dict[str, dict] = {}
+        self._anchored: List[Pattern[str]] = []
+        self._basename: List[Pattern[str]] = []
+        for raw in patterns:
+            p = _normalize(str(raw))
+            if not p or p in self.patterns:
+                continue
+            self.patterns.append(p)
+            if _GLOB_CHARS.isdisjoint(p):
+                node = self._trie
+                for part in p.split("/"):
+                    node = node.setdefault(part, {})
+                node[_END] = {}
+            elif "/" in p:
+                self._anchored.append(re.compile(_glob_to_regex(p) + r"\Z"))
+            else:
+                self._basename.append(re.compile(_glob_to_regex(p) + r"\Z"))
+
+    def __bool__(self) -> bool:
+        return bool(self.patterns)
+
+    def __repr__(self) -> str:
+        return f"ExcludeMatcher({self.patterns!r})"
+
+    def match(self, rel_under_hist: str) -> bool:
+        rel = _normalize(rel_under_hist)
+        if not rel or not self.patterns:
+            return False
+        parts = rel.split("/")
+        node = self._trie
+        for part in parts:
+            node = node.get(part)  # type: ignore[assignment]
+            if node is None:
+                break
+            if _END in node:
+                return True
+        if self._basename:
+            for part in parts:
+                for rx in self._basename:
+                    if rx.match(part):
+                        return True
+        if self._anchored:
+            prefix = ""
+            for part in parts:
+                prefix = f"{prefix}/{part}" if prefix else part
+                for rx in self._anchored:
+                    if rx.match(prefix):
+                        return True
+        return False
+
+    __call__ = match
+
+    def git_exclude_lines(self) -> List[str]:
+        """同一份规则渲染为 `.git/info/exclude` 条目（字面量与带 `/` 的通配符锚定到根）。"""
+        lines = []
+        for p in self.patterns:
+            if _GLOB_CHARS.isdisjoint(p) or "/" in p:
+                lines.append("/" + p)
+            else:
+                lines.append(p)
+        return lines
+
+
+@lru_cache(maxsize=32)
+def _compile_cached(patterns: Tuple[str, ...]) -> ExcludeMatcher:
+    return ExcludeMatcher(patterns)
+
+
+def as_matcher(excludes: Union[ExcludeMatcher, Iterable[str]]) -> ExcludeMatcher:
+    if isinstance(excludes, ExcludeMatcher):
+        return excludes
+    return _compile_cached(tuple(excludes))
+
+
+def is_excluded(rel_under_hist: str, excludes: Union[ExcludeMatcher, Iterable[str]]) -> bool:
+    return as_matcher(excludes).match(rel_under_hist)
+
+
+def ensure_git_info_exclude(
+    hist_dir: str, excludes: Union[ExcludeMatcher, Iterable[str]], extra: Iterable[str] = ()
+) -> None:
+    """由排除规则整体重新生成 `.git/info/exclude`（临时文件 + rename 原子替换）。"""
     exfile = os.path.join(hist_dir, ".git", "info", "exclude")
-    os.makedirs(os.path.dirname(exfile), exist_ok=True)
+    lines = as_matcher(excludes).git_exclude_lines()
+    lines.extend(x for x in extra if x and x not in lines)
+    content = _MANAGED_HEADER + "".join(f"{x}\n" for x in lines)
     try:
-        existing: set[str] = set()
-        if os.path.exists(exfile):
+        os.makedirs(os.path.dirname(exfile), exist_ok=True)
+        try:
             with open(exfile, "r", encoding="utf-8", errors="ignore") as f:
-                for line in f:
-                    existing.add(line.rstrip("\n"))
-        to_add = []
-        for ex in excludes:
-            ex = ex.strip()
-            if ex and ex not in existing:
-                to_add.append(ex)
-        if to_add:
-            with open(exfile, "a", encoding="utf-8") as f:
-                for ex in to_add:
-                    f.write(ex + "\n")
-            log(f"Updated git info/exclude with {len(to_add)} entries")
+                if f.read() == content:
+                    return
+        except FileNotFoundError:
+            pass
+        tmp = exfile + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp, exfile)
+        log(f"Rewrote git info/exclude with {len(lines)} entries")
     except Exception:
         pass
-
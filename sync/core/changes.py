@@ -0,0 +1,137 @@
+"""基于 stat 缓存的变更检测。
+
+在历史仓库的 `.git` 目录中持久化一份清单：目标路径下每个文件的
+(size, mtime_ns, inode)。每轮同步先用 `os.scandir` 做一次廉价扫描并与清单比较，
+只把真正变化的路径交给 `git add`；没有变化时整个提交阶段直接跳过，
+使每轮开销与变更文件数成正比，而不是与整棵树的大小成正比。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from sync.core.blacklist import ExcludeMatcher, as_matcher
+from sync.core.config import to_under_hist
+
+
+MANIFEST_NAME = "sync-manifest.json"
+
+# 不在 targets 下但同样需要纳入检测的仓库根文件
+EXTRA_FILES = ("sync-config.json",)
+
+Entry = Tuple[int, int, int]
+
+
+class StatManifest:
+    """目标文件的 (size, mtime_ns, inode) 清单。"""
+
+    def __init__(
+        self, hist_dir: str, rel_targets: Iterable[str], excludes: Union[ExcludeMatcher, Iterable[str]] = ()
+    ) -> None:
+        self.hist_dir = hist_dir
+        self.targets = list(rel_targets)
+        self.matcher = as_matcher(excludes)
+        self.path = os.path.join(hist_dir, ".git", MANIFEST_NAME)
+        self._entries: Optional[Dict[str, Entry]] = None
+        self.last_changed: List[str] = []
+
+    # -------- 持久化 --------
+    def load(self) -> Optional[Dict[str, Entry]]:
+        if self._entries is not None:
+            return self._entries
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                obj = json.load(f)
+            if obj.get("targets") != self.targets or obj.get("excludes") != self.matcher.patterns:
+                return None
+            self._entries = {k: tuple(v) for k, v in obj.get("files", {}).items()}  # type: ignore[misc]
+        except (OSError, ValueError, AttributeError):
+            return None
+        return self._entries
+
+    def save(self, entries: Dict[str, Entry]) -> None:
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"targets": self.targets, "excludes": self.matcher.patterns, "files": entries}, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+            self._entries = entries
+        except OSError:
+            self._entries = None
+
+    def invalidate(self) -> None:
+        """丢弃清单，使下一轮退回完整的 `git add -A`。"""
+        self._entries = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    # -------- 扫描与比较 --------
+    def scan(self) -> Dict[str, Entry]:
+        entries: Dict[str, Entry] = {}
+        for rel in self.targets:
+            root = to_under_hist(self.hist_dir, rel.rstrip("/"))
+            if os.path.isdir(root):
+                self._scan_dir(root, entries)
+            else:
+                self._stat_file(root, entries)
+        for name in EXTRA_FILES:
+            self._stat_file(os.path.join(self.hist_dir, name), entries)
+        return entries
+
+    def _stat_file(self, path: str, entries: Dict[str, Entry]) -> None:
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return
+        rel = os.path.relpath(path, self.hist_dir)
+        if not self.matcher.match(rel):
+            entries[rel] = (st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def _scan_dir(self, root: str, entries: Dict[str, Entry]) -> None:
+        stack = [root]
+        while stack:
+            d = stack.pop()
+            try:
+                it = os.scandir(d)
+            except OSError:
+                continue
+            with it:
+                for entry in it:
+                    if entry.name == ".git":
+                        continue
+                    rel = os.path.relpath(entry.path, self.hist_dir)
+                    if self.matcher and self.matcher.match(rel):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                            continue
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    entries[rel] = (st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def count_dirty(self) -> int:
+        """只读地统计当前与清单不一致的文件数（不更新 last_changed）；清单缺失时返回 -1。"""
+        previous = self.load()
+        if previous is None:
+            return -1
+        current = self.scan()
+        n = sum(1 for p, e in current.items() if previous.get(p) != e)
+        return n + sum(1 for p in previous if p not in current)
+
+    def changed_paths(self) -> Tuple[Optional[List[str]], Dict[str, Entry]]:
+        """返回 (变化的相对路径列表, 本次扫描结果)；清单不存在时列表为 None。"""
+        current = self.scan()
+        previous = self.load()
+        if previous is None:
+            self.last_changed = []
+            return None, current
+        changed = [p for p, e in current.items() if previous.get(p) != e]
+        changed.extend(p for p in previous if p not in current)
+        self.last_changed = changed
+        return changed, current
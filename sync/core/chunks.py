@@ -0,0 +1,553 @@
+"""大文件分块去重存储（可选，默认关闭）。
+
+超过 SYNC_CHUNK_THRESHOLD 字节的目标文件在提交时由 git 过滤器（`filter=syncchunk`，
+写在 `.git/info/attributes`，不进入仓库）替换为一个小清单：
+
+    sync-chunks v1
+    size <总字节数>
+    blob <整个文件的 git blob id>
+    <块 blob id> <块字节数>
+    ...
+
+块按内容定义切分（gear 滚动哈希，平均 SYNC_CHUNK_AVG，最小 1/4、最大 4 倍），
+修改文件中间的一段只会改变附近的块。块以 git loose object（zlib 压缩、按内容寻址，天然去重）
+写入独立的裸仓库 `SYNC_CHUNK_STORE`（默认 `<HIST_DIR>/.git/sync-chunks.git`）；
+每轮推送前把新块打成一个只含新块的提交，推送到 SYNC_CHUNK_REMOTE 的
+`refs/heads/sync-chunks/<主机 id>`（每台主机一条线性分支，互不冲突），已推送过的块不会再次传输。
+
+检出时过滤器使用 git 的 `delay` 能力：先登记所有清单，随后一次性找出本地缺少的块，
+按 SYNC_CHUNK_JOBS 分组并行 `git fetch <blob id>` 取回，再逐个文件还原；本地已有的块从不重复下载。
+远端需允许按对象 id 获取（GitHub 支持；自建服务器需设置 `uploadpack.allowReachableSHA1InWant`）。
+
+可调环境变量：
+- SYNC_CHUNK_THRESHOLD：分块阈值（字节，可带 K/M/G 后缀），0 表示关闭（默认）。
+- SYNC_CHUNK_AVG：平均块大小，默认 1M。
+- SYNC_CHUNK_STORE / SYNC_CHUNK_REMOTE：块仓库路径与其远端地址（未设置远端时块只保存在本机）。
+- SYNC_CHUNK_JOBS：还原时并行 fetch 的进程数，默认 4。
+
+分块在纯 Python 中逐字节计算滚动哈希（约每秒数十 MB），只在大文件内容变化时执行。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import BinaryIO, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sync.core import git_ops, gitquery, isolation
+from sync.utils.logging import err, log
+
+FILTER_NAME = "syncchunk"
+MAGIC = b"sync-chunks v1\n"
+BRANCH = "refs/heads/chunks"
+_ATTR_HEADER = "# managed by sync (chunk store); regenerated from targets\n"
+_M64 = (1 << 64) - 1
+_GEAR = tuple(int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], "big") for i in range(256))
+
+
+def parse_size(text: str) -> int:
+    text = (text or "0").strip().upper().rstrip("B")
+    mult = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}.get(text[-1:], 1)
+    return int(float(text[:-1] if mult > 1 else text) * mult)
+
+
+def cut_points(data: bytes, avg: int) -> List[int]:
+    """内容定义的切分点（各块的结束偏移）；同样的内容总是得到同样的切分。"""
+    avg = max(avg, 64)
+    lo, hi = avg // 4, avg * 4
+    bits = avg.bit_length() - 1
+    mask = ((1 << bits) - 1) << (64 - bits)
+    gear = _GEAR
+    view = memoryview(data)
+    n = len(data)
+    out: List[int] = []
+    pos = 0
+    while pos < n:
+        end = min(n, pos + hi)
+        cut = end
+        if end - pos > lo:
+            h = 0
+            i = pos + lo
+            for b in view[i:end]:
+                h = ((h << 1) + gear[b]) & _M64
+                i += 1
+                if not h & mask:
+                    cut = i
+                    break
+        out.append(cut)
+        pos = cut
+    return out
+
+
+def blob_id(data: bytes) -> str:
+    h = hashlib.sha1(b"blob %d\0" % len(data))
+    h.update(data)
+    return h.hexdigest()
+
+
+@dataclass
+class Manifest:
+    size: int
+    blob: str
+    chunks: List[Tuple[str, int]] = field(default_factory=list)
+
+    def render(self) -> bytes:
+        lines = [f"size {self.size}", f"blob {self.blob}"] + [f"{oid} {n}" for oid, n in self.chunks]
+        return MAGIC + "".join(f"{x}\n" for x in lines).encode("ascii")
+
+    @staticmethod
+    def parse(data: bytes) -> Optional["Manifest"]:
+        if not data.startswith(MAGIC) or len(data) > 4 * 1024 * 1024:
+            return None
+        try:
+            lines = data[len(MAGIC):].decode("ascii").splitlines()
+            size = int(lines[0].split(" ", 1)[1])
+            blob = lines[1].split(" ", 1)[1]
+            chunks = [(oid, int(n)) for oid, n in (ln.split(" ") for ln in lines[2:] if ln)]
+        except (ValueError, IndexError, UnicodeDecodeError):
+            return None
+        return Manifest(size, blob, chunks)
+
+
+class ChunkError(RuntimeError):
+    pass
+
+
+class ChunkStore:
+    """块仓库：裸 git 仓库，块以 loose object 保存。"""
+
+    def __init__(self, path: str, remote: str = "", avg: int = 1024 * 1024, jobs: int = 4) -> None:
+        self.path = path
+        self.remote = remote
+        self.avg = avg
+        self.jobs = max(1, jobs)
+        self._pending_lock = threading.Lock()
+
+    # -------- 初始化 --------
+    def ensure(self) -> None:
+        if not os.path.isdir(os.path.join(self.path, "objects")):
+            os.makedirs(self.path, exist_ok=True)
+            git_ops.run(["git", "init", "-q", "--bare", self.path])
+        # 取回的块保持为 loose object，还原时可在多个线程里直接解压
+        git_ops.run(["git", "config", "fetch.unpackLimit", "2147483647"], cwd=self.path, check=False)
+        git_ops.run(["git", "config", "gc.auto", "0"], cwd=self.path, check=False)
+        for key, env, default in (("user.name", "GIT_USER_NAME", "sync-bot"), ("user.email", "GIT_USER_EMAIL", "sync-bot@local")):
+            git_ops.run(["git", "config", key, os.environ.get(env, default)], cwd=self.path, check=False)
+        if self.remote:
+            remotes = git_ops.run(["git", "remote"], cwd=self.path, check=False).stdout.split()
+            verb = "set-url" if "origin" in remotes else "add"
+            git_ops.run(["git", "remote", verb, "origin", self.remote], cwd=self.path, check=False)
+
+    def host_id(self) -> str:
+        p = os.path.join(self.path, "sync-host-id")
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                return f.read().strip()
+        except OSError:
+            hid = uuid.uuid4().hex[:12]
+            with open(p, "w", encoding="utf-8") as f:
+                f.write(hid + "\n")
+            return hid
+
+    # -------- 对象读写 --------
+    def _loose(self, oid: str) -> str:
+        return os.path.join(self.path, "objects", oid[:2], oid[2:])
+
+    def has(self, oid: str) -> bool:
+        if os.path.exists(self._loose(oid)):
+            return True
+        try:
+            return gitquery.object_info(self.path, oid) is not None
+        except gitquery.QueryError:
+            return False
+
+    def put(self, data: bytes) -> Tuple[str, bool]:
+        """写入一个块；返回 (blob id, 是否新写入)。"""
+        oid = blob_id(data)
+        if self.has(oid):
+            return oid, False
+        path = self._loose(oid)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        comp = zlib.compressobj(1)
+        with open(tmp, "wb") as f:
+            f.write(comp.compress(b"blob %d\0" % len(data)))
+            f.write(comp.compress(data))
+            f.write(comp.flush())
+        os.replace(tmp, path)
+        return oid, True
+
+    def get(self, oid: str) -> bytes:
+        try:
+            with open(self._loose(oid), "rb") as f:
+                raw = zlib.decompress(f.read())
+            data = raw[raw.index(b"\0") + 1:]
+        except FileNotFoundError:
+            proc = subprocess.run(["git", "cat-file", "blob", oid], cwd=self.path, capture_output=True)
+            if proc.returncode != 0:
+                raise ChunkError(f"块 {oid} 不存在")
+            data = proc.stdout
+        if blob_id(data) != oid:
+            raise ChunkError(f"块 {oid} 校验失败")
+        return data
+
+    # -------- 分块与还原 --------
+    def split(self, data: bytes) -> Manifest:
+        """切分并写入所有块，新块登记到待发布列表。"""
+        chunks: List[Tuple[str, int]] = []
+        new: List[str] = []
+        start = 0
+        for end in cut_points(data, self.avg):
+            oid, created = self.put(data[start:end])
+            chunks.append((oid, end - start))
+            if created:
+                new.append(oid)
+            start = end
+        if new:
+            self._add_pending(new)
+        return Manifest(len(data), blob_id(data), chunks)
+
+    def missing(self, oids: Iterable[str]) -> List[str]:
+        return sorted({oid for oid in oids if not self.has(oid)})
+
+    def fetch(self, oids: Sequence[str]) -> None:
+        """按 blob id 并行取回缺少的块。"""
+        if not oids:
+            return
+        if not self.remote:
+            raise ChunkError(f"缺少 {len(oids)} 个块且未配置 SYNC_CHUNK_REMOTE")
+        groups = [list(oids[i::self.jobs]) for i in range(min(self.jobs, len(oids)))]
+
+        def one(group: List[str]) -> str:
+            proc = git_ops.run(
+                ["git", "fetch", "--no-tags", "--no-write-fetch-head", "--stdin", "origin"],
+                cwd=self.path, check=False, input="".join(f"{oid}\n" for oid in group),
+            )
+            return proc.stderr.strip()[-300:] if proc.returncode != 0 else ""
+
+        with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+            errors = [e for e in pool.map(one, groups) if e]
+        still = self.missing(oids)
+        if still:
+            raise ChunkError(f"仍缺少 {len(still)} 个块：{errors[0] if errors else ''}")
+
+    def assemble(self, manifest: Manifest) -> bytes:
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            data = b"".join(pool.map(self.get, [oid for oid, _ in manifest.chunks]))
+        if len(data) != manifest.size or blob_id(data) != manifest.blob:
+            raise ChunkError("还原后的内容与清单不一致")
+        return data
+
+    # -------- 发布到远端 --------
+    def _pending_path(self) -> str:
+        return os.path.join(self.path, "sync-pending-chunks")
+
+    def _add_pending(self, oids: Iterable[str]) -> None:
+        with self._pending_lock, open(self._pending_path(), "a", encoding="ascii") as f:
+            f.write("".join(f"{oid}\n" for oid in oids))
+
+    @staticmethod
+    def _read_ids(path: str) -> List[str]:
+        try:
+            with open(path, "r", encoding="ascii") as f:
+                return [ln.strip() for ln in f if ln.strip()]
+        except OSError:
+            return []
+
+    def pending(self) -> List[str]:
+        base = self._pending_path()
+        return sorted(set(self._read_ids(base)) | set(self._read_ids(base + ".publishing")))
+
+    def _claim_pending(self) -> List[str]:
+        """把待发布列表移入 `.publishing`（过滤进程可能同时追加新块）；失败的发布留到下次合并。"""
+        base = self._pending_path()
+        inflight, claim = base + ".publishing", f"{base}.{os.getpid()}.claim"
+        with self._pending_lock:
+            try:
+                os.replace(base, claim)
+            except FileNotFoundError:
+                return sorted(set(self._read_ids(inflight)))
+            oids = sorted(set(self._read_ids(inflight)) | set(self._read_ids(claim)))
+            with open(inflight + ".tmp", "w", encoding="ascii") as f:
+                f.write("".join(f"{oid}\n" for oid in oids))
+            os.replace(inflight + ".tmp", inflight)
+            os.unlink(claim)
+        return oids
+
+    def publish(self, timeout: Optional[float] = None) -> int:
+        """把新块提交到块仓库并推送；返回发布的块数。失败时抛出 GitError，新块保留待下次发布。"""
+        if not self.remote:
+            return 0
+        oids = [oid for oid in self._claim_pending() if self.has(oid)]
+        if not oids:
+            return 0
+        tree = git_ops.run(
+            ["git", "mktree"], cwd=self.path, input="".join(f"100644 blob {oid}\t{oid}\n" for oid in oids)
+        ).stdout.strip()
+        cmd = ["git", "commit-tree", tree, "-m", f"chunks: {len(oids)}"]
+        parent = git_ops.rev_parse(self.path, BRANCH)
+        if parent:
+            cmd[3:3] = ["-p", parent]
+        commit = git_ops.run(cmd, cwd=self.path).stdout.strip()
+        git_ops.run(["git", "update-ref", BRANCH, commit], cwd=self.path)
+        proc = git_ops.run(
+            ["git", "push", "origin", f"{BRANCH}:refs/heads/sync-chunks/{self.host_id()}"],
+            cwd=self.path, check=False, timeout=timeout,
+        )
+        if proc.returncode != 0:
+            raise git_ops.GitError(f"块仓库推送失败：{proc.stderr.strip()[-300:]}")
+        try:
+            os.unlink(self._pending_path() + ".publishing")
+        except FileNotFoundError:
+            pass
+        log(f"已发布 {len(oids)} 个新块到块仓库")
+        return len(oids)
+
+    def snapshot(self) -> Dict[str, object]:
+        return {"store": self.path, "remote": bool(self.remote), "pending": len(self.pending())}
+
+
+# -------- 安装到历史仓库 --------
+def _attr_pattern(rel: str) -> str:
+    pat = "/" + rel.strip("/") + ("/**" if rel.endswith("/") else "")
+    if any(c in pat for c in ' "\t'):
+        pat = '"' + pat.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return pat
+
+
+def install(hist_dir: str, targets: Sequence[str], store: ChunkStore, threshold: int) -> None:
+    """配置过滤器（`filter.syncchunk.process`）并按目标重写 `.git/info/attributes`。"""
+    store.ensure()
+    pkg_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    cmd = " ".join([
+        f"PYTHONPATH={shlex.quote(pkg_root)}", shlex.quote(sys.executable), "-m", "sync.core.chunks", "process",
+        "--store", shlex.quote(store.path), "--threshold", str(threshold),
+        "--avg", str(store.avg), "--jobs", str(store.jobs),
+    ])
+    git_ops.run(["git", "config", f"filter.{FILTER_NAME}.process", cmd], cwd=hist_dir)
+    git_ops.run(["git", "config", f"filter.{FILTER_NAME}.required", "true"], cwd=hist_dir)
+    attrs = os.path.join(hist_dir, ".git", "info", "attributes")
+    content = _ATTR_HEADER + "".join(f"{_attr_pattern(t)} filter={FILTER_NAME}\n" for t in targets)
+    try:
+        with open(attrs, "r", encoding="utf-8") as f:
+            if f.read() == content:
+                return
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(attrs), exist_ok=True)
+    with open(attrs + ".tmp", "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(attrs + ".tmp", attrs)
+    log(f"分块存储已启用：阈值 {threshold} 字节，块仓库 {store.path}")
+
+
+def from_env(hist_dir: str) -> Tuple[Optional[ChunkStore], int]:
+    """按环境变量创建块仓库；未启用且从未安装过时返回 (None, 0)。
+
+    关闭后若仓库里已有清单，仍以阈值 0 安装过滤器：不再分块，但检出时照常还原。
+    """
+    threshold = parse_size(os.environ.get("SYNC_CHUNK_THRESHOLD", "0"))
+    path = os.environ.get("SYNC_CHUNK_STORE") or os.path.join(hist_dir, ".git", "sync-chunks.git")
+    if threshold <= 0 and not os.path.isdir(path):
+        return None, 0
+    store = ChunkStore(
+        path,
+        remote=os.environ.get("SYNC_CHUNK_REMOTE", ""),
+        avg=parse_size(os.environ.get("SYNC_CHUNK_AVG", "1M")),
+        jobs=isolation.current().cap(int(os.environ.get("SYNC_CHUNK_JOBS", "4"))),
+    )
+    return store, max(threshold, 0)
+
+
+# -------- git 长驻过滤进程（pkt-line 协议，见 gitattributes(5) "Long Running Filter Process"） --------
+_MAX_PKT = 65516
+
+
+class _PktIO:
+    def __init__(self, rd: BinaryIO, wr: BinaryIO) -> None:
+        self.rd = rd
+        self.wr = wr
+
+    def read_pkt(self) -> Optional[bytes]:
+        """返回一个包的内容；flush 包返回 None。"""
+        head = self.rd.read(4)
+        if len(head) < 4:
+            raise EOFError
+        n = int(head, 16)
+        if n == 0:
+            return None
+        data = self.rd.read(n - 4)
+        if len(data) < n - 4:
+            raise EOFError
+        return data
+
+    def read_text_list(self) -> List[str]:
+        out = []
+        while True:
+            pkt = self.read_pkt()
+            if pkt is None:
+                return out
+            out.append(pkt.decode("utf-8").rstrip("\n"))
+
+    def read_content(self) -> bytes:
+        parts = []
+        while True:
+            pkt = self.read_pkt()
+            if pkt is None:
+                return b"".join(parts)
+            parts.append(pkt)
+
+    def write_text(self, *lines: str) -> None:
+        for line in lines:
+            data = (line + "\n").encode("utf-8")
+            self.wr.write(b"%04x" % (len(data) + 4) + data)
+
+    def flush_pkt(self) -> None:
+        self.wr.write(b"0000")
+
+    def write_content(self, data: bytes) -> None:
+        view = memoryview(data)
+        for i in range(0, len(data), _MAX_PKT):
+            part = view[i:i + _MAX_PKT]
+            self.wr.write(b"%04x" % (len(part) + 4))
+            self.wr.write(part)
+        self.flush_pkt()
+
+    def done(self) -> None:
+        self.wr.flush()
+
+
+class FilterProcess:
+    def __init__(self, store: ChunkStore, threshold: int, io: _PktIO) -> None:
+        self.store = store
+        self.threshold = threshold
+        self.io = io
+        self._delayed: Dict[str, Manifest] = {}
+        self._ready: Dict[str, Manifest] = {}
+
+    def handshake(self) -> None:
+        io = self.io
+        hello = io.read_text_list()
+        if "git-filter-client" not in hello or "version=2" not in hello:
+            raise ChunkError(f"意外的握手：{hello}")
+        io.write_text("git-filter-server", "version=2")
+        io.flush_pkt()
+        io.done()
+        caps = io.read_text_list()
+        io.write_text(*[c for c in ("capability=clean", "capability=smudge", "capability=delay") if c in caps])
+        io.flush_pkt()
+        io.done()
+
+    def _respond(self, data: bytes) -> None:
+        self.io.write_text("status=success")
+        self.io.flush_pkt()
+        self.io.write_content(data)
+        self.io.flush_pkt()  # 空列表：保持 status=success
+        self.io.done()
+
+    def _error(self) -> None:
+        self.io.write_text("status=error")
+        self.io.flush_pkt()
+        self.io.done()
+
+    def clean(self, data: bytes) -> bytes:
+        if self.threshold <= 0 or len(data) < self.threshold or data.startswith(MAGIC):
+            return data
+        return self.store.split(data).render()
+
+    def _rehydrate_delayed(self) -> None:
+        """一次性并行取回所有已登记清单缺少的块。"""
+        manifests = list(self._delayed.values())
+        need = self.store.missing(oid for m in manifests for oid, _ in m.chunks)
+        self.store.fetch(need)
+        self._ready.update(self._delayed)
+        self._delayed.clear()
+
+    def serve(self) -> None:
+        self.handshake()
+        io = self.io
+        while True:
+            try:
+                meta = io.read_text_list()
+            except EOFError:
+                return
+            keys = dict(line.split("=", 1) for line in meta if "=" in line)
+            command = keys.get("command")
+            if command == "list_available_blobs":
+                try:
+                    self._rehydrate_delayed()
+                    io.write_text(*[f"pathname={p}" for p in self._ready])
+                    io.flush_pkt()
+                    io.write_text("status=success")
+                except (ChunkError, git_ops.GitError) as e:
+                    print(f"[sync-chunks] 还原失败：{e}", file=sys.stderr)
+                    io.flush_pkt()
+                    io.write_text("status=error")
+                io.flush_pkt()
+                io.done()
+                continue
+            data = io.read_content()
+            path = keys.get("pathname", "")
+            try:
+                if command == "clean":
+                    self._respond(self.clean(data))
+                elif command == "smudge":
+                    if path in self._ready and not data:
+                        self._respond(self.store.assemble(self._ready.pop(path)))
+                        continue
+                    manifest = Manifest.parse(data)
+                    if manifest is None:
+                        self._respond(data)
+                    elif keys.get("can-delay") == "1" and self.store.missing(o for o, _ in manifest.chunks):
+                        self._delayed[path] = manifest
+                        io.write_text("status=delayed")
+                        io.flush_pkt()
+                        io.done()
+                    else:
+                        self.store.fetch(self.store.missing(o for o, _ in manifest.chunks))
+                        self._respond(self.store.assemble(manifest))
+                else:
+                    self._error()
+            except (ChunkError, git_ops.GitError, OSError) as e:
+                print(f"[sync-chunks] {command} {path} 失败：{e}", file=sys.stderr)
+                self._error()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    import argparse
+
+    p = argparse.ArgumentParser(prog="python -m sync.core.chunks")
+    p.add_argument("mode", choices=["process"])
+    p.add_argument("--store", required=True)
+    p.add_argument("--threshold", type=int, default=0)
+    p.add_argument("--avg", type=int, default=1024 * 1024)
+    p.add_argument("--jobs", type=int, default=4)
+    args = p.parse_args(argv)
+    # git 调用过滤器时可能带着历史仓库的 GIT_DIR 等变量；块仓库的 git 命令不能继承它们
+    for key in ("GIT_DIR", "GIT_WORK_TREE", "GIT_INDEX_FILE", "GIT_PREFIX", "GIT_OBJECT_DIRECTORY"):
+        os.environ.pop(key, None)
+    # 协议独占 stdout：保留原始描述符后把 fd 1 指向 stderr，任何日志输出都不会混入协议流
+    proto_out = os.fdopen(os.dup(1), "wb")
+    os.dup2(2, 1)
+    remote = git_ops.run(["git", "remote", "get-url", "origin"], cwd=args.store, check=False).stdout.strip()
+    store = ChunkStore(args.store, remote=remote, avg=args.avg, jobs=args.jobs)
+    try:
+        FilterProcess(store, args.threshold, _PktIO(sys.stdin.buffer, proto_out)).serve()
+    except (EOFError, BrokenPipeError):
+        pass
+    except Exception as e:
+        err(f"分块过滤进程异常退出：{e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
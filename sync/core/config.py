@@ -1,26 +1,55 @@
 """配置与路径映射（移植）
 
 读取环境变量：GITHUB_PAT/GITHUB_REPO/HIST_DIR/GIT_BRANCH/SYNC_TARGETS/EXCLUDE_PATHS/BASE
-提供路径映射工具。
+（默认只同步星露谷存档目录 Saves），叠加 `HIST_DIR/sync-config.json` 中的覆盖项；
+解析结果按文件 mtime/size 缓存，变化时通知订阅者实现热加载。提供路径映射工具。
+
+分片：`sync-config.json` 的 `shards`（或环境变量 SYNC_SHARDS，JSON）把部分目标分给独立的
+历史仓库/分支，例如：
+
+    {"shards": [{"name": "mods", "targets": ["home/steam/.config/StardewValley/Mods/"]}]}
+
+每个分片可选 `hist_dir`（默认 `<HIST_DIR>-<name>`）、`branch`（默认 `<GIT_BRANCH>-<name>`）、
+`repo`（默认同 GITHUB_REPO）与 `debounce`；未被分片认领的目标留在默认分片（HIST_DIR 本身）。
+
+冲突解决：`conflicts`（或环境变量 SYNC_CONFLICTS，JSON）按路径指定变基/合并冲突的处理策略，
+按顺序匹配第一条（fnmatch 通配，以 `/` 结尾表示目录前缀），未匹配的路径使用 SYNC_CONFLICT_DEFAULT：
+
+    {"conflicts": [{"path": "home/steam/.config/StardewValley/Saves/*/SaveGameInfo*", "strategy": "newest-mtime"},
+                   {"path": "home/steam/.config/StardewValley/Mods/", "strategy": "keep-both"}]}
+
+可选策略见 sync.core.conflicts：local-wins / remote-wins / newest-mtime / keep-both。
 """
 
+import json
 import os
-from dataclasses import dataclass
-from typing import List, Dict, Any
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sync.core.blacklist import ExcludeMatcher
+from sync.utils.logging import err
 
 
-DEFAULT_BASE = os.environ.get("BASE", "/")
-DEFAULT_HIST_DIR = os.environ.get("HIST_DIR", "/home/steam/.sdv-backup")
-DEFAULT_BRANCH = os.environ.get("GIT_BRANCH", "main")
+DEFAULT_SHARD = "default"
+CONFLICT_STRATEGIES = ("local-wins", "remote-wins", "newest-mtime", "keep-both")
 
-# 默认只同步星露谷存档目录（Saves）
-DEFAULT_TARGETS = (
-    os.environ.get("SYNC_TARGETS", "home/steam/.config/StardewValley/Saves/").strip().split()
-)
 
-DEFAULT_EXCLUDES = (
-    os.environ.get("EXCLUDE_PATHS", "").strip().split()
-)
+@dataclass
+class ShardSpec:
+    name: str
+    targets: List[str]
+    hist_dir: str
+    branch: str
+    github_repo: str
+    debounce: Optional[float] = None
+
+
+@dataclass
+class ConflictRule:
+    path: str
+    strategy: str
 
 
 @dataclass
@@ -33,11 +62,60 @@ class Settings:
     targets: List[str]
     excludes: List[str]
     ready_file: str
+    shards: List[ShardSpec] = field(default_factory=list)
+    conflicts: List[ConflictRule] = field(default_factory=list)
+    matcher: ExcludeMatcher = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        # 每次加载配置只编译一次排除规则，供链接、空目录跟踪、变更检测与 git info/exclude 共用
+        self.matcher = ExcludeMatcher(self.excludes)
+
+    def exclude_extras(self) -> Tuple[str, ...]:
+        """写入 `.git/info/exclude` 的额外条目：就绪文件位于仓库内时一并排除，避免被提交。"""
+        rel = os.path.relpath(self.ready_file, self.hist_dir)
+        return () if rel.startswith("..") else ("/" + rel, "/" + rel + ".tmp")
+
+    def split_shards(self) -> Dict[str, "Settings"]:
+        """按分片拆成多份独立配置（分片名 -> Settings）；未配置分片时只有默认分片。"""
+        claimed = {t.rstrip("/") for spec in self.shards for t in spec.targets}
+        out = {
+            DEFAULT_SHARD: Settings(
+                base=self.base, hist_dir=self.hist_dir, branch=self.branch, github_pat=self.github_pat,
+                github_repo=self.github_repo, targets=[t for t in self.targets if t.rstrip("/") not in claimed],
+                excludes=list(self.excludes), ready_file=self.ready_file, conflicts=list(self.conflicts),
+            )
+        }
+        for spec in self.shards:
+            out[spec.name] = Settings(
+                base=self.base, hist_dir=spec.hist_dir, branch=spec.branch, github_pat=self.github_pat,
+                github_repo=spec.github_repo, targets=list(spec.targets), excludes=list(self.excludes),
+                ready_file=os.path.join(spec.hist_dir, ".sync.ready"), conflicts=list(self.conflicts),
+            )
+        return out
+
+
+def _config_path(hist_dir: str) -> str:
+    return os.path.join(hist_dir, "sync-config.json")
+
+
+def _env_defaults() -> Tuple[str, ...]:
+    """每次重新解析时读取当前环境变量，而不是依赖模块导入时的快照。"""
+    return (
+        os.environ.get("BASE", "/"),
+        os.environ.get("HIST_DIR", "/home/steam/.sdv-backup"),
+        os.environ.get("GIT_BRANCH", "main"),
+        os.environ.get("GITHUB_PAT", ""),
+        os.environ.get("GITHUB_REPO", ""),
+        os.environ.get("SYNC_TARGETS", "home/steam/.config/StardewValley/Saves/"),
+        os.environ.get("EXCLUDE_PATHS", ""),
+        os.environ.get("SYNC_READY_FILE", ""),
+        os.environ.get("SYNC_SHARDS", ""),
+        os.environ.get("SYNC_CONFLICTS", ""),
+    )
 
 
 def _load_file_overrides(hist_dir: str) -> Dict[str, Any]:
-    import json
-    cfg_path = os.path.join(hist_dir, "sync-config.json")
+    cfg_path = _config_path(hist_dir)
     try:
         with open(cfg_path, "r", encoding="utf-8") as f:
             obj = json.load(f)
@@ -50,22 +128,86 @@ def _load_file_overrides(hist_dir: str) -> Dict[str, Any]:
     return {}
 
 
-def save_file_overrides(hist_dir: str, data: Dict[str, Any]) -> None:
-    import json
-    os.makedirs(hist_dir, exist_ok=True)
-    cfg_path = os.path.join(hist_dir, "sync-config.json")
-    with open(cfg_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def _parse_shards(raw: Any, hist_dir: str, branch: str, github_repo: str) -> List[ShardSpec]:
+    """校验分片定义；任何一处无效都放弃分片（退回单仓库），避免目标被同步到错误的位置。"""
+    if not raw:
+        return []
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError as e:
+            err(f"SYNC_SHARDS 不是合法 JSON，忽略分片：{e}")
+            return []
+    if not isinstance(raw, list):
+        err("shards 必须是列表，忽略分片")
+        return []
+    specs: List[ShardSpec] = []
+    seen_names = {DEFAULT_SHARD}
+    seen_locations = {os.path.abspath(hist_dir)}
+    seen_targets: set = set()
+    for item in raw:
+        name = str(item.get("name", "")).strip() if isinstance(item, dict) else ""
+        targets = item.get("targets") if isinstance(item, dict) else None
+        if not re.fullmatch(r"[A-Za-z0-9_.-]+", name) or name in seen_names:
+            err(f"分片名无效或重复：{name!r}，忽略分片")
+            return []
+        if not isinstance(targets, list) or not targets:
+            err(f"分片 {name} 没有 targets，忽略分片")
+            return []
+        targets = [str(x).lstrip("/") for x in targets if str(x).strip()]
+        dup = seen_targets.intersection(t.rstrip("/") for t in targets)
+        if dup:
+            err(f"目标被多个分片认领：{sorted(dup)}，忽略分片")
+            return []
+        shard_hist = os.path.abspath(str(item.get("hist_dir") or f"{hist_dir}-{name}"))
+        if shard_hist in seen_locations:
+            err(f"分片 {name} 的 hist_dir 与其他分片重复：{shard_hist}，忽略分片")
+            return []
+        debounce = item.get("debounce")
+        specs.append(ShardSpec(
+            name=name,
+            targets=targets,
+            hist_dir=shard_hist,
+            branch=str(item.get("branch") or f"{branch}-{name}"),
+            github_repo=str(item.get("repo") or github_repo),
+            debounce=float(debounce) if isinstance(debounce, (int, float)) else None,
+        ))
+        seen_names.add(name)
+        seen_locations.add(shard_hist)
+        seen_targets.update(t.rstrip("/") for t in targets)
+    return specs
 
 
-def load_settings() -> Settings:
-    base = DEFAULT_BASE.rstrip("/") or "/"
-    hist_dir = os.path.abspath(DEFAULT_HIST_DIR)
-    branch = DEFAULT_BRANCH
-    github_pat = os.environ.get("GITHUB_PAT", "")
-    github_repo = os.environ.get("GITHUB_REPO", "")
-    targets = list(DEFAULT_TARGETS)
-    excludes = list(DEFAULT_EXCLUDES)
+def _parse_conflicts(raw: Any) -> List[ConflictRule]:
+    """校验冲突规则；无效的单条规则跳过并记录，其余规则仍然生效。"""
+    if not raw:
+        return []
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError as e:
+            err(f"SYNC_CONFLICTS 不是合法 JSON，忽略冲突规则：{e}")
+            return []
+    if not isinstance(raw, list):
+        err("conflicts 必须是列表，忽略冲突规则")
+        return []
+    rules: List[ConflictRule] = []
+    for item in raw:
+        path = str(item.get("path", "")).strip().lstrip("/") if isinstance(item, dict) else ""
+        strategy = str(item.get("strategy", "")).strip() if isinstance(item, dict) else ""
+        if not path or strategy not in CONFLICT_STRATEGIES:
+            err(f"冲突规则无效（需要 path 与 {'/'.join(CONFLICT_STRATEGIES)} 之一）：{item!r}")
+            continue
+        rules.append(ConflictRule(path=path, strategy=strategy))
+    return rules
+
+
+def _build_settings(env: Tuple[str, ...]) -> Settings:
+    base_env, hist_env, branch, github_pat, github_repo, targets_env, excludes_env, ready_env, shards_env, conflicts_env = env
+    base = base_env.rstrip("/") or "/"
+    hist_dir = os.path.abspath(hist_env)
+    targets = targets_env.strip().split()
+    excludes = excludes_env.strip().split()
 
     overrides = _load_file_overrides(hist_dir)
     if isinstance(overrides.get("targets"), list) and overrides["targets"]:
@@ -75,7 +217,9 @@ def load_settings() -> Settings:
         if ex:
             excludes = ex
 
-    ready_file = os.environ.get("SYNC_READY_FILE", os.path.join(hist_dir, ".sync.ready"))
+    ready_file = ready_env or os.path.join(hist_dir, ".sync.ready")
+    shards = _parse_shards(overrides.get("shards") or shards_env, hist_dir, branch, github_repo)
+    conflicts = _parse_conflicts(overrides.get("conflicts") or conflicts_env)
 
     return Settings(
         base=base,
@@ -86,9 +230,106 @@ def load_settings() -> Settings:
         targets=targets,
         excludes=excludes,
         ready_file=ready_file,
+        shards=shards,
+        conflicts=conflicts,
     )
 
 
+class SettingsProvider:
+    """带缓存的配置来源。
+
+    读路径只对 `sync-config.json` 做一次 stat：(mtime_ns, size) 与环境变量均未变化时
+    直接返回缓存的 `Settings`；否则重新解析，并在内容变化时通知订阅者
+    （回调签名 `fn(new, old)`，在触发重新解析的线程中同步调用，应保持轻量）。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._settings: Optional[Settings] = None
+        self._sig: Optional[tuple] = None
+        self._subscribers: List[Callable[[Settings, Settings], None]] = []
+
+    @staticmethod
+    def _signature(env: Tuple[str, ...]) -> tuple:
+        try:
+            st = os.stat(_config_path(os.path.abspath(env[1])))
+            file_sig: tuple = (st.st_mtime_ns, st.st_size, st.st_ino)
+        except OSError:
+            file_sig = ()
+        return env + file_sig
+
+    def get(self) -> Settings:
+        env = _env_defaults()
+        sig = self._signature(env)
+        with self._lock:
+            if self._settings is not None and sig == self._sig:
+                return self._settings
+            old = self._settings
+            new = _build_settings(env)
+            self._settings, self._sig = new, sig
+            subscribers = list(self._subscribers)
+        if old is not None and new != old:
+            for fn in subscribers:
+                try:
+                    fn(new, old)
+                except Exception as e:
+                    err(f"配置变更通知失败：{e}")
+        return new
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._sig = None
+
+    def subscribe(self, fn: Callable[[Settings, Settings], None]) -> None:
+        with self._lock:
+            self._subscribers.append(fn)
+
+    def unsubscribe(self, fn: Callable[[Settings, Settings], None]) -> None:
+        with self._lock:
+            if fn in self._subscribers:
+                self._subscribers.remove(fn)
+
+
+_provider = SettingsProvider()
+
+
+def save_file_overrides(hist_dir: str, data: Dict[str, Any]) -> None:
+    """原子写入配置覆盖（临时文件 + rename），随后立即重新加载并通知订阅者。"""
+    os.makedirs(hist_dir, exist_ok=True)
+    cfg_path = _config_path(hist_dir)
+    tmp = f"{cfg_path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, cfg_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    _provider.invalidate()
+    _provider.get()
+
+
+def update_file_overrides(hist_dir: str, **changes: Any) -> None:
+    """只修改给定的键，保留文件中其余覆盖项（如 shards）。"""
+    data = _load_file_overrides(hist_dir)
+    data.update(changes)
+    save_file_overrides(hist_dir, data)
+
+
+def load_settings() -> Settings:
+    return _provider.get()
+
+
+def subscribe_settings(fn: Callable[[Settings, Settings], None]) -> None:
+    _provider.subscribe(fn)
+
+
+def unsubscribe_settings(fn: Callable[[Settings, Settings], None]) -> None:
+    _provider.unsubscribe(fn)
+
+
 def to_abs_under_base(base: str, rel: str) -> str:
     if rel.startswith("/"):
         return rel
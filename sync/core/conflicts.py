@@ -0,0 +1,245 @@
+"""变基/合并冲突的自动解决。
+
+同步轮次在本地变基到 origin/<branch> 时可能遇到冲突（多台主机改了同一个存档）。
+以往直接中止变基并跳过推送，同一处冲突会让之后的每一轮都失败；`/sync/api/pull` 的
+`pull --rebase` 甚至会把仓库留在变基中途。这里在一次调用内把冲突处理完：
+
+- `repo_state` 识别仓库当前处于 rebase / merge / cherry-pick / revert / detached 哪种状态；
+- `Resolver.finish` 按路径规则（见 sync.core.config 的 `conflicts`）逐个解决未合并路径，
+  继续变基直到完成（或提交合并）；任何一步失败都中止并抛出 ConflictError，仓库回到操作前的状态；
+- `Resolver.recover` 在每轮同步前调用，收拾上一次遗留的中间状态：变基/合并按规则完成，
+  cherry-pick/revert 直接中止，分离 HEAD 重新挂回分支（无法快进时先用 `sync-detached-<时间>` 分支保留提交）。
+
+策略（“本地”指本机尚未推送的提交，“远端”指 origin 上的版本）：
+- local-wins：保留本地版本（默认，可用 SYNC_CONFLICT_DEFAULT 修改）；
+- remote-wins：保留远端版本；
+- newest-mtime：比较两侧最后修改该路径的提交时间，保留较新的一侧（守护进程在写入后数秒内提交，
+  提交时间即近似文件修改时间；相同时本地优先）；
+- keep-both：路径上保留远端版本，本地版本另存为 `<路径>.conflict-<本地提交短 SHA>` 一并提交。
+
+一侧删除、另一侧修改时同样适用：胜出的一侧若是删除则删除该路径。每次解决都记录为 `Resolution`，
+由守护进程展示在状态 API 的 `conflicts` 字段。
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+from sync.core import git_ops, metrics
+from sync.core.config import CONFLICT_STRATEGIES, ConflictRule
+from sync.utils.logging import err, log
+
+# 变基中 stage 2（--ours）是正在构建的上游一侧，stage 3（--theirs）是正在重放的本地提交；合并时相反
+_SIDES = {"rebase": {"local": 3, "remote": 2}, "merge": {"local": 2, "remote": 3}}
+_KEPT = {"local": "本地", "remote": "远端", "both": "两者"}
+
+
+class ConflictError(git_ops.GitError):
+    pass
+
+
+@dataclass
+class Resolution:
+    path: str
+    strategy: str
+    kept: str  # local / remote / both
+    change: str  # modified / deleted-local / deleted-remote
+    state: str  # rebase / merge
+    commit: str  # 本地一侧的提交（短 SHA）
+    ts: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _git_dir(hist_dir: str) -> str:
+    return os.path.join(hist_dir, ".git")
+
+
+def repo_state(hist_dir: str) -> str:
+    """clean / rebase / merge / cherry-pick / revert / detached。"""
+    gd = _git_dir(hist_dir)
+    if os.path.isdir(os.path.join(gd, "rebase-merge")) or os.path.isdir(os.path.join(gd, "rebase-apply")):
+        return "rebase"
+    for name, state in (("MERGE_HEAD", "merge"), ("CHERRY_PICK_HEAD", "cherry-pick"), ("REVERT_HEAD", "revert")):
+        if os.path.exists(os.path.join(gd, name)):
+            return state
+    proc = git_ops.run(["git", "symbolic-ref", "-q", "HEAD"], cwd=hist_dir, check=False)
+    if proc.returncode != 0 and git_ops.rev_parse(hist_dir, "HEAD"):
+        return "detached"
+    return "clean"
+
+
+def unmerged(hist_dir: str) -> Dict[str, Set[int]]:
+    """未合并路径 -> 存在的 stage 集合（1 共同祖先、2 ours、3 theirs）。"""
+    out = git_ops.run(["git", "ls-files", "-u", "-z"], cwd=hist_dir).stdout
+    paths: Dict[str, Set[int]] = {}
+    for rec in out.split("\0"):
+        meta, sep, path = rec.partition("\t")
+        if sep:
+            paths.setdefault(path, set()).add(int(meta.split()[2]))
+    return paths
+
+
+def strategy_for(path: str, rules: Sequence[ConflictRule], default: str) -> str:
+    for rule in rules:
+        pat = rule.path
+        if pat.endswith("/") and (path + "/").startswith(pat):
+            return rule.strategy
+        if fnmatch.fnmatchcase(path, pat):
+            return rule.strategy
+    return default
+
+
+class Resolver:
+    """在单个历史仓库上按规则解决冲突；调用方需持有仓库锁。"""
+
+    def __init__(
+        self, hist_dir: str, branch: str, rules: Sequence[ConflictRule] = (), default: Optional[str] = None,
+        max_steps: int = 200,
+    ) -> None:
+        self.hist_dir = hist_dir
+        self.branch = branch
+        self.rules = list(rules)
+        default = default or os.environ.get("SYNC_CONFLICT_DEFAULT", "local-wins")
+        if default not in CONFLICT_STRATEGIES:
+            err(f"SYNC_CONFLICT_DEFAULT 无效：{default}，使用 local-wins")
+            default = "local-wins"
+        self.default = default
+        self.max_steps = max_steps
+
+    def _git(self, *args: str, check: bool = True):
+        return git_ops.run(["git", *args], cwd=self.hist_dir, check=check)
+
+    def _local_commit(self, state: str) -> str:
+        return git_ops.rev_parse(self.hist_dir, "REBASE_HEAD" if state == "rebase" else "HEAD")
+
+    def _last_change_ts(self, rev: str, path: str) -> int:
+        out = self._git("log", "-1", "--format=%ct", rev, "--", path, check=False).stdout.strip()
+        return int(out) if out.isdigit() else 0
+
+    def _take(self, path: str, stage: int, stages: Set[int]) -> None:
+        if stage in stages:
+            self._git("checkout", "--ours" if stage == 2 else "--theirs", "--", path)
+            self._git("add", "--", path)
+        else:
+            self._git("rm", "-q", "-f", "--ignore-unmatch", "--", path)
+
+    def _save_copy(self, path: str, stage: int, suffix: str) -> str:
+        """把某个 stage 的内容（经过检出过滤器）另存为 `<path><suffix>` 并暂存。"""
+        out = self._git("checkout-index", f"--stage={stage}", "--temp", "--", path).stdout
+        tmp = out.split("\t", 1)[0].strip()
+        dest = path + suffix
+        os.replace(os.path.join(self.hist_dir, tmp), os.path.join(self.hist_dir, dest))
+        self._git("add", "-f", "--", dest)
+        return dest
+
+    def resolve_index(self, state: str) -> List[Resolution]:
+        """解决当前所有未合并路径并暂存结果。"""
+        sides = _SIDES[state]
+        local, remote = sides["local"], sides["remote"]
+        commit = self._local_commit(state)
+        out: List[Resolution] = []
+        for path, stages in sorted(unmerged(self.hist_dir).items()):
+            strategy = strategy_for(path, self.rules, self.default)
+            if local not in stages:
+                change = "deleted-local"
+            elif remote not in stages:
+                change = "deleted-remote"
+            else:
+                change = "modified"
+            kept = "local"
+            if strategy == "remote-wins":
+                kept = "remote"
+            elif strategy == "newest-mtime":
+                remote_rev = "HEAD" if state == "rebase" else "MERGE_HEAD"
+                if self._last_change_ts(remote_rev, path) > self._last_change_ts(commit, path):
+                    kept = "remote"
+            elif strategy == "keep-both":
+                kept = "both"
+                if local in stages and remote in stages:
+                    self._save_copy(path, local, f".conflict-{commit[:8]}")
+                elif local in stages:
+                    kept = "local"  # 远端已删除：保留本地即“两者都保留”
+            self._take(path, local if kept == "local" else remote, stages)
+            res = Resolution(path, strategy, kept, change, state, commit[:12], time.time())
+            metrics.CONFLICTS_RESOLVED.inc(strategy=strategy)
+            log(f"冲突已解决：{path}（{strategy}，保留{_KEPT[kept]}）")
+            out.append(res)
+        return out
+
+    def _continue(self, state: str) -> bool:
+        """继续变基/提交合并；返回操作是否已结束（仍有新冲突时返回 False）。"""
+        env = {**os.environ, "GIT_EDITOR": "true"}
+        if state == "merge":
+            proc = git_ops.run(["git", "commit", "--no-edit", "-q"], cwd=self.hist_dir, check=False, env=env)
+            if proc.returncode != 0:
+                raise ConflictError(f"提交合并结果失败：{proc.stderr.strip()[-300:]}")
+            return True
+        proc = git_ops.run(["git", "rebase", "--continue"], cwd=self.hist_dir, check=False, env=env)
+        if proc.returncode != 0 and not unmerged(self.hist_dir) and self._git(
+            "diff", "--cached", "--quiet", check=False
+        ).returncode == 0:
+            # 解决结果与上游相同，该提交变为空：跳过它
+            proc = git_ops.run(["git", "rebase", "--skip"], cwd=self.hist_dir, check=False, env=env)
+        if proc.returncode != 0 and not unmerged(self.hist_dir):
+            raise ConflictError(f"继续变基失败：{proc.stderr.strip()[-300:]}")
+        return repo_state(self.hist_dir) != "rebase"
+
+    def abort(self, state: str) -> None:
+        cmd = {"rebase": "rebase", "merge": "merge", "cherry-pick": "cherry-pick", "revert": "revert"}.get(state)
+        if cmd:
+            self._git(cmd, "--abort", check=False)
+
+    def finish(self, state: str) -> List[Resolution]:
+        """在一次调用内完成进行中的变基/合并；无法完成时中止并抛出 ConflictError。"""
+        done: List[Resolution] = []
+        try:
+            for _ in range(self.max_steps):
+                done += self.resolve_index(state)
+                if self._continue(state):
+                    return done
+            raise ConflictError(f"冲突步骤超过 {self.max_steps} 次")
+        except git_ops.GitError as e:
+            self.abort(state)
+            metrics.CONFLICT_ABORTS.inc()
+            if isinstance(e, ConflictError):
+                raise
+            raise ConflictError(f"解决冲突失败，已中止 {state}：{str(e).splitlines()[0]}")
+
+    def _reattach(self) -> List[Resolution]:
+        head = git_ops.rev_parse(self.hist_dir, "HEAD")
+        tip = git_ops.rev_parse(self.hist_dir, f"refs/heads/{self.branch}")
+
+        def is_ancestor(a: str, b: str) -> bool:
+            return self._git("merge-base", "--is-ancestor", a, b, check=False).returncode == 0
+
+        if not tip or is_ancestor(tip, head):
+            self._git("checkout", "-q", "-B", self.branch, head)
+            kept = "local"
+        else:
+            if not is_ancestor(head, tip):
+                keep = time.strftime("sync-detached-%Y%m%d-%H%M%S", time.gmtime())
+                self._git("branch", keep, head)
+                log(f"分离 HEAD 与 {self.branch} 已分叉，原提交保留在分支 {keep}")
+            self._git("checkout", "-q", self.branch)
+            kept = "remote"
+        log(f"分离 HEAD 已重新挂回分支 {self.branch}")
+        return [Resolution("", "reattach", kept, "detached", "detached", head[:12], time.time())]
+
+    def recover(self) -> List[Resolution]:
+        """收拾上一次遗留的中间状态；无法收拾时抛出 ConflictError。"""
+        state = repo_state(self.hist_dir)
+        if state == "clean":
+            return []
+        log(f"检测到仓库处于 {state} 状态，自动处理")
+        if state in _SIDES:
+            return self.finish(state)
+        if state in ("cherry-pick", "revert"):
+            self.abort(state)
+            return [Resolution("", "abort", "local", state, state, "", time.time())]
+        return self._reattach()
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
 import os
+import re
 import subprocess
-from typing import List, Optional
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
 
+from sync.core import gitquery, isolation, metrics
 from sync.utils.logging import log, err, mask_token
 
 
@@ -11,8 +15,73 @@ class GitError(RuntimeError):
     pass
 
 
-def run(cmd: List[str], cwd: Optional[str] = None, check: bool = True) -> subprocess.CompletedProcess:
-    proc = subprocess.run(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+_TRANSFER_DIRECTION = {"push": "sent", "fetch": "received", "pull": "received"}
+_UNITS = {"bytes": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3}
+_PROGRESS_RE = re.compile(r"(?:Writing|Receiving|Unpacking) objects: 100% \(\d+/\d+\), ([\d.]+) (bytes|KiB|MiB|GiB)")
+
+
+def _subcommand(cmd: List[str]) -> str:
+    """提取 git 子命令名（跳过 `-C <dir>` / `-c k=v` 等全局选项）；非 git 命令返回程序名。"""
+    if not cmd:
+        return ""
+    if os.path.basename(cmd[0]) != "git":
+        return os.path.basename(cmd[0])
+    i = 1
+    while i < len(cmd):
+        tok = cmd[i]
+        if tok in ("-C", "-c", "--git-dir", "--work-tree"):
+            i += 2
+            continue
+        if tok.startswith("-"):
+            i += 1
+            continue
+        return tok
+    return ""
+
+
+def _transfer_bytes(stderr: str) -> int:
+    total = 0.0
+    for num, unit in _PROGRESS_RE.findall(stderr or ""):
+        total += float(num) * _UNITS[unit]
+    return int(total)
+
+
+def run(
+    cmd: List[str],
+    cwd: Optional[str] = None,
+    check: bool = True,
+    input: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    timeout: Optional[float] = None,
+) -> subprocess.CompletedProcess:
+    """执行 git 命令并记录指标；`timeout` 秒内未结束时杀掉子进程并抛出 GitError（与 check 无关）。"""
+    sub = _subcommand(cmd)
+    if sub in _TRANSFER_DIRECTION and "--progress" not in cmd:
+        # 非 tty 下 git 默认不输出进度；显式打开以便从 stderr 统计传输字节数
+        i = cmd.index(sub)
+        cmd = cmd[: i + 1] + ["--progress"] + cmd[i + 1:]
+    cmd, throttled = isolation.current().wrap(cmd, sub)
+    t0 = time.perf_counter()
+    try:
+        proc = subprocess.run(
+            cmd, cwd=cwd, input=input, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        metrics.GIT_DURATION.observe(time.perf_counter() - t0, subcommand=sub)
+        metrics.GIT_COMMANDS.inc(subcommand=sub)
+        metrics.GIT_FAILURES.inc(subcommand=sub)
+        raise GitError(f"Command timed out after {timeout:.0f}s: {' '.join(cmd)}")
+    metrics.GIT_DURATION.observe(time.perf_counter() - t0, subcommand=sub)
+    metrics.GIT_COMMANDS.inc(subcommand=sub)
+    if throttled:
+        isolation.current().note_throttled(time.perf_counter() - t0)
+    if proc.returncode != 0:
+        metrics.GIT_FAILURES.inc(subcommand=sub)
+    if sub in _TRANSFER_DIRECTION:
+        nbytes = _transfer_bytes(proc.stderr)
+        if nbytes:
+            metrics.GIT_TRANSFER_BYTES.inc(nbytes, direction=_TRANSFER_DIRECTION[sub])
     if check and proc.returncode != 0:
         raise GitError(f"Command failed: {' '.join(cmd)}\nstdout: {proc.stdout}\nstderr: {proc.stderr}")
     return proc
@@ -45,33 +114,158 @@ def set_remote(hist_dir: str, url: str) -> None:
         run(["git", "remote", "add", "origin", url], cwd=hist_dir)
 
 
+@dataclass
+class RemoteInfo:
+    """一次 `git ls-remote --symref origin` 握手的解析结果。"""
+
+    refs: Dict[str, str] = field(default_factory=dict)  # 引用名 -> SHA
+    default_branch: str = ""  # 远端 HEAD 指向的分支
+
+    @property
+    def empty(self) -> bool:
+        # 只看分支：远端可能只有租约等非分支引用（见 sync.core.lease）
+        return not any(name.startswith("refs/heads/") for name in self.refs)
+
+    def tip(self, branch: str) -> str:
+        return self.refs.get(f"refs/heads/{branch}", "")
+
+    def resolve_branch(self, branch: str) -> str:
+        """配置的分支在远端存在则用它，否则退回远端默认分支。"""
+        if self.tip(branch) or not self.default_branch:
+            return branch
+        return self.default_branch
+
+
+def probe_remote(hist_dir: str) -> RemoteInfo:
+    """单次 ls-remote 同时得到：远端是否为空、默认分支、各分支 SHA。失败时抛出 GitError。"""
+    out = run(["git", "ls-remote", "--symref", "origin"], cwd=hist_dir).stdout
+    info = RemoteInfo()
+    for line in out.splitlines():
+        if line.startswith("ref: "):
+            target, _, name = line[5:].partition("\t")
+            if name == "HEAD" and target.startswith("refs/heads/"):
+                info.default_branch = target[len("refs/heads/"):]
+            continue
+        sha, _, name = line.partition("\t")
+        if name:
+            info.refs[name] = sha
+    return info
+
+
 def remote_is_empty(hist_dir: str) -> bool:
-    heads = run(["git", "ls-remote", "--heads", "origin"], cwd=hist_dir, check=False).stdout.strip()
-    all_refs = run(["git", "ls-remote", "origin"], cwd=hist_dir, check=False).stdout.strip()
-    return len(heads) == 0 and len(all_refs) == 0
+    return probe_remote(hist_dir).empty
+
+
+def remote_tip(hist_dir: str, branch: str) -> Optional[str]:
+    """一次轻量 ls-remote 取远端分支 SHA；失败返回 None，分支不存在返回空串。"""
+    proc = run(["git", "ls-remote", "origin", f"refs/heads/{branch}"], cwd=hist_dir, check=False)
+    if proc.returncode != 0:
+        return None
+    for line in proc.stdout.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[1] == f"refs/heads/{branch}":
+            return parts[0]
+    return ""
+
+
+def rev_parse(hist_dir: str, ref: str) -> str:
+    """解析引用/修订为 SHA（失败返回空串）；经由常驻的 cat-file 查询进程，不可用时退回一次性 rev-parse。"""
+    try:
+        return gitquery.rev_parse(hist_dir, ref)
+    except gitquery.QueryError:
+        proc = run(["git", "rev-parse", "--verify", "-q", ref], cwd=hist_dir, check=False)
+        return proc.stdout.strip() if proc.returncode == 0 else ""
+
+
+def is_shallow(hist_dir: str) -> bool:
+    return os.path.exists(os.path.join(hist_dir, ".git", "shallow"))
+
+
+def ahead_count(hist_dir: str, branch: str) -> int:
+    """本地 HEAD 领先 origin/<branch> 的提交数；远端跟踪分支不存在时返回 -1。"""
+    head = rev_parse(hist_dir, "HEAD")
+    if head and head == rev_parse(hist_dir, f"origin/{branch}"):
+        return 0
+    proc = run(["git", "rev-list", "--count", f"origin/{branch}..HEAD"], cwd=hist_dir, check=False)
+    if proc.returncode != 0:
+        return -1
+    try:
+        return int(proc.stdout.strip() or "0")
+    except ValueError:
+        return -1
+
+
+def _escape_sparse(path: str) -> str:
+    return re.sub(r"([*?\[\]\\!#])", r"\\\1", path)
+
+
+def sparse_patterns(rel_targets: Sequence[str]) -> List[str]:
+    """由同步目标生成非 cone 模式的 sparse-checkout 规则；返回空列表表示需要整个仓库。
+
+    仓库根目录下的文件（README、sync-config.json 等）总是检出。
+    """
+    patterns = ["/*", "!/*/"]
+    for rel in rel_targets:
+        clean = rel.strip("/")
+        if not clean:
+            return []
+        patterns.append("/" + _escape_sparse(clean))
+    return patterns
+
+
+def is_sparse(hist_dir: str) -> bool:
+    proc = run(["git", "config", "--bool", "core.sparseCheckout"], cwd=hist_dir, check=False)
+    return proc.stdout.strip() == "true"
+
+
+def sparse_add(hist_dir: str, rel_targets: Sequence[str]) -> bool:
+    """稀疏检出的仓库新增目标时扩大检出范围（从不收缩，避免删掉仍被软链引用的文件）。"""
+    if not is_sparse(hist_dir):
+        return False
+    patterns = sparse_patterns(rel_targets)
+    if not patterns:
+        run(["git", "sparse-checkout", "disable"], cwd=hist_dir)
+        return True
+    run(["git", "sparse-checkout", "add", "--stdin"], cwd=hist_dir, input="\n".join(patterns[2:]) + "\n")
+    return True
+
+
+def checkout_remote(
+    hist_dir: str,
+    branch: str,
+    info: RemoteInfo,
+    sparse_targets: Optional[Sequence[str]] = None,
+    partial: bool = False,
+) -> str:
+    """依据一次握手的结果拉取并检出远端分支，返回实际检出的分支名。
+
+    - 本地 HEAD 与 origin/<branch> 都已等于远端 SHA 时直接返回（不 fetch、不覆盖工作区）；
+    - 全新仓库（尚无 HEAD）时可启用部分克隆（`--filter=blob:none`）与按目标的稀疏检出，
+      只下载并落地同步目标下的文件。
+    """
+    target = info.resolve_branch(branch)
+    tip = info.tip(target)
+    if tip and rev_parse(hist_dir, f"origin/{target}") == tip and rev_parse(hist_dir, "HEAD") == tip:
+        return target
+    fresh = not rev_parse(hist_dir, "HEAD")
+    if fresh and sparse_targets is not None:
+        patterns = sparse_patterns(sparse_targets)
+        if patterns:
+            run(["git", "sparse-checkout", "set", "--no-cone", "--stdin"], cwd=hist_dir, input="\n".join(patterns) + "\n")
+    cmd = ["git", "fetch", "--depth=1"]
+    if fresh and partial:
+        cmd.append("--filter=blob:none")
+    run(cmd + ["origin", target], cwd=hist_dir)
+    run(["git", "checkout", "-f", "-B", target, f"origin/{target}"], cwd=hist_dir)
+    return target
 
 
 def fetch_and_checkout(hist_dir: str, branch: str) -> None:
-    run(["git", "fetch", "--depth=1", "origin"], cwd=hist_dir)
-    ref_ok = run(["git", "rev-parse", f"origin/{branch}"], cwd=hist_dir, check=False).returncode == 0
-    if ref_ok:
-        run(["git", "checkout", "-B", branch], cwd=hist_dir)
-        run(["git", "reset", "--hard", f"origin/{branch}"], cwd=hist_dir)
-        return
-    head = run(["git", "ls-remote", "--symref", "origin", "HEAD"], cwd=hist_dir, check=False).stdout
-    default_branch = branch
-    for line in head.splitlines():
-        if line.startswith("ref:"):
-            default_branch = line.split()[1].split("/")[-1]
-            break
-    run(["git", "fetch", "--depth=1", "origin", default_branch], cwd=hist_dir)
-    run(["git", "checkout", "-B", default_branch], cwd=hist_dir)
-    run(["git", "reset", "--hard", f"origin/{default_branch}"], cwd=hist_dir)
+    checkout_remote(hist_dir, branch, probe_remote(hist_dir))
 
 
 def initial_commit_if_needed(hist_dir: str) -> None:
-    status = run(["git", "rev-parse", "--verify", "HEAD"], cwd=hist_dir, check=False)
-    if status.returncode != 0:
+    if not rev_parse(hist_dir, "HEAD"):
         readme = os.path.join(hist_dir, "README.md")
         if not os.path.exists(readme):
             with open(readme, "w", encoding="utf-8") as f:
@@ -85,13 +279,36 @@ def push(hist_dir: str, branch: str) -> None:
 
 
 def add_all_and_commit_if_needed(hist_dir: str, message: str) -> bool:
-    run(["git", "add", "-A"], cwd=hist_dir, check=False)
+    """暂存全部变更并在有差异时提交；暂存失败（如 index.lock 被占用）时抛出 GitError。"""
+    run(["git", "add", "-A"], cwd=hist_dir)
+    return _commit_if_staged(hist_dir, message)
+
+
+def add_paths_and_commit_if_needed(hist_dir: str, paths: Sequence[str], message: str) -> bool:
+    """只暂存给定的相对路径（已删除的路径从索引移除），有差异时提交；暂存失败时抛出 GitError。"""
+    present = [p for p in paths if os.path.lexists(os.path.join(hist_dir, p))]
+    present_set = set(present)
+    gone = [p for p in paths if p not in present_set]
+    if present:
+        run(
+            ["git", "--literal-pathspecs", "add", "--pathspec-from-file=-", "--pathspec-file-nul"],
+            cwd=hist_dir, input="\0".join(present),
+        )
+    if gone:
+        run(
+            ["git", "--literal-pathspecs", "rm", "--cached", "-q", "--ignore-unmatch",
+             "--pathspec-from-file=-", "--pathspec-file-nul"],
+            cwd=hist_dir, input="\0".join(gone),
+        )
+    return _commit_if_staged(hist_dir, message)
+
+
+def _commit_if_staged(hist_dir: str, message: str) -> bool:
     proc = run(["git", "diff", "--cached", "--quiet"], cwd=hist_dir, check=False)
     if proc.returncode == 1:
         run(["git", "commit", "-m", message], cwd=hist_dir)
         return True
     elif proc.returncode == 0:
         return False
-    else:
-        return False
+    raise GitError(f"检查暂存区失败：{proc.stderr.strip()[-300:]}")
 
@@ -0,0 +1,214 @@
+"""常驻 git 查询进程与流式状态解析。
+
+- 引用/对象查询（`rev_parse`、对象类型与大小）交给每个仓库一个常驻的
+  `git cat-file --batch-check` 进程：一行请求一行应答，省掉每次查询的 fork+exec。
+  batch-check 按请求逐条解析修订表达式（`HEAD`、`origin/main`、`<sha>^{commit}`、`<rev>:<path>`），
+  引用与新对象的变化对后续请求立即可见，因此同一个进程同时承担 rev-parse 的角色；
+- `status_entries` 以流的方式解析 `git status --porcelain=v2 -z`，不把整个输出读入内存，
+  `is_dirty` 读到第一条记录即结束子进程；
+- 每次查询的耗时记入 `sync_git_query_seconds`（按 op），次数记入 `sync_git_queries_total`。
+  常驻进程的（重新）启动仍计入 `sync_git_commands_total{subcommand="cat-file"}`。
+
+常驻进程异常退出时自动重启一次；仍失败（如目录尚不是 git 仓库）时调用方退回一次性子进程。
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sync.core import metrics
+
+_OBJECT_TYPES = ("commit", "tree", "blob", "tag")
+
+
+class QueryError(RuntimeError):
+    pass
+
+
+class BatchCheck:
+    """单个仓库的 `git cat-file --batch-check` 常驻进程（线程安全）。"""
+
+    def __init__(self, repo: str) -> None:
+        self.repo = repo
+        self._proc: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+        self.spawned = 0
+
+    def _spawn(self) -> subprocess.Popen:
+        metrics.GIT_COMMANDS.inc(subcommand="cat-file")
+        self.spawned += 1
+        return subprocess.Popen(
+            ["git", "cat-file", "--batch-check"],
+            cwd=self.repo, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+
+    def _close_locked(self) -> None:
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            proc.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_locked()
+
+    def query(self, spec: str) -> Optional[Tuple[str, str, int]]:
+        """返回 (objectname, type, size)；对象不存在或有歧义时返回 None。进程无法工作时抛出 QueryError。"""
+        if not spec or "\n" in spec:
+            return None
+        with self._lock:
+            line = b""
+            for _ in range(2):
+                if self._proc is None or self._proc.poll() is not None:
+                    try:
+                        self._proc = self._spawn()
+                    except OSError as e:
+                        raise QueryError(str(e))
+                try:
+                    self._proc.stdin.write(spec.encode("utf-8") + b"\n")
+                    self._proc.stdin.flush()
+                    line = self._proc.stdout.readline()
+                except OSError:
+                    line = b""
+                if line:
+                    break
+                self._close_locked()
+            if not line:
+                raise QueryError(f"cat-file --batch-check 无法在 {self.repo} 运行")
+        text = line.decode("utf-8", "replace").rstrip("\n")
+        if text.endswith((" missing", " ambiguous")):
+            return None
+        parts = text.split(" ")
+        if len(parts) == 3 and parts[1] in _OBJECT_TYPES:
+            return parts[0], parts[1], int(parts[2])
+        return None
+
+
+_workers_lock = threading.Lock()
+_workers: Dict[str, BatchCheck] = {}
+
+
+def _worker(repo: str) -> BatchCheck:
+    key = os.path.realpath(repo)
+    with _workers_lock:
+        w = _workers.get(key)
+        if w is None:
+            w = _workers[key] = BatchCheck(key)
+        return w
+
+
+def close_all() -> None:
+    with _workers_lock:
+        workers = list(_workers.values())
+        _workers.clear()
+    for w in workers:
+        w.close()
+
+
+atexit.register(close_all)
+
+
+def object_info(repo: str, spec: str) -> Optional[Tuple[str, str, int]]:
+    """查询修订表达式对应的对象 (sha, type, size)；不存在时返回 None。"""
+    t0 = time.perf_counter()
+    try:
+        return _worker(repo).query(spec)
+    finally:
+        metrics.GIT_QUERY_DURATION.observe(time.perf_counter() - t0, op="object_info")
+        metrics.GIT_QUERIES.inc(op="object_info")
+
+
+def rev_parse(repo: str, ref: str) -> str:
+    """等价于 `git rev-parse --verify -q <ref>`：解析失败返回空串。"""
+    info = object_info(repo, ref)
+    return info[0] if info else ""
+
+
+# -------- git status --porcelain=v2 -z --------
+@dataclass
+class StatusEntry:
+    kind: str  # "1" 普通变更 / "2" 重命名或复制 / "u" 未合并 / "?" 未跟踪 / "!" 已忽略
+    xy: str  # 暂存区与工作区状态（"?"/"!" 记录为 "??"/"!!"）
+    path: str
+    orig_path: str = ""
+
+
+# 各类记录中路径之前的字段数
+_FIELDS_BEFORE_PATH = {"1": 8, "2": 9, "u": 10}
+
+
+def _parse_record(rec: bytes) -> Optional[StatusEntry]:
+    kind = rec[:1].decode("ascii", "replace")
+    if kind in ("?", "!"):
+        return StatusEntry(kind, kind * 2, os.fsdecode(rec[2:]))
+    n = _FIELDS_BEFORE_PATH.get(kind)
+    if n is None:
+        return None  # "#" 头部
+    parts = rec.split(b" ", n)
+    if len(parts) <= n:
+        return None
+    return StatusEntry(kind, parts[1].decode("ascii", "replace"), os.fsdecode(parts[n]))
+
+
+def status_entries(
+    repo: str, pathspecs: Sequence[str] = (), untracked: bool = True, chunk: int = 65536
+) -> Iterator[StatusEntry]:
+    """逐条产出 `git status --porcelain=v2 -z` 的记录；提前停止迭代时结束子进程。"""
+    cmd = ["git", "status", "--porcelain=v2", "-z", f"--untracked-files={'all' if untracked else 'no'}"]
+    if pathspecs:
+        cmd += ["--", *pathspecs]
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=repo, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    metrics.GIT_COMMANDS.inc(subcommand="status")
+    buf = b""
+    want_orig: Optional[StatusEntry] = None
+    try:
+        while True:
+            data = proc.stdout.read1(chunk)
+            if not data:
+                break
+            buf += data
+            records: List[bytes] = buf.split(b"\0")
+            buf = records.pop()
+            for rec in records:
+                if want_orig is not None:
+                    want_orig.orig_path = os.fsdecode(rec)
+                    entry, want_orig = want_orig, None
+                    yield entry
+                    continue
+                entry = _parse_record(rec)
+                if entry is None:
+                    continue
+                if entry.kind == "2":
+                    want_orig = entry
+                    continue
+                yield entry
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.stdout.close()
+        proc.wait()
+        metrics.GIT_DURATION.observe(time.perf_counter() - t0, subcommand="status")
+        metrics.GIT_QUERY_DURATION.observe(time.perf_counter() - t0, op="status")
+        metrics.GIT_QUERIES.inc(op="status")
+
+
+def is_dirty(repo: str, pathspecs: Sequence[str] = ()) -> bool:
+    """工作区或暂存区是否有任何变更（含未跟踪文件）；读到第一条记录即返回。"""
+    for _ in status_entries(repo, pathspecs):
+        return True
+    return False
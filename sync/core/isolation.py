@@ -0,0 +1,245 @@
+"""资源隔离：让同步的 CPU/IO 不影响同一容器里游戏服务器的帧时间（可选，默认关闭）。
+
+开启 SYNC_ISOLATION 后：
+
+- 优先级：进程启动时（创建任何工作线程之前）降低自身的 CPU nice 值与 IO 优先级，
+  之后创建的线程（同步任务、迁移拷贝、预取）和所有 git 子进程都继承较低的优先级；
+- 并发：git 的 `pack.threads`/`index.threads`、迁移拷贝线程数、分片并发与分块并行 fetch
+  都不超过 SYNC_ISOLATION_JOBS；
+- 带宽：设置 SYNC_PUSH_BWLIMIT 且系统中有 `trickle` 时，push 在 `trickle -s -u` 下运行；
+  没有 trickle 时只记录一次日志（git 本身没有带宽上限选项）；
+- 推迟：设置 SYNC_DEFER_LOAD 时，仓库维护（repack/gc）与运行中新增目标的迁移在整机 CPU 占用
+  （不含本进程）高于该比例时推迟到下一轮，连续推迟超过 SYNC_DEFER_MAX 秒后照常执行。
+
+累计的受限/推迟时间见 `totals`，守护进程据此在每轮同步的状态中报告本轮的增量（`isolation.cycle`）。
+
+可调环境变量：
+- SYNC_ISOLATION：是否启用（true/false），默认 false。
+- SYNC_NICE：CPU nice 值，默认 10。
+- SYNC_IONICE：IO 调度类别，`idle` 或 `best-effort[:0-7]`，默认 best-effort:7。
+- SYNC_ISOLATION_JOBS：并发上限，默认 1。
+- SYNC_PUSH_BWLIMIT：push 带宽上限（字节/秒，可带 K/M 后缀），默认 0（不限）。
+- SYNC_DEFER_LOAD：推迟重操作的 CPU 占用阈值（0~1），默认 0（不推迟）。
+- SYNC_DEFER_MAX：同一操作最长推迟时间（秒），默认 3600。
+"""
+
+from __future__ import annotations
+
+import ctypes
+import os
+import platform
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sync.core import metrics
+from sync.utils.logging import err, log
+
+_IOPRIO_SYSCALL = {"x86_64": 251, "aarch64": 30, "i686": 289, "armv7l": 314}
+_IOPRIO_CLASS = {"best-effort": 2, "idle": 3}
+_IOPRIO_WHO_PROCESS = 1
+
+
+def _proc_stat_ticks() -> Tuple[int, int]:
+    """整机 (忙碌, 总计) 时钟滴答。"""
+    with open("/proc/stat", "r", encoding="ascii") as f:
+        fields = [int(x) for x in f.readline().split()[1:]]
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+    total = sum(fields[:8])
+    return total - idle, total
+
+
+def _self_ticks() -> int:
+    """本进程（含已回收子进程）的 CPU 时钟滴答。"""
+    with open("/proc/self/stat", "r", encoding="ascii") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return sum(int(x) for x in fields[11:15])
+
+
+class CpuSampler:
+    """整机 CPU 占用（扣除本进程），按两次采样之间的增量计算。"""
+
+    def __init__(self, window: float = 1.0) -> None:
+        self.window = window
+        self._lock = threading.Lock()
+        self._last: Optional[Tuple[float, int, int, int]] = None
+        self.last_load = 0.0
+
+    def _read(self) -> Tuple[float, int, int, int]:
+        busy, total = _proc_stat_ticks()
+        return time.monotonic(), busy, total, _self_ticks()
+
+    def sample(self) -> float:
+        with self._lock:
+            if self._last is None or time.monotonic() - self._last[0] > 60:
+                # 没有近期的基准点：现采一个窗口
+                self._last = self._read()
+                time.sleep(self.window)
+            elif time.monotonic() - self._last[0] < self.window:
+                time.sleep(self.window - (time.monotonic() - self._last[0]))
+            cur = self._read()
+            _, busy0, total0, self0 = self._last
+            _, busy1, total1, self1 = cur
+            self._last = cur
+            if total1 <= total0:
+                return self.last_load
+            self.last_load = max(0.0, min(1.0, (busy1 - busy0 - (self1 - self0)) / (total1 - total0)))
+            return self.last_load
+
+
+class Isolation:
+    def __init__(
+        self,
+        enabled: bool = False,
+        nice: int = 10,
+        ionice: str = "best-effort:7",
+        jobs: int = 1,
+        push_bwlimit: int = 0,
+        defer_load: float = 0.0,
+        defer_max: float = 3600.0,
+    ) -> None:
+        self.enabled = enabled
+        self.nice = nice
+        self.ionice = ionice
+        self.jobs = max(1, jobs)
+        self.push_bwlimit = push_bwlimit
+        self.defer_load = defer_load
+        self.defer_max = defer_max
+        self.cpu = CpuSampler()
+        self.trickle = shutil.which("trickle") if enabled and push_bwlimit > 0 else None
+        self.applied: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._deferred_since: Dict[str, float] = {}
+        self.totals = {"throttled_seconds": 0.0, "deferred_seconds": 0.0, "deferrals": 0}
+        if enabled and push_bwlimit > 0 and not self.trickle:
+            log("未找到 trickle：SYNC_PUSH_BWLIMIT 不生效（git 没有内置的带宽上限）")
+
+    @classmethod
+    def from_env(cls) -> "Isolation":
+        from sync.core.chunks import parse_size
+
+        return cls(
+            enabled=os.environ.get("SYNC_ISOLATION", "false").lower() in ("1", "true", "yes"),
+            nice=int(os.environ.get("SYNC_NICE", "10")),
+            ionice=os.environ.get("SYNC_IONICE", "best-effort:7"),
+            jobs=int(os.environ.get("SYNC_ISOLATION_JOBS", "1")),
+            push_bwlimit=parse_size(os.environ.get("SYNC_PUSH_BWLIMIT", "0")),
+            defer_load=float(os.environ.get("SYNC_DEFER_LOAD", "0")),
+            defer_max=float(os.environ.get("SYNC_DEFER_MAX", "3600")),
+        )
+
+    # -------- 优先级 --------
+    def _set_ioprio(self) -> str:
+        cls_name, _, level = self.ionice.partition(":")
+        klass = _IOPRIO_CLASS.get(cls_name)
+        nr = _IOPRIO_SYSCALL.get(platform.machine())
+        if klass is None or nr is None:
+            return ""
+        value = (klass << 13) | (int(level or 7) if klass == 2 else 0)
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.syscall(nr, _IOPRIO_WHO_PROCESS, 0, value) != 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        return self.ionice
+
+    def apply_process(self) -> Dict[str, Any]:
+        """降低调用线程的 CPU/IO 优先级；应在创建工作线程与子进程之前调用（它们会继承）。"""
+        if not self.enabled or self.applied:
+            return self.applied
+        try:
+            cur = os.getpriority(os.PRIO_PROCESS, 0)
+            if self.nice > cur:
+                os.setpriority(os.PRIO_PROCESS, 0, self.nice)
+            self.applied["nice"] = os.getpriority(os.PRIO_PROCESS, 0)
+        except OSError as e:
+            err(f"设置 nice 失败：{e}")
+        try:
+            ioprio = self._set_ioprio()
+            if ioprio:
+                self.applied["ionice"] = ioprio
+        except (OSError, ValueError, AttributeError) as e:
+            err(f"设置 IO 优先级失败：{e}")
+        log(f"资源隔离已启用：{self.applied}，并发上限 {self.jobs}")
+        return self.applied
+
+    # -------- 并发与带宽 --------
+    def cap(self, n: int) -> int:
+        """隔离模式下把并发数限制在 jobs 以内。"""
+        return min(n, self.jobs) if self.enabled else n
+
+    def wrap(self, cmd: List[str], sub: str) -> Tuple[List[str], bool]:
+        """为 git 命令加上并发配置，push 时套上 trickle；返回 (命令, 是否限速)。"""
+        if not self.enabled or not cmd or os.path.basename(cmd[0]) != "git":
+            return cmd, False
+        cmd = [cmd[0], "-c", f"pack.threads={self.jobs}", "-c", f"index.threads={self.jobs}", *cmd[1:]]
+        if sub == "push" and self.trickle:
+            kib = max(1, self.push_bwlimit // 1024)
+            return [self.trickle, "-s", "-u", str(kib), *cmd], True
+        return cmd, False
+
+    def note_throttled(self, seconds: float) -> None:
+        with self._lock:
+            self.totals["throttled_seconds"] += seconds
+        metrics.ISOLATION_THROTTLED_SECONDS.inc(seconds)
+
+    # -------- 推迟重操作 --------
+    def should_defer(self, op: str) -> bool:
+        """整机 CPU 占用高于阈值时返回 True（调用方下一轮再试）；同一操作连续推迟超过 defer_max 后不再推迟。
+
+        采样可能阻塞最多 1 秒，调用方不应持有仓库锁。
+        """
+        if not self.enabled or self.defer_load <= 0:
+            return False
+        try:
+            load = self.cpu.sample()
+        except (OSError, ValueError, IndexError):
+            return False
+        now = time.monotonic()
+        with self._lock:
+            first = self._deferred_since.get(op)
+            if load < self.defer_load or (first is not None and now - first >= self.defer_max):
+                if first is not None:
+                    waited = now - self._deferred_since.pop(op)
+                    self.totals["deferred_seconds"] += waited
+                    metrics.ISOLATION_DEFERRED_SECONDS.inc(waited, op=op)
+                    log(f"{op} 推迟 {waited:.0f}s 后执行（CPU 占用 {load:.0%}）")
+                return False
+            if first is None:
+                self._deferred_since[op] = now
+                log(f"CPU 占用 {load:.0%} 高于 {self.defer_load:.0%}，推迟 {op}")
+            self.totals["deferrals"] += 1
+        metrics.ISOLATION_DEFERRALS.inc(op=op)
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            totals = {k: round(v, 3) if isinstance(v, float) else v for k, v in self.totals.items()}
+            deferring = sorted(self._deferred_since)
+        return {
+            "enabled": self.enabled,
+            "applied": dict(self.applied),
+            "jobs": self.jobs,
+            "push_bwlimit": self.push_bwlimit if self.trickle else 0,
+            "defer_load": self.defer_load,
+            "cpu_load": round(self.cpu.last_load, 3),
+            "deferring": deferring,
+            **totals,
+        }
+
+
+def cycle_delta(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    """两次 snapshot 之间的受限/推迟增量（单轮同步的报告）。"""
+    return {k: round(after[k] - before[k], 3) for k in ("throttled_seconds", "deferred_seconds", "deferrals")}
+
+
+_current: Optional[Isolation] = None
+_current_lock = threading.Lock()
+
+
+def current() -> Isolation:
+    """进程内共享的隔离配置（首次调用时读取环境变量）。"""
+    global _current
+    with _current_lock:
+        if _current is None:
+            _current = Isolation.from_env()
+        return _current
@@ -0,0 +1,179 @@
+"""守护进程持有的异步同步任务队列。
+
+- 所有 git 工作由单个工作线程串行执行，API 请求只负责入队并立即返回任务 ID；
+- 相同类型、尚未开始执行的任务会被合并为一次运行（重复点击不会叠加多次 pull/commit/push）；
+- 每个任务记录分阶段进度（pull/track/commit/push 及耗时），供 SSE 推送给前端。
+"""
+
+from __future__ import annotations
+
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+from sync.utils.logging import err
+
+
+class Job:
+    """单个任务及其进度事件流。"""
+
+    def __init__(self, job_id: str, kind: str, source: str) -> None:
+        self.id = job_id
+        self.kind = kind
+        self.source = source
+        self.state = "queued"  # queued / running / done / failed
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.requests = 1  # 被合并进本任务的请求数
+        self.phases: List[Dict[str, Any]] = []
+        self.result: Any = None
+        self.error = ""
+        self.events: List[Dict[str, Any]] = []
+        self._cond = threading.Condition()
+        self._emit("queued")
+
+    @property
+    def done(self) -> bool:
+        return self.state in ("done", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "source": self.source,
+                "state": self.state,
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished,
+                "requests": self.requests,
+                "phases": [dict(p) for p in self.phases],
+                "result": self.result,
+                "error": self.error,
+            }
+
+    def _emit(self, event: str, **data: Any) -> None:
+        with self._cond:
+            self.events.append({"seq": len(self.events), "event": event, "ts": time.time(), **data})
+            self._cond.notify_all()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        entry: Dict[str, Any] = {"name": name, "started": time.time(), "duration": None, "ok": None}
+        with self._cond:
+            self.phases.append(entry)
+        self._emit("phase_start", phase=name)
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            with self._cond:
+                entry["duration"] = round(time.perf_counter() - t0, 4)
+                entry["ok"] = ok
+            self._emit("phase_end", phase=name, duration=entry["duration"], ok=ok)
+
+    def events_after(self, seq: int) -> List[Dict[str, Any]]:
+        with self._cond:
+            return [dict(e) for e in self.events[seq:]]
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self.done, timeout)
+
+
+class JobQueue:
+    """单工作线程的任务队列；`handlers` 把任务类型映射到执行函数 `fn(job) -> result`。
+
+    `prefix` 加在任务 ID 前，多个队列（如各分片）并存时保证 ID 不冲突。
+    """
+
+    def __init__(self, handlers: Dict[str, Callable[[Job], Any]], history: int = 50, prefix: str = "") -> None:
+        self.handlers = handlers
+        self.prefix = prefix
+        self._cond = threading.Condition()
+        self._pending: Deque[Job] = deque()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._history = history
+        self._ids = itertools.count(1)
+        self._current: Optional[Job] = None
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def submit(self, kind: str, source: str = "api") -> Job:
+        if kind not in self.handlers:
+            raise ValueError(f"未知任务类型：{kind}")
+        with self._cond:
+            for job in self._pending:
+                if job.kind == kind:
+                    job.requests += 1
+                    job._emit("coalesced", source=source)
+                    return job
+            job = Job(f"{self.prefix}{int(time.time())}-{next(self._ids)}", kind, source)
+            self._pending.append(job)
+            self._jobs[job.id] = job
+            while len(self._jobs) > self._history:
+                oldest_id, oldest = next(iter(self._jobs.items()))
+                if not oldest.done:
+                    break
+                self._jobs.pop(oldest_id)
+            self._ensure_worker()
+            self._cond.notify_all()
+            return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._cond:
+            jobs = list(self._jobs.values())
+        return [j.to_dict() for j in reversed(jobs)]
+
+    @property
+    def current(self) -> Optional[Job]:
+        return self._current
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _ensure_worker(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._worker, name="sync-jobs", daemon=True)
+            self._thread.start()
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+                job = self._pending.popleft()
+                self._current = job
+            with job._cond:
+                job.state = "running"
+                job.started = time.time()
+            job._emit("started")
+            try:
+                result = self.handlers[job.kind](job)
+                with job._cond:
+                    job.result = result
+                    job.state = "done"
+            except Exception as e:
+                err(f"任务 {job.kind}#{job.id} 失败：{e}")
+                with job._cond:
+                    job.error = str(e)
+                    job.state = "failed"
+            finally:
+                with job._cond:
+                    job.finished = time.time()
+                job._emit(job.state, error=job.error)
+                self._current = None
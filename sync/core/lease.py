@@ -0,0 +1,218 @@
+"""远端写入租约（可选，默认关闭）。
+
+多个实例指向同一个远端分支时（如重启的 Space 与尚未退出的旧容器），各自提交、变基、推送会互相拒绝。
+开启 SYNC_LEASE 后，写入权由远端的专用引用 `refs/sync/lease/<branch>` 决定：
+
+- 引用指向一个空树提交，提交说明记录持有者（holder/host/pid/ts/ttl），只用于展示；
+- 获取与续约都是带 `--force-with-lease=<ref>:<期望 SHA>` 的比较并交换推送，
+  两个实例同时抢占时只有一个成功；
+- 持有者每 TTL/3 续约一次（每次生成新提交，引用 SHA 随之变化）；
+  其他实例观察到同一个 SHA 持续 TTL 秒未变化才视为过期并接管，判断只用本机单调时钟，
+  不受容器间时钟偏差影响（提交中的 ts 远早于 2×TTL 时直接视为过期，避免每次启动都等满 TTL）；
+- 正常退出时在最后一次推送之后删除引用，新实例无需等待过期。
+
+未持有租约的实例每轮只把本地分支快进到 origin（有未推送的提交或冲突的未提交改动时保持原样），
+不提交也不推送（状态 phase=standby），持有者信息见状态 API 的 `lease` 字段。
+
+可调环境变量：
+- SYNC_LEASE：是否启用租约（true/false），默认 false。
+- SYNC_LEASE_TTL：租约有效期（秒），默认 120。
+"""
+
+from __future__ import annotations
+
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sync.core import git_ops
+from sync.utils.logging import err, log
+
+REF_PREFIX = "refs/sync/lease/"
+
+
+def _parse(message: str) -> Dict[str, str]:
+    out: Dict[str, str] = {}
+    for line in message.splitlines():
+        key, sep, value = line.partition("=")
+        if sep:
+            out[key.strip()] = value.strip()
+    return out
+
+
+class RemoteLease:
+    """单个历史仓库/分支的远端租约。"""
+
+    def __init__(
+        self,
+        target: Callable[[], Tuple[str, str]],
+        stop: threading.Event,
+        name: str = "",
+        enabled: Optional[bool] = None,
+        ttl: Optional[float] = None,
+        on_acquire: Optional[Callable[[], None]] = None,
+    ) -> None:
+        # target() 返回当前的 (hist_dir, branch)
+        self._target = target
+        self._stop = stop
+        self.name = name
+        if enabled is None:
+            enabled = os.environ.get("SYNC_LEASE", "false").lower() in ("1", "true", "yes")
+        self.enabled = enabled
+        self.ttl = float(os.environ.get("SYNC_LEASE_TTL", "120")) if ttl is None else ttl
+        self.on_acquire = on_acquire
+        self.me = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._held_oid = ""
+        self._renewed = 0.0  # 最近一次成功获取/续约（单调时钟）
+        self._seen: Tuple[str, float] = ("", 0.0)  # 观察到的远端 SHA 及首次看到的时间
+        self.holder: Dict[str, str] = {}
+        self.stats = {"acquired": 0, "renewed": 0, "lost": 0, "contended": 0}
+        self.last_error = ""
+
+    @property
+    def ref(self) -> str:
+        return REF_PREFIX + self._target()[1]
+
+    @property
+    def held(self) -> bool:
+        """本地视角是否持有租约（不访问网络）；未启用租约时总是 True。"""
+        if not self.enabled:
+            return True
+        return bool(self._held_oid) and time.monotonic() - self._renewed < self.ttl
+
+    # -------- 远端操作 --------
+    def _remote_oid(self, hist_dir: str) -> str:
+        out = git_ops.run(["git", "ls-remote", "origin", self.ref], cwd=hist_dir, timeout=self.ttl / 2).stdout
+        for line in out.splitlines():
+            sha, _, name = line.partition("\t")
+            if name == self.ref:
+                return sha
+        return ""
+
+    def _read(self, hist_dir: str, oid: str) -> Dict[str, str]:
+        if not git_ops.rev_parse(hist_dir, f"{oid}^{{commit}}"):
+            git_ops.run(
+                ["git", "fetch", "--no-tags", "--no-write-fetch-head", "origin", f"+{self.ref}:{self.ref}"],
+                cwd=hist_dir, timeout=self.ttl / 2,
+            )
+        body = git_ops.run(["git", "cat-file", "commit", oid], cwd=hist_dir, check=False).stdout
+        return _parse(body.partition("\n\n")[2])
+
+    def _cas(self, hist_dir: str, expected: str) -> bool:
+        """把引用从 expected（空串表示不存在）换成新的租约提交；被他人抢先时返回 False。"""
+        host = socket.gethostname()
+        message = f"sync lease\n\nholder={self.me}\nhost={host}\npid={os.getpid()}\nts={int(time.time())}\nttl={int(self.ttl)}\n"
+        tree = git_ops.run(["git", "mktree"], cwd=hist_dir, input="").stdout.strip()
+        commit = git_ops.run(["git", "commit-tree", tree, "-m", message], cwd=hist_dir).stdout.strip()
+        t0 = time.monotonic()
+        proc = git_ops.run(
+            ["git", "push", f"--force-with-lease={self.ref}:{expected}", "origin", f"{commit}:{self.ref}"],
+            cwd=hist_dir, check=False, timeout=self.ttl / 2,
+        )
+        if proc.returncode != 0:
+            if "stale info" in proc.stderr or "rejected" in proc.stderr:
+                return False
+            raise git_ops.GitError(f"租约推送失败：{proc.stderr.strip()[-300:]}")
+        self._held_oid = commit
+        self._renewed = t0
+        self.holder = _parse(message)
+        return True
+
+    def _expired(self, oid: str, info: Dict[str, str]) -> bool:
+        now = time.monotonic()
+        if self._seen[0] != oid:
+            self._seen = (oid, now)
+        try:
+            if int(info.get("ts", "0")) + 2 * self.ttl < time.time():
+                return True
+        except ValueError:
+            pass
+        return now - self._seen[1] >= self.ttl
+
+    # -------- 对外接口 --------
+    def ensure(self) -> bool:
+        """获取或续约（距上次续约不足 TTL/3 时不访问网络）；返回是否持有租约。"""
+        if not self.enabled:
+            return True
+        with self._lock:
+            if self._held_oid and time.monotonic() - self._renewed < self.ttl / 3:
+                return True
+            hist_dir, _ = self._target()
+            try:
+                if self._held_oid:
+                    if self._cas(hist_dir, self._held_oid):
+                        self.stats["renewed"] += 1
+                        self.last_error = ""
+                        return True
+                    self._held_oid = ""
+                    self.stats["lost"] += 1
+                    err("远端租约已被其他实例接管，转为只读")
+                cur = self._remote_oid(hist_dir)
+                if cur:
+                    info = self._read(hist_dir, cur)
+                    if info.get("holder") != self.me and not self._expired(cur, info):
+                        self.holder = info
+                        self.stats["contended"] += 1
+                        self.last_error = ""
+                        return False
+                if not self._cas(hist_dir, cur):
+                    self.stats["contended"] += 1
+                    return False
+                self.stats["acquired"] += 1
+                self.last_error = ""
+                log(f"已获取远端租约 {self.ref}（{self.me}）")
+                return True
+            except git_ops.GitError as e:
+                # 网络故障：在本地视角的有效期内继续视为持有（其他实例至少要等满 TTL 才能接管）
+                self.last_error = str(e).splitlines()[0]
+                return self.held
+
+    def release(self) -> None:
+        """删除远端引用（仅当仍指向本实例的租约提交时）；失败时由过期机制兜底。"""
+        if not self.enabled or not self._held_oid:
+            return
+        with self._lock:
+            oid, self._held_oid = self._held_oid, ""
+            hist_dir, _ = self._target()
+            try:
+                proc = git_ops.run(
+                    ["git", "push", f"--force-with-lease={self.ref}:{oid}", "origin", f":{self.ref}"],
+                    cwd=hist_dir, check=False, timeout=10,
+                )
+            except git_ops.GitError as e:
+                err(f"释放远端租约失败（将在 {self.ttl:.0f}s 后过期）：{e}")
+                return
+            if proc.returncode == 0:
+                log(f"已释放远端租约 {self.ref}")
+
+    def start(self) -> bool:
+        if not self.enabled:
+            return False
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name=f"sync-lease-{self.name}", daemon=True)
+            self._thread.start()
+        return True
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            was = self.held
+            if self.ensure() and not was and self.on_acquire is not None:
+                self.on_acquire()
+            self._stop.wait(self.ttl / 3)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "ref": self.ref if self.enabled else "",
+            "me": self.me,
+            "held": self.held,
+            "holder": dict(self.holder),
+            "ttl": self.ttl,
+            "last_error": self.last_error,
+            **self.stats,
+        }
@@ -2,16 +2,15 @@ from __future__ import annotations
 
 import os
 import shutil
-import subprocess
-from typing import Iterable
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
-from sync.core.blacklist import is_excluded
+from sync.core.blacklist import ExcludeMatcher, as_matcher
+from sync.core import metrics
 from sync.core.config import to_abs_under_base, to_under_hist
-from sync.utils.logging import log
-
-
-def _rsync_available() -> bool:
-    return shutil.which("rsync") is not None
+from sync.core.migrate import MigrationError, migrate_tree
+from sync.utils.logging import err, log
 
 
 def ensure_symlink(src: str, dst: str) -> None:
@@ -42,10 +41,18 @@ def ensure_symlink(src: str, dst: str) -> None:
         raise
 
 
-def migrate_and_link(base: str, hist_dir: str, rel_targets: Iterable[str]) -> None:
+def migrate_and_link(
+    base: str, hist_dir: str, rel_targets: Iterable[str], excludes: Union[ExcludeMatcher, Iterable[str]] = ()
+) -> List[str]:
+    """迁移各目标并在原路径创建符号链接；返回迁移校验失败的目标（源目录保留、未创建链接，由调用方稍后重试）。"""
+    matcher = as_matcher(excludes)
+    failed: List[str] = []
     for rel in rel_targets:
         log(f"处理目标: {rel}")
         rel_clean = rel.rstrip("/")
+        if matcher and matcher.match(rel_clean):
+            log(f"  {rel} 命中排除规则，跳过")
+            continue
         src = to_abs_under_base(base, rel_clean)
         dst = to_under_hist(hist_dir, rel_clean)
         log(f"  src={src}, dst={dst}")
@@ -58,21 +65,17 @@ def migrate_and_link(base: str, hist_dir: str, rel_targets: Iterable[str]) -> No
 
         if os.path.isdir(src):
             log(f"  {src} 是目录，开始迁移")
-            os.makedirs(dst, exist_ok=True)
-            if _rsync_available():
-                subprocess.run(["rsync", "-a", f"{src}/", f"{dst}/"], check=False)
-            else:
-                for root, dirs, files in os.walk(src):
-                    relp = os.path.relpath(root, src)
-                    dstd = os.path.join(dst, relp) if relp != "." else dst
-                    os.makedirs(dstd, exist_ok=True)
-                    for fn in files:
-                        s = os.path.join(root, fn)
-                        t = os.path.join(dstd, fn)
-                        if not os.path.exists(t):
-                            shutil.copy2(s, t)
-            log(f"  删除原目录: {src}")
-            shutil.rmtree(src, ignore_errors=True)
+            try:
+                stats = migrate_tree(src, dst)
+            except MigrationError as e:
+                # 拷贝期间源文件被写入（如游戏存档）：保留源目录、不建链接，稍后重试
+                err(f"  {rel} 迁移失败，暂不创建符号链接：{e}")
+                failed.append(rel)
+                continue
+            metrics.MIGRATED_BYTES.inc(stats.bytes)
+            if stats.method != "rename":
+                log(f"  删除原目录: {src}")
+                shutil.rmtree(src, ignore_errors=True)
             ensure_symlink(src, dst)
         elif os.path.isfile(src):
             log(f"  {src} 是文件，开始迁移")
@@ -93,6 +96,7 @@ def migrate_and_link(base: str, hist_dir: str, rel_targets: Iterable[str]) -> No
                 if not os.path.exists(dst):
                     open(dst, "a").close()
             ensure_symlink(src, dst)
+    return failed
 
 
 def precreate_dirlike(hist_dir: str, rel_targets: Iterable[str]) -> None:
@@ -105,22 +109,95 @@ def precreate_dirlike(hist_dir: str, rel_targets: Iterable[str]) -> None:
             os.makedirs(os.path.dirname(dst), exist_ok=True)
 
 
-def track_empty_dirs(hist_dir: str, rel_targets: Iterable[str], excludes: Iterable[str]) -> int:
-    written = 0
+@dataclass
+class TrackStats:
+    """单次 `track_empty_dirs` 调用的开销统计。"""
+
+    written: int = 0
+    visited: int = 0  # 实际 scandir 的目录数
+    reused: int = 0  # mtime 未变、直接复用缓存列表的目录数
+    elapsed_ms: float = 0.0
+
+
+# 目录绝对路径 -> (mtime_ns, 子目录名列表, 是否非空)；跨调用复用
+_dir_cache: Dict[str, Tuple[int, List[str], bool]] = {}
+_last_stats = TrackStats()
+
+
+def last_track_stats() -> Dict[str, float]:
+    return asdict(_last_stats)
+
+
+def _list_dir(d: str, stats: TrackStats) -> Optional[Tuple[List[str], bool]]:
+    """返回 (子目录名, 是否非空)。目录 mtime 未变时直接使用缓存，不再 scandir。"""
+    try:
+        mtime = os.stat(d).st_mtime_ns
+    except OSError:
+        _dir_cache.pop(d, None)
+        return None
+    cached = _dir_cache.get(d)
+    if cached is not None and cached[0] == mtime:
+        stats.reused += 1
+        return cached[1], cached[2]
+    subdirs: List[str] = []
+    nonempty = False
+    try:
+        with os.scandir(d) as it:
+            for entry in it:
+                nonempty = True
+                if entry.name != ".git" and entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+    except OSError:
+        return None
+    stats.visited += 1
+    _dir_cache[d] = (mtime, subdirs, nonempty)
+    return subdirs, nonempty
+
+
+def track_empty_dirs(
+    hist_dir: str, rel_targets: Iterable[str], excludes: Union[ExcludeMatcher, Iterable[str]]
+) -> int:
+    """为目标下的空目录写入 `.gitkeep`。
+
+    单遍 scandir：被排除的子树在下探之前剪枝；目录 mtime 未变化时复用上次的
+    子目录列表，只需一次 stat 而不必重新列目录。
+    """
+    global _last_stats
+    matcher = as_matcher(excludes)
+    stats = TrackStats()
+    t0 = time.perf_counter()
     for rel in rel_targets:
         rel_clean = rel.rstrip("/")
         root = to_under_hist(hist_dir, rel_clean)
-        if os.path.isdir(root):
-            for d, subdirs, files in os.walk(root):
-                rel_under_hist = os.path.relpath(d, hist_dir).lstrip("./")
-                if is_excluded(rel_under_hist, excludes):
-                    continue
-                if "/.git/" in f"/{rel_under_hist}/":
+        if not os.path.isdir(root) or matcher.match(os.path.relpath(root, hist_dir)):
+            continue
+        stack = [root]
+        while stack:
+            d = stack.pop()
+            listing = _list_dir(d, stats)
+            if listing is None:
+                continue
+            subdirs, nonempty = listing
+            if not nonempty:
+                keep = os.path.join(d, ".gitkeep")
+                open(keep, "a").close()
+                stats.written += 1
+                try:
+                    _dir_cache[d] = (os.stat(d).st_mtime_ns, subdirs, True)
+                except OSError:
+                    _dir_cache.pop(d, None)
+            for name in subdirs:
+                child = os.path.join(d, name)
+                if matcher and matcher.match(os.path.relpath(child, hist_dir)):
                     continue
-                if not os.listdir(d):
-                    keep = os.path.join(d, ".gitkeep")
-                    if not os.path.exists(keep):
-                        open(keep, "a").close()
-                        written += 1
-    return written
-
+                stack.append(child)
+    stats.elapsed_ms = (time.perf_counter() - t0) * 1000.0
+    _last_stats = stats
+    metrics.TRACK_DIRS_VISITED.inc(stats.visited)
+    if stats.written:
+        # 空闲轮次不记录：开销统计见 last_track_stats() 与指标
+        log(
+            f"空目录跟踪：写入 {stats.written}，扫描 {stats.visited} 个目录"
+            f"（缓存复用 {stats.reused}），耗时 {stats.elapsed_ms:.1f}ms"
+        )
+    return stats.written
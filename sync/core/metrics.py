@@ -0,0 +1,241 @@
+"""进程内指标（Prometheus 文本格式导出）。
+
+不依赖 prometheus_client：只实现本项目用到的 Counter / Gauge / Histogram，
+由 `/sync/api/metrics` 调用 `REGISTRY.render()` 输出。
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(v: float) -> str:
+    if math.isnan(v):
+        return "NaN"
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    if v == int(v) and abs(v) < 1e15:
+        return str(int(v))
+    return repr(float(v))
+
+
+def _labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def total(self) -> float:
+        with self._lock:
+            return sum(self._values.values())
+
+    def snapshot(self) -> Dict[LabelValues, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """可直接 set，也可以注册回调在导出时取值（回调返回 {标签值元组: 数值}）。"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[str, Callable[[], Dict[LabelValues, float]]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def set_function(self, owner: str, fn: Callable[[], Dict[LabelValues, float]]) -> None:
+        with self._lock:
+            self._functions[owner] = fn
+
+    def remove_function(self, owner: str) -> None:
+        with self._lock:
+            self._functions.pop(owner, None)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.values())
+        for fn in functions:
+            try:
+                values.update(fn())
+            except Exception:
+                continue
+        return [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            counts = self._counts.get(self._key(labels))
+            return counts[-1] if counts else 0
+
+    def samples(self) -> List[str]:
+        out: List[str] = []
+        with self._lock:
+            items = sorted((k, list(c), self._sums[k]) for k, c in self._counts.items())
+        for key, counts, total in items:
+            for b, c in zip(self.buckets, counts):
+                le = 'le="%s"' % _fmt(b)
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {c}")
+            le_inf = 'le="+Inf"'
+            out.append(f"{self.name}_bucket{_labels(self.labelnames, key, le_inf)} {counts[-1]}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(total)}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {counts[-1]}")
+        return out
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        with self._lock:
+            return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))  # type: ignore[return-value]
+
+
+def gauge(name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labelnames))  # type: ignore[return-value]
+
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))  # type: ignore[return-value]
+
+
+# -------- 本项目的指标 --------
+GIT_COMMANDS = counter("sync_git_commands_total", "git subprocesses started, by subcommand", ["subcommand"])
+GIT_FAILURES = counter("sync_git_command_failures_total", "git subprocesses exiting non-zero, by subcommand", ["subcommand"])
+GIT_DURATION = histogram("sync_git_command_duration_seconds", "git subprocess wall time, by subcommand", ["subcommand"])
+GIT_TRANSFER_BYTES = counter(
+    "sync_git_transfer_bytes_total", "bytes reported by git progress for push (sent) and fetch/pull (received)", ["direction"]
+)
+PHASE_DURATION = histogram("sync_phase_duration_seconds", "sync cycle phase duration", ["phase"])
+TRACK_DIRS_VISITED = counter("sync_track_empty_dirs_visited_total", "directories listed by track_empty_dirs")
+MIGRATED_BYTES = counter("sync_migrated_bytes_total", "bytes copied while migrating targets into the history repo")
+LAST_PUSH_AGE = gauge(
+    "sync_seconds_since_last_push", "seconds since the last successful push (NaN before the first), by shard", ["shard"]
+)
+DIRTY_FILES = gauge(
+    "sync_dirty_files", "files under targets that differ from the last committed stat manifest, by shard", ["shard"]
+)
+BOOTSTRAP_SECONDS = gauge("sync_bootstrap_seconds", "time from daemon start to local HEAD matching origin")
+LOCK_WAIT = histogram("sync_lock_wait_seconds", "time spent waiting for the repository lock, by shard and operation", ["shard", "op"])
+LOCK_HOLD = histogram("sync_lock_hold_seconds", "time the repository lock was held, by shard and operation", ["shard", "op"])
+GIT_QUERIES = counter("sync_git_queries_total", "ref/object/status queries served by the query layer, by op", ["op"])
+GIT_QUERY_DURATION = histogram(
+    "sync_git_query_seconds", "query layer latency per call, by op", ["op"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0),
+)
+CONFLICTS_RESOLVED = counter(
+    "sync_conflicts_resolved_total", "conflicted paths resolved automatically during rebase/merge, by strategy", ["strategy"]
+)
+CONFLICT_ABORTS = counter("sync_conflict_aborts_total", "rebases/merges aborted because conflicts could not be resolved")
+ISOLATION_THROTTLED_SECONDS = counter("sync_isolation_throttled_seconds_total", "wall time of pushes run under the bandwidth cap")
+ISOLATION_DEFERRALS = counter("sync_isolation_deferrals_total", "heavy operations postponed because CPU load was high, by op", ["op"])
+ISOLATION_DEFERRED_SECONDS = counter(
+    "sync_isolation_deferred_seconds_total", "time heavy operations spent postponed before running, by op", ["op"]
+)
@@ -0,0 +1,189 @@
+"""目录迁移引擎（BASE 下的目标目录 -> 历史仓库）。
+
+按代价从低到高依次尝试：
+1) `os.rename` 整体原子移动（同一文件系统且目标不存在或为空目录时，零拷贝）；
+2) 逐文件 reflink（FICLONE）或 `copy_file_range`（内核内拷贝，不经过用户态缓冲）；
+3) 以上都不可用时普通读写拷贝。
+逐文件拷贝在线程池中并行执行；删除源目录之前校验大小（默认还校验内容摘要）。
+
+可调环境变量：
+- SYNC_MIGRATE_WORKERS：拷贝线程数，默认 4（资源隔离模式下不超过 SYNC_ISOLATION_JOBS）。
+- SYNC_MIGRATE_VERIFY：`checksum`（默认，大小 + BLAKE2b）或 `size`（只比较大小）。
+"""
+
+from __future__ import annotations
+
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from sync.core import isolation
+from sync.utils.logging import log
+
+
+FICLONE = 0x40049409
+_CHUNK = 8 * 1024 * 1024
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+@dataclass
+class MigrationStats:
+    method: str = ""
+    files: int = 0
+    skipped: int = 0
+    bytes: int = 0
+    elapsed: float = 0.0
+    by_method: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def rate(self) -> float:
+        return self.bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def _is_empty_dir(path: str) -> bool:
+    try:
+        with os.scandir(path) as it:
+            return next(it, None) is None
+    except OSError:
+        return False
+
+
+def _try_rename(src: str, dst: str) -> bool:
+    if os.path.lexists(dst) and not (os.path.isdir(dst) and not os.path.islink(dst) and _is_empty_dir(dst)):
+        return False
+    try:
+        os.rename(src, dst)
+        return True
+    except OSError as e:
+        if e.errno in (errno.EXDEV, errno.ENOTEMPTY, errno.EEXIST, errno.EBUSY, errno.EPERM, errno.EACCES):
+            return False
+        raise
+
+
+def _copy_data(s: str, t: str, size: int) -> str:
+    """把 s 的内容写入新文件 t，返回实际使用的方式。"""
+    with open(s, "rb") as fs, open(t, "wb") as ft:
+        try:
+            fcntl.ioctl(ft.fileno(), FICLONE, fs.fileno())
+            return "reflink"
+        except OSError:
+            pass
+        if hasattr(os, "copy_file_range") and size > 0:
+            try:
+                copied = 0
+                while copied < size:
+                    n = os.copy_file_range(fs.fileno(), ft.fileno(), min(size - copied, 1 << 30))
+                    if n == 0:
+                        break
+                    copied += n
+                if copied == size:
+                    return "copy_file_range"
+            except OSError:
+                pass
+            fs.seek(0)
+            ft.seek(0)
+            ft.truncate()
+        shutil.copyfileobj(fs, ft, _CHUNK)
+        return "copy"
+
+
+def _copy_one(s: str, t: str, size: int) -> str:
+    tmp = f"{t}.sync-tmp"
+    try:
+        method = _copy_data(s, tmp, size)
+        shutil.copystat(s, tmp)
+        os.replace(tmp, t)
+        return method
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _digest(path: str) -> str:
+    h = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _plan(src: str, dst: str) -> Tuple[List[Tuple[str, str, int]], int]:
+    """创建目录骨架并列出需要拷贝的文件；目标已存在且大小/mtime 相同的文件跳过（与 rsync -a 一致）。"""
+    todo: List[Tuple[str, str, int]] = []
+    skipped = 0
+    for root, dirs, files in os.walk(src):
+        relp = os.path.relpath(root, src)
+        dstd = os.path.join(dst, relp) if relp != "." else dst
+        os.makedirs(dstd, exist_ok=True)
+        for dn in dirs:
+            s = os.path.join(root, dn)
+            if os.path.islink(s):  # os.walk 不会下探目录型符号链接：原样复制链接本身
+                t = os.path.join(dstd, dn)
+                if not os.path.lexists(t):
+                    os.symlink(os.readlink(s), t)
+        for fn in files:
+            s = os.path.join(root, fn)
+            t = os.path.join(dstd, fn)
+            st = os.lstat(s)
+            if os.path.islink(s):
+                if os.path.lexists(t):
+                    os.remove(t)
+                os.symlink(os.readlink(s), t)
+                continue
+            try:
+                tt = os.lstat(t)
+                if tt.st_size == st.st_size and int(tt.st_mtime) == int(st.st_mtime):
+                    skipped += 1
+                    continue
+            except OSError:
+                pass
+            todo.append((s, t, st.st_size))
+    return todo, skipped
+
+
+def migrate_tree(src: str, dst: str, workers: Optional[int] = None, verify: Optional[str] = None) -> MigrationStats:
+    """把目录 src 的内容迁移到 dst。返回 method == "rename" 时 src 已不存在；否则源目录保留，由调用方删除。"""
+    workers = workers or isolation.current().cap(int(os.environ.get("SYNC_MIGRATE_WORKERS", "4")))
+    verify = verify or os.environ.get("SYNC_MIGRATE_VERIFY", "checksum")
+    stats = MigrationStats()
+    t0 = time.perf_counter()
+
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if _try_rename(src, dst):
+        stats.method = "rename"
+        stats.elapsed = time.perf_counter() - t0
+        log(f"  迁移完成（rename，零拷贝）：{src} -> {dst}，耗时 {stats.elapsed:.3f}s")
+        return stats
+
+    todo, stats.skipped = _plan(src, dst)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        methods = list(pool.map(lambda job: _copy_one(*job), todo))
+        for m in methods:
+            stats.by_method[m] = stats.by_method.get(m, 0) + 1
+        stats.files = len(todo)
+        stats.bytes = sum(size for _, _, size in todo)
+
+        bad = [t for s, t, size in todo if os.path.getsize(t) != size]
+        if not bad and verify == "checksum":
+            pairs = list(pool.map(lambda job: (job[1], _digest(job[0]) == _digest(job[1])), todo))
+            bad = [t for t, ok in pairs if not ok]
+    if bad:
+        raise MigrationError(f"迁移校验失败（{len(bad)} 个文件不一致），保留源目录：{bad[:5]}")
+
+    stats.method = max(stats.by_method, key=stats.by_method.get) if stats.by_method else "noop"
+    stats.elapsed = time.perf_counter() - t0
+    log(
+        f"  迁移完成：{stats.files} 个文件 {stats.bytes / 1048576:.1f} MiB（跳过 {stats.skipped}），"
+        f"方式 {stats.by_method or '-'}，校验 {verify}，耗时 {stats.elapsed:.2f}s，"
+        f"{stats.rate / 1048576:.1f} MiB/s"
+    )
+    return stats
@@ -0,0 +1,117 @@
+"""后台预取远端。
+
+`git fetch origin <branch>` 在仓库锁之外按自己的节奏运行，只更新 `origin/<branch>` 与对象库，
+不触碰工作区和本地分支；同步轮次因此只需在本地变基到已预取的提交上再推送，
+持锁期间不再等待 GitHub 的网络延迟。推送被拒（预取后远端又前进）时由调用方在锁内
+同步补取一次（`fetch_now`），与后台预取互斥，不会并发运行两个 fetch。
+清理不可达对象的维护（`gc --prune=now`）在 `paused()` 内执行，避免删掉 fetch 刚写入、尚未被引用的对象。
+
+可调环境变量：
+- SYNC_PREFETCH_INTERVAL：两次后台预取的间隔（秒），默认 60；0 表示关闭（每轮在锁内拉取）。
+- SYNC_PREFETCH_MIN_GAP：文件变更触发的提前预取与上次预取的最短间隔（秒），默认 10。
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from sync.core import git_ops
+from sync.utils.logging import err
+
+
+class Prefetcher:
+    """单个历史仓库/分支的后台预取线程。"""
+
+    def __init__(
+        self,
+        target: Callable[[], Tuple[str, str]],
+        stop: threading.Event,
+        name: str = "",
+        interval: Optional[float] = None,
+        min_gap: Optional[float] = None,
+    ) -> None:
+        # target() 返回当前的 (hist_dir, branch)；配置热加载后自动跟随
+        self._target = target
+        self._stop = stop
+        self.name = name
+        self.interval = float(os.environ.get("SYNC_PREFETCH_INTERVAL", "60")) if interval is None else interval
+        self.min_gap = float(os.environ.get("SYNC_PREFETCH_MIN_GAP", "10")) if min_gap is None else min_gap
+        self._fetch_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"runs": 0, "failures": 0, "moved": 0}
+        self.last_ts = 0.0
+        self.last_seconds = 0.0
+        self.last_error = ""
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def start(self) -> bool:
+        if not self.enabled:
+            return False
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name=f"sync-prefetch-{self.name}", daemon=True)
+            self._thread.start()
+        return True
+
+    def close(self) -> None:
+        """唤醒线程使其检查停止标志后退出。"""
+        self._wake.set()
+
+    def kick(self) -> None:
+        """请求尽快预取一次（如检测到文件变更、即将同步时）；受 min_gap 限制。"""
+        if time.time() - self.last_ts >= self.min_gap:
+            self._wake.set()
+
+    @contextmanager
+    def paused(self) -> Iterator[None]:
+        """在此期间不运行任何 fetch（等待进行中的 fetch 结束）。调用方若持有仓库锁，应先取仓库锁。"""
+        with self._fetch_lock:
+            yield
+
+    def fetch_now(self) -> bool:
+        """立即 fetch 一次（与后台预取互斥）；返回 origin/<branch> 是否前进。失败时抛出 GitError。"""
+        hist_dir, branch = self._target()
+        with self._fetch_lock:
+            before = git_ops.rev_parse(hist_dir, f"origin/{branch}")
+            t0 = time.monotonic()
+            proc = git_ops.run(["git", "fetch", "--no-tags", "origin", branch], cwd=hist_dir, check=False)
+            self.last_seconds = round(time.monotonic() - t0, 3)
+            self.last_ts = time.time()
+            self.stats["runs"] += 1
+            if proc.returncode != 0:
+                self.stats["failures"] += 1
+                self.last_error = proc.stderr.strip()[-300:]
+                raise git_ops.GitError(f"fetch 失败：{self.last_error}")
+            self.last_error = ""
+            moved = git_ops.rev_parse(hist_dir, f"origin/{branch}") != before
+            if moved:
+                self.stats["moved"] += 1
+            return moved
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            failing = bool(self.last_error)
+            try:
+                self.fetch_now()
+            except git_ops.GitError as e:
+                if not failing:  # 远端持续不可达时只记录第一次
+                    err(f"后台预取失败（推送被拒时会在同步中重试）：{e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "interval": self.interval,
+            "last_ts": self.last_ts,
+            "last_seconds": self.last_seconds,
+            "last_error": self.last_error,
+            **self.stats,
+        }
@@ -0,0 +1,127 @@
+"""启动就绪阶段。
+
+守护进程按顺序推进以下阶段，门控服务（游戏服务器、frpc、filebrowser）据此决定何时启动：
+
+- starting：进程已启动，尚未与远端对齐；
+- remote_ready：本地 HEAD 已与 `origin/<branch>` 对齐；
+- linked：目标已迁移并创建符号链接（此时写入就绪文件）；
+- synced：首轮持续同步已成功完成。
+
+就绪文件（`Settings.ready_file`，默认 `<HIST_DIR>/.sync.ready`）以“临时文件 + rename”原子写入，
+内容为 `key=value` 行（stage/pid/head/ts），便于 shell 直接读取；进程启动与退出时删除，
+避免上一次运行遗留的文件让等待方误判。等待方优先使用 `/sync/api/ready` 长轮询，
+无法访问 API 时再检查该文件，均不需要启动 git 子进程。
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+STAGES = ("starting", "remote_ready", "linked", "synced")
+
+
+def stage_rank(stage: str) -> int:
+    """阶段序号；未知阶段返回 -1。"""
+    try:
+        return STAGES.index(stage)
+    except ValueError:
+        return -1
+
+
+def read_ready_file(path: str) -> Dict[str, str]:
+    """解析就绪文件；不存在或无法读取时返回空字典。"""
+    out: Dict[str, str] = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                key, sep, value = line.strip().partition("=")
+                if sep:
+                    out[key] = value
+    except OSError:
+        pass
+    return out
+
+
+class Readiness:
+    """线程安全的阶段记录；阶段只前进不后退（`reset()` 除外）。"""
+
+    def __init__(self, ready_file: Optional[str] = None) -> None:
+        self.ready_file = ready_file
+        self._cond = threading.Condition()
+        self._stage = STAGES[0]
+        self._since: Dict[str, float] = {STAGES[0]: time.time()}
+        self._subscribers: List[Callable[[], None]] = []
+
+    def subscribe(self, fn: Callable[[], None]) -> None:
+        with self._cond:
+            self._subscribers.append(fn)
+
+    @property
+    def stage(self) -> str:
+        with self._cond:
+            return self._stage
+
+    def reached(self, stage: str) -> bool:
+        with self._cond:
+            return stage_rank(self._stage) >= stage_rank(stage)
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            return {"stage": self._stage, "since": dict(self._since)}
+
+    def _notify(self) -> None:
+        with self._cond:
+            self._cond.notify_all()
+            subscribers = list(self._subscribers)
+        for fn in subscribers:
+            fn()
+
+    def reset(self) -> None:
+        """回到 starting 并删除就绪文件（进程启动/退出时调用）。"""
+        with self._cond:
+            self._stage = STAGES[0]
+            self._since = {STAGES[0]: time.time()}
+        self._remove_file()
+        self._notify()
+
+    def advance(self, stage: str, head: str = "") -> bool:
+        """推进到 stage（已到达或超过时忽略）；到达 linked 及之后的阶段时写入就绪文件。"""
+        if stage_rank(stage) < 0:
+            raise ValueError(f"未知阶段：{stage}")
+        with self._cond:
+            if stage_rank(stage) <= stage_rank(self._stage):
+                return False
+            self._stage = stage
+            self._since[stage] = time.time()
+        if stage_rank(stage) >= stage_rank("linked"):
+            self._write_file(stage, head)
+        self._notify()
+        return True
+
+    def wait(self, stage: str, timeout: float) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: stage_rank(self._stage) >= stage_rank(stage), timeout)
+
+    def _write_file(self, stage: str, head: str) -> None:
+        if not self.ready_file:
+            return
+        tmp = f"{self.ready_file}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.ready_file) or ".", exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(f"stage={stage}\npid={os.getpid()}\nhead={head}\nts={int(time.time())}\n")
+            os.replace(tmp, self.ready_file)
+        except OSError:
+            pass
+
+    def _remove_file(self) -> None:
+        if not self.ready_file:
+            return
+        for p in (self.ready_file, f"{self.ready_file}.tmp"):
+            try:
+                os.unlink(p)
+            except OSError:
+                pass
@@ -0,0 +1,176 @@
+"""按时间点恢复单个目标/存档槽位。
+
+- 历史列表：`git log -- <path>` 按路径过滤，结果按 (仓库, 路径) 缓存；HEAD 前进时只增量读取
+  `旧 HEAD..HEAD` 的新提交，浅克隆历史不足时按需 `fetch --deepen`（只取提交与树，不取文件内容）；
+- 恢复：`git --work-tree=<暂存目录> restore --source=<提交>` 只检出该子树（部分克隆时按需下载所需的 blob），
+  再与正式目录原子交换（Linux `renameat2(RENAME_EXCHANGE)`，不可用时退回两次 rename），
+  BASE 下指向该目录的符号链接（`linker.ensure_symlink`）始终有效。
+恢复耗时只与槽位大小相关，与仓库大小无关。
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sync.core import git_ops, gitquery
+from sync.utils.logging import log
+
+
+class RestoreError(RuntimeError):
+    pass
+
+
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2
+
+_FIELD = "\x1f"
+_index_lock = threading.Lock()
+# (hist_dir, path) -> (已索引到的 HEAD, 历史条目（新到旧，最多保留请求的 limit 条）)；按最近使用淘汰
+_INDEX_MAX = 64
+_index: "OrderedDict[Tuple[str, str], Tuple[str, List[Dict]]]" = OrderedDict()
+
+
+def _load_renameat2():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fn = libc.renameat2
+        fn.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+        return fn
+    except (OSError, AttributeError):
+        return None
+
+
+_renameat2 = _load_renameat2()
+
+
+def normalize_path(path: str, rel_targets: Sequence[str]) -> str:
+    """校验并规范化相对 HIST_DIR 的路径：必须位于某个同步目标之内（或就是目标本身）。"""
+    clean = os.path.normpath(path.strip().lstrip("/"))
+    if clean in ("", ".") or clean.startswith("..") or "/../" in f"/{clean}/":
+        raise RestoreError(f"非法路径：{path!r}")
+    for rel in rel_targets:
+        target = rel.strip("/")
+        if clean == target or clean.startswith(target + "/"):
+            return clean
+    raise RestoreError(f"路径不在任何同步目标之内：{clean}")
+
+
+def _log_entries(hist_dir: str, rev_range: str, path: str, limit: int) -> List[Dict]:
+    fmt = _FIELD.join(("%H", "%ct", "%an", "%s"))
+    cmd = ["git", "log", f"--format={fmt}", f"-n{limit}", rev_range, "--", path]
+    out = git_ops.run(cmd, cwd=hist_dir, check=False).stdout
+    entries = []
+    for line in out.splitlines():
+        parts = line.split(_FIELD, 3)
+        if len(parts) == 4:
+            entries.append({"commit": parts[0], "ts": int(parts[1]), "author": parts[2], "subject": parts[3]})
+    return entries
+
+
+def _deepen(hist_dir: str, branch: str, depth: int) -> None:
+    log(f"恢复：浅克隆历史不足，补取 {depth} 个提交（不含文件内容）")
+    git_ops.run(
+        ["git", "fetch", f"--deepen={depth}", "--filter=blob:none", "origin", branch], cwd=hist_dir, check=False
+    )
+
+
+def history(hist_dir: str, branch: str, path: str, limit: int = 50, deepen: bool = True) -> Dict:
+    """列出 path 的历史版本（新到旧）。"""
+    head = git_ops.rev_parse(hist_dir, "HEAD")
+    if not head:
+        return {"path": path, "versions": [], "shallow": False}
+    key = (hist_dir, path)
+    with _index_lock:
+        cached = _index.get(key)
+        if cached is not None:
+            _index.move_to_end(key)
+    if cached and cached[0] == head and len(cached[1]) >= limit:
+        entries = cached[1]
+    elif cached and cached[0] != head and git_ops.run(
+        ["git", "merge-base", "--is-ancestor", cached[0], head], cwd=hist_dir, check=False
+    ).returncode == 0 and len(cached[1]) >= limit:
+        entries = _log_entries(hist_dir, f"{cached[0]}..{head}", path, limit) + cached[1]
+    else:
+        entries = _log_entries(hist_dir, head, path, limit)
+        if deepen and len(entries) < limit and git_ops.is_shallow(hist_dir):
+            _deepen(hist_dir, branch, max(limit * 4, 100))
+            entries = _log_entries(hist_dir, head, path, limit)
+    entries = entries[:limit]
+    with _index_lock:
+        _index[key] = (head, entries)
+        _index.move_to_end(key)
+        while len(_index) > _INDEX_MAX:
+            _index.popitem(last=False)
+    return {"path": path, "versions": entries, "shallow": git_ops.is_shallow(hist_dir)}
+
+
+def _ensure_commit(hist_dir: str, branch: str, commit: str) -> str:
+    full = git_ops.rev_parse(hist_dir, f"{commit}^{{commit}}")
+    if full:
+        return full
+    # 浅克隆/部分克隆：按 SHA 单独取回该提交（只含提交与树）
+    git_ops.run(["git", "fetch", "--depth=1", "--filter=blob:none", "origin", commit], cwd=hist_dir, check=False)
+    full = git_ops.rev_parse(hist_dir, f"{commit}^{{commit}}")
+    if not full:
+        raise RestoreError(f"找不到提交：{commit}")
+    return full
+
+
+def _exchange(a: str, b: str) -> bool:
+    """原子交换两个路径；内核/文件系统不支持时返回 False。"""
+    if _renameat2 is None:
+        return False
+    rc = _renameat2(AT_FDCWD, os.fsencode(a), AT_FDCWD, os.fsencode(b), RENAME_EXCHANGE)
+    return rc == 0
+
+
+def restore_path(hist_dir: str, branch: str, path: str, commit: str) -> Dict:
+    """把 path 恢复到 commit 时的内容（目录整体替换）。调用方需持有仓库锁。"""
+    t0 = time.perf_counter()
+    full = _ensure_commit(hist_dir, branch, commit)
+    info = gitquery.object_info(hist_dir, f"{full}:{path}")
+    kind = info[1] if info else ""
+    if kind not in ("tree", "blob"):
+        raise RestoreError(f"{path} 在提交 {full[:12]} 中不存在")
+
+    work = os.path.join(hist_dir, ".git", "sync-restore", f"{int(time.time() * 1000)}-{os.getpid()}")
+    os.makedirs(work)
+    try:
+        git_ops.run(
+            ["git", f"--work-tree={work}", "restore", f"--source={full}", "--worktree", "--", path], cwd=hist_dir
+        )
+        staged = os.path.join(work, path)
+        if not os.path.lexists(staged):
+            raise RestoreError(f"暂存目录中没有 {path}")
+        files = sum(len(fs) for _, _, fs in os.walk(staged)) if kind == "tree" else 1
+        nbytes = sum(
+            os.path.getsize(os.path.join(r, f)) for r, _, fs in os.walk(staged) for f in fs
+        ) if kind == "tree" else os.path.getsize(staged)
+
+        live = os.path.join(hist_dir, path)
+        method = "exchange"
+        if os.path.lexists(live):
+            is_dir_pair = os.path.isdir(live) and not os.path.islink(live) and kind == "tree"
+            is_file_pair = not os.path.isdir(live) and kind == "blob"
+            if not ((is_dir_pair or is_file_pair) and _exchange(staged, live)):
+                method = "rename"
+                old = os.path.join(work, ".previous")
+                os.rename(live, old)
+                os.rename(staged, live)
+        else:
+            method = "rename"
+            os.makedirs(os.path.dirname(live), exist_ok=True)
+            os.rename(staged, live)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    elapsed = time.perf_counter() - t0
+    log(f"已恢复 {path} 到 {full[:12]}：{files} 个文件 {nbytes / 1048576:.2f} MiB（{method}），耗时 {elapsed:.2f}s")
+    return {"path": path, "commit": full, "files": files, "bytes": nbytes, "method": method, "seconds": round(elapsed, 3)}
@@ -0,0 +1,171 @@
+"""历史保留策略与仓库维护。
+
+周期提交会让备份仓库无限增长（存档 XML 每个数 MB）。这里提供：
+- 保留策略：最近 N 小时内的提交全部保留；更早的按小时、按天、按周各保留该时段最新的一个；
+- 历史汇总：把保留下来的快照按原作者/时间重新串成一条新链（git commit-tree），
+  以 `--force-with-lease` 安全地强推，租约不匹配（远端被他人更新）时放弃；
+- 仓库维护：pack-refs / repack / commit-graph，汇总后额外清理不可达对象；
+- 体积统计：`git count-objects -v`。
+
+重写历史具有破坏性，默认关闭（SYNC_RETENTION=true 开启）；维护任务默认开启。
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sync.core import git_ops
+from sync.utils.logging import log
+
+
+@dataclass
+class RetentionPolicy:
+    keep_all_hours: float = 24.0
+    hourly_days: float = 7.0
+    daily_days: float = 30.0
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        return cls(
+            keep_all_hours=float(os.environ.get("SYNC_KEEP_ALL_HOURS", "24")),
+            hourly_days=float(os.environ.get("SYNC_KEEP_HOURLY_DAYS", "7")),
+            daily_days=float(os.environ.get("SYNC_KEEP_DAILY_DAYS", "30")),
+        )
+
+    def bucket(self, ts: int, now: float) -> Optional[Tuple[str, int]]:
+        """返回提交所属的保留桶；None 表示在“全部保留”窗口内。"""
+        age = now - ts
+        if age <= self.keep_all_hours * 3600:
+            return None
+        if age <= self.hourly_days * 86400:
+            return ("h", ts // 3600)
+        if age <= self.daily_days * 86400:
+            return ("d", ts // 86400)
+        return ("w", ts // (7 * 86400))
+
+    def select(self, commits: List[Tuple[str, int]], now: float) -> List[str]:
+        """commits 按时间从旧到新排列；返回需保留的 SHA（同序）。每个桶保留最新的一个，末端提交总是保留。"""
+        newest_in_bucket: Dict[Tuple[str, int], str] = {}
+        for sha, ts in commits:
+            b = self.bucket(ts, now)
+            if b is not None:
+                newest_in_bucket[b] = sha
+        keep_set = set(newest_in_bucket.values())
+        keep = [sha for sha, ts in commits if sha in keep_set or self.bucket(ts, now) is None]
+        if commits and (not keep or keep[-1] != commits[-1][0]):
+            keep.append(commits[-1][0])
+        return keep
+
+
+@dataclass
+class _Commit:
+    sha: str
+    tree: str
+    author_name: str
+    author_email: str
+    author_date: str
+    committer_name: str
+    committer_email: str
+    committer_date: str
+    ts: int
+    message: str
+
+
+def _first_parent_history(hist_dir: str) -> List[_Commit]:
+    fmt = "%H%x00%T%x00%an%x00%ae%x00%ad%x00%cn%x00%ce%x00%cd%x00%ct%x00%B%x1e"
+    out = git_ops.run(
+        ["git", "log", "--first-parent", "--reverse", "--date=raw", f"--format={fmt}", "HEAD"], cwd=hist_dir
+    ).stdout
+    commits = []
+    for rec in out.split("\x1e"):
+        rec = rec.lstrip("\n")
+        if not rec:
+            continue
+        f = rec.split("\x00")
+        if len(f) < 10:
+            continue
+        commits.append(_Commit(f[0], f[1], f[2], f[3], f[4], f[5], f[6], f[7], int(f[8]), f[9].rstrip("\n")))
+    return commits
+
+
+def rollup_history(hist_dir: str, branch: str, policy: RetentionPolicy, now: Optional[float] = None) -> Optional[Dict]:
+    """按策略汇总历史并强推（带租约）；无需汇总或前置条件不满足时返回 None。调用方需持有仓库锁。"""
+    now = time.time() if now is None else now
+    head = git_ops.rev_parse(hist_dir, "HEAD")
+    remote = git_ops.rev_parse(hist_dir, f"origin/{branch}")
+    if not head or head != remote:
+        return None  # 本地尚有未推送的提交或远端已前进：等下次安静期
+    if git_ops.is_shallow(hist_dir):
+        log("保留策略：浅克隆，先补全历史（fetch --unshallow）")
+        git_ops.run(["git", "fetch", "--unshallow", "origin", branch], cwd=hist_dir)
+        if git_ops.rev_parse(hist_dir, f"origin/{branch}") != head:
+            return None
+
+    commits = _first_parent_history(hist_dir)
+    keep = set(policy.select([(c.sha, c.ts) for c in commits], now))
+    if len(keep) >= len(commits):
+        return None
+
+    parent = ""
+    dropped = 0
+    for c in commits:
+        if c.sha not in keep:
+            dropped += 1
+            continue
+        msg = c.message
+        if dropped:
+            msg = f"{msg}\n\n(rolled up {dropped} earlier commit(s))"
+            dropped = 0
+        env = dict(os.environ)
+        env.update({
+            "GIT_AUTHOR_NAME": c.author_name, "GIT_AUTHOR_EMAIL": c.author_email, "GIT_AUTHOR_DATE": c.author_date,
+            "GIT_COMMITTER_NAME": c.committer_name, "GIT_COMMITTER_EMAIL": c.committer_email,
+            "GIT_COMMITTER_DATE": c.committer_date,
+        })
+        cmd = ["git", "commit-tree", c.tree, "-F", "-"]
+        if parent:
+            cmd[3:3] = ["-p", parent]
+        parent = git_ops.run(cmd, cwd=hist_dir, input=msg, env=env).stdout.strip()
+
+    new_tip = parent
+    proc = git_ops.run(
+        ["git", "push", f"--force-with-lease=refs/heads/{branch}:{head}", "origin", f"{new_tip}:refs/heads/{branch}"],
+        cwd=hist_dir, check=False,
+    )
+    if proc.returncode != 0:
+        log(f"保留策略：强推被拒绝（远端已变化？），放弃本次汇总：{proc.stderr.strip()[:200]}")
+        return None
+    git_ops.run(["git", "update-ref", f"refs/heads/{branch}", new_tip, head], cwd=hist_dir)
+    git_ops.run(["git", "update-ref", f"refs/remotes/origin/{branch}", new_tip], cwd=hist_dir, check=False)
+    result = {"before": len(commits), "after": len(keep), "old_head": head, "new_head": new_tip}
+    log(f"保留策略：历史 {len(commits)} -> {len(keep)} 个提交，已带租约强推")
+    return result
+
+
+def repo_stats(hist_dir: str) -> Dict[str, int]:
+    """`git count-objects -v` 的数值字段（size 类单位为 KiB）。"""
+    out = git_ops.run(["git", "count-objects", "-v"], cwd=hist_dir, check=False).stdout
+    stats: Dict[str, int] = {}
+    for line in out.splitlines():
+        key, _, val = line.partition(":")
+        try:
+            stats[key.strip().replace("-", "_")] = int(val.strip())
+        except ValueError:
+            continue
+    stats["total_kib"] = stats.get("size", 0) + stats.get("size_pack", 0) + stats.get("size_garbage", 0)
+    return stats
+
+
+def run_maintenance(hist_dir: str, prune: bool = False) -> Dict[str, int]:
+    """打包引用与松散对象、写 commit-graph；`prune=True`（历史汇总后）时清理不可达对象。"""
+    git_ops.run(["git", "pack-refs", "--all"], cwd=hist_dir, check=False)
+    if prune:
+        git_ops.run(["git", "reflog", "expire", "--expire-unreachable=now", "--all"], cwd=hist_dir, check=False)
+        git_ops.run(["git", "gc", "--prune=now", "--quiet"], cwd=hist_dir, check=False)
+    else:
+        git_ops.run(["git", "repack", "-d", "-l", "-q"], cwd=hist_dir, check=False)
+    git_ops.run(["git", "commit-graph", "write", "--reachable"], cwd=hist_dir, check=False)
+    return repo_stats(hist_dir)
@@ -0,0 +1,117 @@
+"""自适应同步调度。
+
+- 失败时指数退避（带抖动），避免 GitHub 故障或限流期间持续冲击远端、刷屏日志；
+- 成功时按变更频率调整间隔：近期有提交则缩短，连续空闲则逐步拉长；
+- 所有间隔都限制在 [min_interval, max_interval]（退避上限单独由 backoff_max 控制）。
+
+可调环境变量：
+- SYNC_MIN_INTERVAL：最短同步间隔（秒），默认 30。
+- SYNC_MAX_INTERVAL：空闲时间隔可拉长到的上限（秒），默认 1800。
+- SYNC_BACKOFF_BASE / SYNC_BACKOFF_MAX：失败退避的初始值与上限（秒），默认 5 / 900。
+- SYNC_JITTER：抖动比例，默认 0.2（实际间隔在 ±20% 内随机）。
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+
+class AdaptiveScheduler:
+    """记录每轮结果并给出下一轮的等待时间。"""
+
+    def __init__(
+        self,
+        base_interval: float,
+        min_interval: Optional[float] = None,
+        max_interval: Optional[float] = None,
+        backoff_base: Optional[float] = None,
+        backoff_max: Optional[float] = None,
+        jitter: Optional[float] = None,
+        window: float = 3600.0,
+        growth: float = 1.5,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        env = os.environ
+        self.min_interval = float(env.get("SYNC_MIN_INTERVAL", "30")) if min_interval is None else min_interval
+        self.max_interval = float(env.get("SYNC_MAX_INTERVAL", "1800")) if max_interval is None else max_interval
+        self.max_interval = max(self.max_interval, base_interval, self.min_interval)
+        self.base_interval = min(max(base_interval, self.min_interval), self.max_interval)
+        self.backoff_base = float(env.get("SYNC_BACKOFF_BASE", "5")) if backoff_base is None else backoff_base
+        self.backoff_max = float(env.get("SYNC_BACKOFF_MAX", "900")) if backoff_max is None else backoff_max
+        self.jitter = float(env.get("SYNC_JITTER", "0.2")) if jitter is None else jitter
+        self.window = window
+        self.growth = growth
+        # 空闲间隔达到 max_interval 所需的最多步数（growth<=1 时间隔不增长）
+        self._idle_cap = 1
+        if growth > 1 and self.base_interval > 0:
+            self._idle_cap = int(math.ceil(math.log(self.max_interval / self.base_interval, growth))) + 1
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._changes: Deque[float] = deque()
+        self.failure_streak = 0
+        self.idle_streak = 0
+        self.last_error = ""
+        self.next_run: Optional[float] = None
+        self.delay = self.base_interval
+        self.reason = "initial"
+
+    def _jittered(self, delay: float) -> float:
+        if self.jitter <= 0:
+            return delay
+        return delay * self._rng.uniform(1.0 - self.jitter, 1.0 + self.jitter)
+
+    def _plan(self, delay: float, reason: str, now: float) -> float:
+        self.delay = round(delay, 3)
+        self.reason = reason
+        self.next_run = now + delay
+        return delay
+
+    def record_success(self, changed: bool, now: Optional[float] = None) -> float:
+        """一轮成功结束；返回距下一轮的秒数。"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self.failure_streak = 0
+            self.last_error = ""
+            while self._changes and now - self._changes[0] > self.window:
+                self._changes.popleft()
+            if changed:
+                self._changes.append(now)
+                self.idle_streak = 0
+                # 窗口内提交越多，间隔越短
+                delay = self.base_interval / (1 + len(self._changes))
+                reason = "active"
+            else:
+                self.idle_streak += 1
+                # 指数只需增长到触及上限为止；否则长期空闲后浮点幂运算会溢出
+                delay = min(self.base_interval * self.growth ** min(self.idle_streak, self._idle_cap), self.max_interval)
+                reason = "idle"
+            delay = min(max(self._jittered(delay), self.min_interval), self.max_interval)
+            return self._plan(delay, reason, now)
+
+    def record_failure(self, error: str = "", now: Optional[float] = None) -> float:
+        """一轮失败；返回退避等待的秒数（指数增长，带抖动，不低于 backoff_base 的一半）。"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self.failure_streak += 1
+            self.last_error = error[:500]
+            delay = min(self.backoff_max, self.backoff_base * (2 ** min(self.failure_streak - 1, 62)))
+            delay = max(self._jittered(delay), self.backoff_base / 2)
+            return self._plan(delay, "backoff", now)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "next_run": self.next_run,
+                "delay": self.delay,
+                "reason": self.reason,
+                "failure_streak": self.failure_streak,
+                "idle_streak": self.idle_streak,
+                "changes_in_window": len(self._changes),
+                "last_error": self.last_error,
+            }
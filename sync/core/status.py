@@ -0,0 +1,67 @@
+"""内存中的状态快照。
+
+守护进程在每个同步阶段结束后、以及文件系统事件到来时更新快照；
+`/sync/api/status` 直接返回快照（附带 ETag），无需再读取配置或启动 git 子进程。
+"""
+
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class StatusBoard:
+    """线程安全的状态字典；内容变化时 ETag 随之变化并唤醒等待者。"""
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._data: Dict[str, Any] = {}
+        self._etag = self._digest(self._data)
+        self._subscribers: List[Callable[[], None]] = []
+
+    def subscribe(self, fn: Callable[[], None]) -> None:
+        """内容变化后（在更新线程中、锁外）调用 `fn()`；用于把分片状态汇总到上层快照。"""
+        with self._cond:
+            self._subscribers.append(fn)
+
+    @staticmethod
+    def _digest(data: Dict[str, Any]) -> str:
+        raw = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+        return '"' + hashlib.sha1(raw).hexdigest()[:20] + '"'
+
+    def update(self, **fields: Any) -> bool:
+        """合并字段；返回内容是否发生变化。"""
+        with self._cond:
+            if all(k in self._data and self._data[k] == v for k, v in fields.items()):
+                return False
+            self._data.update(copy.deepcopy(fields))
+            self._etag = self._digest(self._data)
+            self._cond.notify_all()
+            subscribers = list(self._subscribers)
+        for fn in subscribers:
+            fn()
+        return True
+
+    @property
+    def etag(self) -> str:
+        with self._cond:
+            return self._etag
+
+    def snapshot(self) -> Tuple[Dict[str, Any], str]:
+        with self._cond:
+            return copy.deepcopy(self._data), self._etag
+
+    def wait_changed(self, etag: Optional[str], timeout: float) -> Tuple[Dict[str, Any], str]:
+        """阻塞直到 ETag 与给定值不同或超时，返回最新快照。"""
+        deadline = time.monotonic() + max(0.0, timeout)
+        with self._cond:
+            while etag is not None and self._etag == etag:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return copy.deepcopy(self._data), self._etag
@@ -0,0 +1,244 @@
+"""基于 inotify 的目标目录监听（带去抖）。
+
+通过 ctypes 直接调用 libc 的 inotify 接口，不引入额外依赖；在非 Linux 或
+inotify 不可用时 `start()` 返回 False，由调用方回退到定时轮询。
+
+去抖策略：
+- 任何事件都会刷新“最后事件时间”；当距离最后一次事件超过 `debounce` 秒时触发一次同步；
+- 若写入持续不断，则最迟在首个事件之后 `max_delay` 秒强制触发，避免饿死。
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sync.utils.logging import err, log
+
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    | IN_DELETE_SELF | IN_MOVE_SELF | IN_ATTRIB
+)
+_EVENT_HDR = struct.Struct("iIII")
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class TreeWatcher:
+    """递归监听若干根路径，把写入突发合并为一次“需要同步”的信号。"""
+
+    def __init__(
+        self,
+        roots: Iterable[str],
+        debounce: float = 5.0,
+        max_delay: float = 60.0,
+        on_change: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.roots: List[str] = [os.path.abspath(r) for r in roots]
+        self.debounce = max(0.0, debounce)
+        self.max_delay = max(self.debounce, max_delay)
+        self._libc = None
+        self._fd = -1
+        self._wds: Dict[int, str] = {}
+        self._wds_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._first_event = 0.0
+        self._last_event = 0.0
+        self._pending = False
+        self._closed = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.events_seen = 0
+        # 一次写入突发的首个事件到来时调用（在监听线程中执行，应保持轻量）
+        self.on_change = on_change
+
+    # -------- 生命周期 --------
+    def start(self) -> bool:
+        libc = _load_libc()
+        if libc is None or not hasattr(libc, "inotify_init1"):
+            return False
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            e = ctypes.get_errno()
+            err(f"inotify 初始化失败：{os.strerror(e)}")
+            return False
+        self._libc = libc
+        self._fd = fd
+        for root in self.roots:
+            self._add_tree(root)
+        self._thread = threading.Thread(target=self._loop, name="sync-watcher", daemon=True)
+        self._thread.start()
+        log(f"已启用文件监听：{len(self._wds)} 个目录，去抖 {self.debounce:g}s")
+        return True
+
+    def close(self) -> None:
+        self._closed.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        if self._fd >= 0:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = -1
+
+    def rewatch(self, roots: Iterable[str]) -> None:
+        """目标集合变化（重新链接/热加载）后补充监听新路径。"""
+        self.roots = [os.path.abspath(r) for r in roots]
+        if self._fd < 0:
+            return
+        with self._wds_lock:
+            watched = set(self._wds.values())
+        for root in self.roots:
+            if root not in watched:
+                self._add_tree(root)
+
+    # -------- 等待接口 --------
+    def wait(self, timeout: float, stop: Optional[threading.Event] = None) -> bool:
+        """阻塞直到一次写入突发平静下来（返回 True）或超时/停止（返回 False）。"""
+        deadline = time.monotonic() + max(0.0, timeout)
+        with self._cond:
+            while True:
+                if self._closed.is_set() or (stop is not None and stop.is_set()):
+                    return False
+                now = time.monotonic()
+                if self._pending:
+                    due = min(self._last_event + self.debounce, self._first_event + self.max_delay)
+                    if now >= due:
+                        self._pending = False
+                        return True
+                    wake = due
+                else:
+                    if now >= deadline:
+                        return False
+                    wake = deadline
+                self._cond.wait(max(0.05, min(wake - now, 1.0)))
+
+    def pending(self) -> bool:
+        with self._cond:
+            return self._pending
+
+    # -------- 内部实现 --------
+    def _add_watch(self, path: str) -> None:
+        if self._libc is None:
+            return
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK | IN_ONLYDIR)
+        if wd < 0:
+            e = ctypes.get_errno()
+            if e == errno.ENOSPC:
+                err("inotify watch 数量达到上限（fs.inotify.max_user_watches），部分目录将依赖定时兜底")
+            return
+        with self._wds_lock:
+            self._wds[wd] = path
+
+    def _add_tree(self, root: str) -> None:
+        if os.path.isdir(root):
+            stack = [root]
+        else:
+            # 文件型目标：监听其父目录
+            parent = os.path.dirname(root)
+            if os.path.isdir(parent):
+                self._add_watch(parent)
+            return
+        while stack:
+            d = stack.pop()
+            self._add_watch(d)
+            try:
+                with os.scandir(d) as it:
+                    for entry in it:
+                        if entry.name == ".git":
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+            except OSError:
+                continue
+
+    def _mark(self) -> None:
+        now = time.monotonic()
+        with self._cond:
+            first = not self._pending
+            if first:
+                self._first_event = now
+                self._pending = True
+            self._last_event = now
+            self.events_seen += 1
+            self._cond.notify_all()
+        if first and self.on_change is not None:
+            try:
+                self.on_change()
+            except Exception:
+                pass
+
+    def _loop(self) -> None:
+        while not self._closed.is_set():
+            try:
+                r, _, _ = select.select([self._fd], [], [], 1.0)
+            except (OSError, ValueError):
+                return
+            if not r:
+                continue
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except OSError:
+                return
+            changed = False
+            off = 0
+            while off + _EVENT_HDR.size <= len(buf):
+                wd, mask, _cookie, nlen = _EVENT_HDR.unpack_from(buf, off)
+                name = buf[off + _EVENT_HDR.size: off + _EVENT_HDR.size + nlen].split(b"\0", 1)[0]
+                off += _EVENT_HDR.size + nlen
+                if mask & IN_Q_OVERFLOW:
+                    changed = True
+                    continue
+                with self._wds_lock:
+                    if mask & IN_IGNORED:
+                        self._wds.pop(wd, None)
+                        continue
+                    parent = self._wds.get(wd)
+                if parent is None:
+                    continue
+                fname = os.fsdecode(name) if name else ""
+                if fname == ".git" or fname.endswith(".lock"):
+                    continue
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and fname:
+                    self._add_tree(os.path.join(parent, fname))
+                changed = True
+            if changed:
+                self._mark()
@@ -2,22 +2,31 @@
 
 运行效果：
 - 后台线程运行同步守护：自动初始化/拉取/对齐、迁移与符号链接、空目录跟踪、周期提交推送；
-- 主线程运行 Web 管理页面：端口 5321，前缀 `/sync`（包含状态展示和手动操作）。
+- 主线程运行 Web 管理页面：端口 5321，前缀 `/sync`（包含状态展示和手动操作）；
+- 收到 SIGTERM 后 Web 服务先退出（最多等待 SYNC_HTTP_SHUTDOWN_GRACE 秒，之后断开 SSE/长轮询等仍打开的连接），
+  再在期限内做最后一次提交与推送（见 `SyncDaemon.shutdown`）。
 """
 
 from __future__ import annotations
 
 import threading
 
-from sync.daemon import SyncDaemon
+from sync.core import isolation
+from sync.daemon import install_signal_handlers, make_daemon
 from sync.server import serve
+from sync.utils.logging import flush
 
 
 def run_all() -> int:
     """拉起守护线程，并在主线程启动 Web 服务。"""
-    daemon = SyncDaemon()
+    # 先于任何工作线程降低优先级，之后创建的线程与子进程都会继承
+    isolation.current().apply_process()
+    daemon = make_daemon()
+    install_signal_handlers(daemon)
     t = threading.Thread(target=daemon.run, daemon=True)
     t.start()
     # 在主线程启动 Web 服务，带上 daemon 句柄以提供“立即同步”等操作
-    return serve(daemon=daemon)
-
+    rc = serve(daemon=daemon)
+    daemon.shutdown()
+    flush()
+    return rc
@@ -5,13 +5,19 @@ from __future__ import annotations
 提供 /sync 前缀的 FastAPI 页面与 API，便于可视化管理同步。
 """
 
+import asyncio
+import json
 import os
-from typing import Dict
+import time
+from typing import Dict, Optional
 
-from sync.core import git_ops
+from sync.core import git_ops, gitquery, metrics
 from sync.core.blacklist import ensure_git_info_exclude
-from sync.core.config import load_settings, save_file_overrides
-from sync.core.linker import migrate_and_link, precreate_dirlike, track_empty_dirs
+from sync.core.config import load_settings, update_file_overrides
+from sync.core.linker import last_track_stats, migrate_and_link, precreate_dirlike, track_empty_dirs
+from sync.core.readiness import STAGES, read_ready_file, stage_rank
+from sync.core.restore import RestoreError, history, normalize_path, restore_path
+from sync.utils import logging as logbuf
 from sync.utils.logging import err
 
 
@@ -20,37 +26,31 @@ def _remote_url(pat: str, repo: str) -> str:
 
 
 def create_app(daemon=None):
-    from fastapi import FastAPI
+    from fastapi import FastAPI, Request
+    from fastapi.concurrency import run_in_threadpool
     from fastapi.staticfiles import StaticFiles
-    from fastapi.responses import JSONResponse
+    from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 
     app = FastAPI(title="Sync Manager", version="0.2.0")
 
-    @app.get("/sync/api/status")
-    def api_status() -> Dict:
+    def _compute_status() -> Dict:
         st = load_settings()
         ready = os.path.exists(st.ready_file)
         have_git = os.path.isdir(os.path.join(st.hist_dir, ".git"))
         try:
-            proc = git_ops.run(["git", "status", "--porcelain"], cwd=st.hist_dir, check=False)
-            dirty = bool(proc.stdout.strip())
+            dirty = gitquery.is_dirty(st.hist_dir) if have_git else False
         except Exception:
             dirty = False
-        try:
-            head = git_ops.run(["git", "rev-parse", "HEAD"], cwd=st.hist_dir, check=False).stdout.strip()
-        except Exception:
-            head = ""
-        try:
-            rhead = git_ops.run(["git", "rev-parse", f"origin/{st.branch}"], cwd=st.hist_dir, check=False).stdout.strip()
-        except Exception:
-            rhead = ""
+        head = git_ops.rev_parse(st.hist_dir, "HEAD") if have_git else ""
+        rhead = git_ops.rev_parse(st.hist_dir, f"origin/{st.branch}") if have_git else ""
         return {
             "base": st.base,
             "hist_dir": st.hist_dir,
             "branch": st.branch,
             "repo": st.github_repo,
             "targets": st.targets,
-            "excludes": st.excludes,
+            "excludes": st.matcher.patterns,
+            "excluded_targets": [t for t in st.targets if st.matcher.match(t)],
             "ready": ready,
             "git_initialized": have_git,
             "dirty": dirty,
@@ -58,21 +58,93 @@ def create_app(daemon=None):
             "remote_head": rhead,
         }
 
+    @app.get("/sync/api/status")
+    async def api_status(request: Request, wait: float = 0.0):
+        """返回守护进程维护的状态快照（无守护进程时现场计算）。
+
+        支持 `If-None-Match`：ETag 未变时返回 304；配合 `?wait=<秒>` 长轮询，
+        在快照变化或超时前挂起请求（最长 60 秒）。
+        """
+        if daemon is None:
+            return await run_in_threadpool(_compute_status)
+        inm = request.headers.get("if-none-match")
+        data, etag = daemon.status.snapshot()
+        if inm and wait > 0:
+            deadline = time.monotonic() + min(wait, 60.0)
+            # 在线程池中等待快照的条件变量；分段等待以便检查客户端断开，且不长期占用工作线程
+            while etag == inm and time.monotonic() < deadline:
+                step = min(5.0, deadline - time.monotonic())
+                data, etag = await run_in_threadpool(daemon.status.wait_changed, inm, step)
+                if etag == inm and await request.is_disconnected():
+                    break
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if inm == etag:
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(data, headers=headers)
+
+    @app.get("/sync/api/ready")
+    async def api_ready(request: Request, stage: str = "linked", timeout: float = 0.0):
+        """阻塞直到守护进程到达 `stage`（starting/remote_ready/linked/synced）或超时（最长 300 秒）。
+
+        到达返回 200，超时返回 503；门控服务用 `curl -f` 即可等待，无需轮询 git。
+        无守护进程时只读取就绪文件。
+        """
+        if stage_rank(stage) < 0:
+            return JSONResponse({"ok": False, "error": f"unknown stage: {stage}", "stages": list(STAGES)}, status_code=400)
+
+        def current() -> str:
+            if daemon is not None:
+                return daemon.readiness.stage
+            return read_ready_file(load_settings().ready_file).get("stage", "starting")
+
+        now = current()
+        deadline = time.monotonic() + min(max(timeout, 0.0), 300.0)
+        while stage_rank(now) < stage_rank(stage) and time.monotonic() < deadline:
+            if daemon is not None:
+                # 阻塞在就绪状态的条件变量上（分段等待，以便检查客户端断开）
+                step = min(5.0, deadline - time.monotonic())
+                await run_in_threadpool(daemon.readiness.wait, stage, step)
+            else:
+                await asyncio.sleep(0.25)
+            now = current()
+            if stage_rank(now) < stage_rank(stage) and await request.is_disconnected():
+                break
+        reached = stage_rank(now) >= stage_rank(stage)
+        body = {"ok": reached, "stage": now, "wanted": stage}
+        return JSONResponse(body, status_code=200 if reached else 503, headers={"Cache-Control": "no-cache"})
+
+    def _enqueue(kind: str, shard: str = ""):
+        """交给守护进程的任务队列执行并立即返回任务信息（同类排队任务会被合并）。
+
+        分片模式下默认分发给全部分片；`?shard=<name>` 只作用于单个分片。
+        """
+        target = daemon.shard(shard) if shard else daemon
+        if target is None:
+            return JSONResponse({"ok": False, "error": f"unknown shard: {shard}"}, status_code=404)
+        job = target.jobs.submit(kind)
+        return JSONResponse({"ok": True, "job": job.to_dict()}, status_code=202)
+
+    def _all_settings():
+        return daemon.all_settings() if daemon is not None else [load_settings()]
+
     @app.post("/sync/api/init")
-    def api_init():
+    def api_init(shard: str = ""):
+        if daemon is not None:
+            return _enqueue("init", shard)
         st = load_settings()
         try:
             git_ops.ensure_repo(st.hist_dir, st.branch)
-            ensure_git_info_exclude(st.hist_dir, st.excludes)
+            ensure_git_info_exclude(st.hist_dir, st.matcher)
             git_ops.set_remote(st.hist_dir, _remote_url(st.github_pat, st.github_repo))
-            if git_ops.remote_is_empty(st.hist_dir):
+            info = git_ops.probe_remote(st.hist_dir)
+            if info.empty:
                 git_ops.initial_commit_if_needed(st.hist_dir)
                 git_ops.push(st.hist_dir, st.branch)
             else:
-                git_ops.fetch_and_checkout(st.hist_dir, st.branch)
+                git_ops.checkout_remote(st.hist_dir, st.branch, info)
             precreate_dirlike(st.hist_dir, st.targets)
-            migrate_and_link(st.base, st.hist_dir, st.targets)
-            track_empty_dirs(st.hist_dir, st.targets, st.excludes)
+            migrate_and_link(st.base, st.hist_dir, st.targets, st.matcher)
+            track_empty_dirs(st.hist_dir, st.targets, st.matcher)
             changed = git_ops.add_all_and_commit_if_needed(st.hist_dir, "chore(sync): link and track empty dirs")
             if changed:
                 git_ops.push(st.hist_dir, st.branch)
@@ -81,11 +153,10 @@ def create_app(daemon=None):
             return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
 
     @app.post("/sync/api/sync-now")
-    def api_sync_now():
+    def api_sync_now(shard: str = ""):
+        if daemon is not None:
+            return _enqueue("sync", shard)
         try:
-            if daemon is not None:
-                daemon.pull_commit_push()
-                return {"ok": True}
             st = load_settings()
             git_ops.run(["git", "pull", "--rebase", "origin", st.branch], cwd=st.hist_dir, check=False)
             changed = git_ops.add_all_and_commit_if_needed(st.hist_dir, "chore(sync): manual commit")
@@ -96,7 +167,9 @@ def create_app(daemon=None):
             return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
 
     @app.post("/sync/api/pull")
-    def api_pull():
+    def api_pull(shard: str = ""):
+        if daemon is not None:
+            return _enqueue("pull", shard)
         try:
             st = load_settings()
             git_ops.run(["git", "pull", "--rebase", "origin", st.branch], cwd=st.hist_dir, check=False)
@@ -105,7 +178,9 @@ def create_app(daemon=None):
             return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
 
     @app.post("/sync/api/push")
-    def api_push():
+    def api_push(shard: str = ""):
+        if daemon is not None:
+            return _enqueue("push", shard)
         try:
             st = load_settings()
             git_ops.run(["git", "push", "origin", st.branch], cwd=st.hist_dir, check=False)
@@ -113,13 +188,115 @@ def create_app(daemon=None):
         except Exception as e:
             return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
 
-    @app.post("/sync/api/relink")
-    def api_relink():
+    @app.get("/sync/api/metrics")
+    def api_metrics():
+        """Prometheus 文本格式指标。"""
+        return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    @app.get("/sync/api/jobs")
+    def api_jobs():
+        if daemon is None:
+            return {"jobs": []}
+        return {"jobs": daemon.list_jobs()}
+
+    @app.get("/sync/api/jobs/{job_id}")
+    def api_job(job_id: str):
+        job = daemon.find_job(job_id) if daemon is not None else None
+        if job is None:
+            return JSONResponse({"ok": False, "error": "job not found"}, status_code=404)
+        return job.to_dict()
+
+    @app.get("/sync/api/jobs/{job_id}/events")
+    async def api_job_events(job_id: str, request: Request):
+        """以 SSE 推送任务进度（queued/started/phase_start/phase_end/done/failed）。"""
+        job = daemon.find_job(job_id) if daemon is not None else None
+        if job is None:
+            return JSONResponse({"ok": False, "error": "job not found"}, status_code=404)
+
+        async def stream():
+            seq = 0
+            while True:
+                events = job.events_after(seq)
+                for ev in events:
+                    seq = ev["seq"] + 1
+                    yield f"event: {ev['event']}\ndata: {json.dumps(ev, ensure_ascii=False)}\n\n"
+                if job.done and not job.events_after(seq):
+                    return
+                if await request.is_disconnected():
+                    return
+                await asyncio.sleep(0.25)
+
+        return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    @app.get("/sync/api/logs")
+    def api_logs(after: int = 0, limit: int = 200, level: Optional[str] = None):
+        """最近的日志记录；after>0 时返回该 seq 之后的记录（向后翻页），否则返回最后 limit 条。"""
+        limit = max(1, min(limit, 2000))
+        records = logbuf.BUFFER.since(after, limit, level) if after > 0 else logbuf.BUFFER.tail(limit, level)
+        return {"records": records, "last_seq": logbuf.BUFFER.last_seq}
+
+    @app.get("/sync/api/logs/stream")
+    async def api_logs_stream(request: Request, after: int = -1, level: Optional[str] = None):
+        """以 SSE 跟随日志；after 省略时先回放最后 100 条。"""
+        async def stream():
+            if after < 0:
+                backlog = logbuf.BUFFER.tail(100, level)
+                seq = backlog[0]["seq"] - 1 if backlog else logbuf.BUFFER.last_seq
+            else:
+                seq = after
+            while True:
+                for rec in logbuf.BUFFER.since(seq, 500, level):
+                    seq = rec["seq"]
+                    yield f"id: {seq}\nevent: log\ndata: {json.dumps(rec, ensure_ascii=False)}\n\n"
+                if await request.is_disconnected():
+                    return
+                await asyncio.sleep(0.5)
+
+        return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    @app.get("/sync/api/history")
+    def api_history(path: str, limit: int = 50):
+        """列出某个目标/存档槽位（相对 HIST_DIR 的路径）的历史版本。"""
+        limit = max(1, min(limit, 500))
         try:
+            if daemon is not None:
+                return daemon.owner_of(path).history(path, limit)
             st = load_settings()
-            precreate_dirlike(st.hist_dir, st.targets)
-            migrate_and_link(st.base, st.hist_dir, st.targets)
-            track_empty_dirs(st.hist_dir, st.targets, st.excludes)
+            return history(st.hist_dir, st.branch, normalize_path(path, st.targets), limit)
+        except RestoreError as e:
+            return JSONResponse({"ok": False, "error": str(e)}, status_code=400)
+        except Exception as e:
+            return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
+
+    @app.post("/sync/api/restore")
+    def api_restore(payload: dict):
+        """把目标/存档槽位恢复到指定提交（先暂存再原子替换），随后提交并推送。"""
+        path = str(payload.get("path", ""))
+        commit = str(payload.get("commit", ""))
+        if not path or not commit:
+            return JSONResponse({"ok": False, "error": "path 和 commit 必填"}, status_code=400)
+        try:
+            if daemon is not None:
+                result = daemon.owner_of(path).restore(path, commit)
+            else:
+                st = load_settings()
+                result = restore_path(st.hist_dir, st.branch, normalize_path(path, st.targets), commit)
+            return {"ok": True, **result}
+        except RestoreError as e:
+            return JSONResponse({"ok": False, "error": str(e)}, status_code=400)
+        except Exception as e:
+            return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
+
+    @app.post("/sync/api/relink")
+    def api_relink(shard: str = ""):
+        if daemon is not None:
+            # 经由任务队列在仓库锁内执行，不与同步轮次中的迁移并发操作同一目录
+            return _enqueue("relink", shard)
+        try:
+            for st in _all_settings():
+                precreate_dirlike(st.hist_dir, st.targets)
+                migrate_and_link(st.base, st.hist_dir, st.targets, st.matcher)
+                track_empty_dirs(st.hist_dir, st.targets, st.matcher)
             return {"ok": True}
         except Exception as e:
             return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
@@ -127,9 +304,8 @@ def create_app(daemon=None):
     @app.post("/sync/api/track-empty")
     def api_track_empty():
         try:
-            st = load_settings()
-            n = track_empty_dirs(st.hist_dir, st.targets, st.excludes)
-            return {"ok": True, "written": n}
+            n = sum(track_empty_dirs(st.hist_dir, st.targets, st.matcher) for st in _all_settings())
+            return {"ok": True, "written": n, "stats": last_track_stats()}
         except Exception as e:
             return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
 
@@ -142,8 +318,7 @@ def create_app(daemon=None):
     def api_set_targets(payload: dict):
         try:
             st = load_settings()
-            data = {"targets": payload.get("targets", st.targets), "excludes": st.excludes}
-            save_file_overrides(st.hist_dir, data)
+            update_file_overrides(st.hist_dir, targets=payload.get("targets", st.targets))
             return {"ok": True}
         except Exception as e:
             return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
@@ -157,9 +332,13 @@ def create_app(daemon=None):
     def api_set_excludes(payload: dict):
         try:
             st = load_settings()
-            data = {"targets": st.targets, "excludes": payload.get("excludes", st.excludes)}
-            save_file_overrides(st.hist_dir, data)
-            ensure_git_info_exclude(st.hist_dir, data["excludes"])
+            excludes = payload.get("excludes", st.excludes)
+            update_file_overrides(st.hist_dir, excludes=excludes)
+            # 立即按新配置重写每个历史仓库（含分片）的 info/exclude，保留就绪文件等额外条目；
+            # 守护进程在下一轮同步时再切换到新配置
+            for repo in load_settings().split_shards().values():
+                if os.path.isdir(os.path.join(repo.hist_dir, ".git")):
+                    ensure_git_info_exclude(repo.hist_dir, repo.matcher, extra=repo.exclude_extras())
             return {"ok": True}
         except Exception as e:
             return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
@@ -179,6 +358,11 @@ def serve(daemon=None) -> int:
         return 1
 
     app = create_app(daemon=daemon)
-    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("SYNC_PORT", "5321")))
+    # 日志 SSE 与状态长轮询不会自行结束；不设上限时 uvicorn 退出会一直等待这些连接，
+    # 守护进程的最后一次推送要等它返回后才开始
+    grace = float(os.environ.get("SYNC_HTTP_SHUTDOWN_GRACE", "3"))
+    uvicorn.run(
+        app, host="0.0.0.0", port=int(os.environ.get("SYNC_PORT", "5321")), timeout_graceful_shutdown=grace
+    )
     return 0
 
@@ -1,21 +1,150 @@
-"""简单日志工具：统一输出格式，并对敏感信息进行掩码。"""
+"""日志工具：统一输出格式，并对敏感信息进行掩码。
 
+- `log`/`err` 只负责生成记录并放入队列，由后台写线程批量写出（每批一次 flush），
+  避免大量链接/迁移日志时每行一次 write+flush 系统调用；
+- 输出格式由 SYNC_LOG_FORMAT 控制：`text`（默认，与以往一致）或 `json`（每行一个 JSON 对象）；
+- 最近 SYNC_LOG_BUFFER 条（默认 2000）记录保存在内存环形缓冲中，供 `/sync/api/logs` 分页或 SSE 跟随。
+"""
+
+import atexit
+import json
+import os
+import queue
 import sys
-from datetime import datetime
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+
+_FORMAT = os.environ.get("SYNC_LOG_FORMAT", "text").lower()
+_BUFFER_SIZE = int(os.environ.get("SYNC_LOG_BUFFER", "2000"))
+
+
+def _fmt_ts(ts: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts))
+
+
+class LogBuffer:
+    """有界环形缓冲；每条记录带单调递增的 seq，便于客户端增量拉取。"""
+
+    def __init__(self, size: int) -> None:
+        self._records: Deque[Dict[str, Any]] = deque(maxlen=max(1, size))
+        self._seq = 0
+        self._cond = threading.Condition()
+
+    def append(self, level: str, msg: str, ts: float) -> Dict[str, Any]:
+        with self._cond:
+            self._seq += 1
+            rec = {"seq": self._seq, "ts": ts, "level": level, "msg": msg}
+            self._records.append(rec)
+            self._cond.notify_all()
+            return rec
+
+    @property
+    def last_seq(self) -> int:
+        with self._cond:
+            return self._seq
+
+    def since(self, after: int = 0, limit: int = 200, level: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._cond:
+            out = [r for r in self._records if r["seq"] > after and (level is None or r["level"] == level)]
+        return [dict(r) for r in out[:max(1, limit)]]
+
+    def tail(self, limit: int = 200, level: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._cond:
+            out = [r for r in self._records if level is None or r["level"] == level]
+        return [dict(r) for r in out[-max(1, limit):]]
+
+    def wait(self, after: int, timeout: float) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self._seq > after, timeout)
+
 
+BUFFER = LogBuffer(_BUFFER_SIZE)
 
-def _now():
-    return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+class _Writer:
+    """后台写线程：从队列批量取出记录写到 stdout/stderr。"""
+
+    def __init__(self) -> None:
+        self._q: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._drained = threading.Condition(self._lock)
+
+    def submit(self, rec: Dict[str, Any]) -> None:
+        with self._lock:
+            self._pending += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="sync-log", daemon=True)
+                self._thread.start()
+        self._q.put(rec)
+
+    @staticmethod
+    def _render(rec: Dict[str, Any]) -> str:
+        if _FORMAT == "json":
+            return json.dumps(
+                {"ts": _fmt_ts(rec["ts"]) + "Z", "level": rec["level"], "logger": "sync", "msg": rec["msg"]},
+                ensure_ascii=False,
+            ) + "\n"
+        prefix = "ERROR: " if rec["level"] == "error" else ""
+        return f"[{_fmt_ts(rec['ts'])}] [sync] {prefix}{rec['msg']}\n"
+
+    def _loop(self) -> None:
+        while True:
+            batch = [self._q.get()]
+            try:
+                while len(batch) < 512:
+                    batch.append(self._q.get_nowait())
+            except queue.Empty:
+                pass
+            out: List[str] = []
+            errs: List[str] = []
+            for rec in batch:
+                if rec is None:
+                    continue
+                (errs if rec["level"] == "error" else out).append(self._render(rec))
+            try:
+                if out:
+                    sys.stdout.write("".join(out))
+                    sys.stdout.flush()
+                if errs:
+                    sys.stderr.write("".join(errs))
+                    sys.stderr.flush()
+            except Exception:
+                pass
+            with self._lock:
+                self._pending -= len(batch)
+                if self._pending <= 0:
+                    self._drained.notify_all()
+
+    def flush(self, timeout: float = 2.0) -> None:
+        with self._lock:
+            self._drained.wait_for(lambda: self._pending <= 0, timeout)
+
+
+_writer = _Writer()
+atexit.register(_writer.flush)
+
+
+def _emit(level: str, msg: str) -> None:
+    rec = BUFFER.append(level, mask_token(msg), time.time())
+    _writer.submit(rec)
 
 
 def log(msg: str):
-    sys.stdout.write(f"[{_now()}] [sync] {msg}\n")
-    sys.stdout.flush()
+    _emit("info", msg)
 
 
 def err(msg: str):
-    sys.stderr.write(f"[{_now()}] [sync] ERROR: {msg}\n")
-    sys.stderr.flush()
+    _emit("error", msg)
+
+
+def flush(timeout: float = 2.0) -> None:
+    """等待队列中的日志全部写出（进程退出前调用）。"""
+    _writer.flush(timeout)
 
 
 def mask_token(s: str) -> str:
@@ -30,4 +159,3 @@ def mask_token(s: str) -> str:
     except Exception:
         pass
     return s.replace("ghp_", "ghp_***")
-
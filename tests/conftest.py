@@ -0,0 +1,24 @@
+import shutil
+import subprocess
+
+import pytest
+
+requires_git = pytest.mark.skipif(shutil.which("git") is None, reason="git 不可用")
+
+
+@pytest.fixture(autouse=True)
+def git_identity(monkeypatch):
+    """测试中的 git 提交不依赖本机的全局配置。"""
+    for key, value in {
+        "GIT_AUTHOR_NAME": "test", "GIT_AUTHOR_EMAIL": "test@local",
+        "GIT_COMMITTER_NAME": "test", "GIT_COMMITTER_EMAIL": "test@local",
+        "GIT_CONFIG_NOSYSTEM": "1",
+    }.items():
+        monkeypatch.setenv(key, value)
+
+
+@pytest.fixture
+def git_repo(tmp_path):
+    repo = tmp_path / "repo"
+    subprocess.run(["git", "init", "-q", "-b", "main", str(repo)], check=True)
+    return repo
@@ -0,0 +1,68 @@
+import subprocess
+
+import pytest
+
+from conftest import requires_git
+from sync.core.blacklist import ExcludeMatcher, ensure_git_info_exclude
+
+PATTERNS = [
+    "Saves/Backup",
+    "*.tmp",
+    "logs/*.log",
+    "**/cache",
+    "ErrorLogs/",
+    "a/**/z",
+    "[ab]x?.bak",
+]
+
+PATHS = [
+    "Saves/Backup",
+    "Saves/Backup/Farm_1/Farm_1",
+    "Saves/Backup2",
+    "Saves/Other/x.xml",
+    "Saves",
+    "foo.tmp",
+    "d/e/foo.tmp",
+    "foo.tmpx",
+    "logs/a.log",
+    "logs/sub/a.log",
+    "x/logs/a.log",
+    "cache",
+    "deep/er/cache/f",
+    "ErrorLogs/log.txt",
+    "ErrorLogsX/f",
+    "a/z",
+    "a/b/c/z",
+    "b/a/z",
+    "ax1.bak",
+    "cx1.bak",
+    "d/bxy.bak",
+]
+
+
+@requires_git
+def test_matches_git_check_ignore(git_repo):
+    """同一份规则写入 info/exclude 后，git 的判断与 ExcludeMatcher 一致。"""
+    matcher = ExcludeMatcher(PATTERNS)
+    ensure_git_info_exclude(str(git_repo), matcher)
+    proc = subprocess.run(
+        ["git", "check-ignore", "--no-index", "--stdin"],
+        cwd=git_repo, input="\n".join(PATHS), capture_output=True, text=True,
+    )
+    ignored_by_git = set(proc.stdout.split())
+    mismatched = [p for p in PATHS if matcher.match(p) != (p in ignored_by_git)]
+    assert not mismatched
+
+
+def test_ancestor_entry_excludes_subtree():
+    m = ExcludeMatcher(["Saves/Backup"])
+    assert m.match("Saves/Backup/Farm_1/Farm_1")
+    assert not m.match("Saves/Backup2/Farm_1")
+    assert not m.match("Saves")
+
+
+@pytest.mark.parametrize("raw", ["./Saves/Backup/", "/Saves/Backup", " Saves/Backup "])
+def test_patterns_are_normalized(raw):
+    m = ExcludeMatcher([raw])
+    assert m.patterns == ["Saves/Backup"]
+    assert m.git_exclude_lines() == ["/Saves/Backup"]
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from conftest import requires_git
+from sync.core import git_ops
+from sync.core.changes import StatManifest
+
+
+@pytest.fixture
+def hist(tmp_path):
+    root = tmp_path / "hist"
+    (root / ".git").mkdir(parents=True)
+    (root / "Saves" / "Farm_1").mkdir(parents=True)
+    (root / "Saves" / "Farm_1" / "Farm_1").write_text("day 1")
+    (root / "Saves" / "Farm_1" / "SaveGameInfo").write_text("info")
+    return root
+
+
+def _baseline(hist, excludes=()):
+    m = StatManifest(str(hist), ["Saves/"], excludes)
+    _, snapshot = m.changed_paths()
+    m.save(snapshot)
+    return StatManifest(str(hist), ["Saves/"], excludes)  # 新实例：从磁盘读取清单
+
+
+def _bump(path):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_without_manifest_falls_back_to_full_add(hist):
+    changed, snapshot = StatManifest(str(hist), ["Saves/"]).changed_paths()
+    assert changed is None
+    assert "Saves/Farm_1/Farm_1" in snapshot
+
+
+def test_no_changes_after_save(hist):
+    changed, _ = _baseline(hist).changed_paths()
+    assert changed == []
+
+
+def test_detects_add_modify_and_delete(hist):
+    m = _baseline(hist)
+    save = hist / "Saves" / "Farm_1" / "Farm_1"
+    save.write_text("day 2")
+    _bump(save)
+    (hist / "Saves" / "Farm_1" / "SaveGameInfo").unlink()
+    (hist / "Saves" / "Farm_2").mkdir()
+    (hist / "Saves" / "Farm_2" / "Farm_2").write_text("new")
+
+    changed, _ = m.changed_paths()
+    assert sorted(changed) == [
+        "Saves/Farm_1/Farm_1",
+        "Saves/Farm_1/SaveGameInfo",
+        "Saves/Farm_2/Farm_2",
+    ]
+    assert m.count_dirty() == 3
+
+
+def test_excluded_files_are_not_reported(hist):
+    m = _baseline(hist, ["*.tmp", "Saves/Backup"])
+    (hist / "Saves" / "Farm_1" / "Farm_1.tmp").write_text("scratch")
+    (hist / "Saves" / "Backup").mkdir()
+    (hist / "Saves" / "Backup" / "old").write_text("old")
+    changed, snapshot = m.changed_paths()
+    assert changed == []
+    assert not any(p.endswith(".tmp") or "Backup" in p for p in snapshot)
+
+
+def test_changed_excludes_invalidate_manifest(hist):
+    _baseline(hist, ["*.tmp"])
+    changed, _ = StatManifest(str(hist), ["Saves/"], ["*.bak"]).changed_paths()
+    assert changed is None
+
+
+@requires_git
+def test_staging_failure_raises(git_repo):
+    (git_repo / "a.txt").write_text("a")
+    (git_repo / ".git" / "index.lock").write_text("")
+    with pytest.raises(git_ops.GitError):
+        git_ops.add_paths_and_commit_if_needed(str(git_repo), ["a.txt"], "sync")
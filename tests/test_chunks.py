@@ -0,0 +1,165 @@
+import io
+import random
+import subprocess
+
+import pytest
+
+from conftest import requires_git
+from sync.core.chunks import (
+    MAGIC,
+    ChunkStore,
+    FilterProcess,
+    Manifest,
+    _PktIO,
+    blob_id,
+    cut_points,
+    install,
+)
+
+AVG = 256
+
+
+def _data(n, seed=0):
+    return random.Random(seed).getrandbits(n * 8).to_bytes(n, "little")
+
+
+def _chunks(data, cuts):
+    start, out = 0, []
+    for end in cuts:
+        out.append(data[start:end])
+        start = end
+    return out
+
+
+def test_cut_points_are_deterministic_and_bounded():
+    data = _data(64 * 1024)
+    cuts = cut_points(data, AVG)
+    assert cuts == cut_points(bytes(data), AVG)
+    assert cuts[-1] == len(data)
+    sizes = [b - a for a, b in zip([0] + cuts, cuts)]
+    assert all(s <= AVG * 4 for s in sizes)
+    assert all(s > AVG // 4 for s in sizes[:-1])
+
+
+def test_local_edit_only_changes_nearby_chunks():
+    data = _data(64 * 1024)
+    edited = data[:30000] + b"inserted" + data[30000:]
+    before = set(_chunks(data, cut_points(data, AVG)))
+    after = _chunks(edited, cut_points(edited, AVG))
+    new = [c for c in after if c not in before]
+    assert len(new) <= 3
+    assert len(after) > 50
+
+
+def test_empty_input_has_no_chunks():
+    assert cut_points(b"", AVG) == []
+
+
+def test_manifest_render_parse_round_trip():
+    m = Manifest(10, blob_id(b"0123456789"), [("a" * 40, 4), ("b" * 40, 6)])
+    assert Manifest.parse(m.render()) == m
+    assert Manifest.parse(b"not a manifest") is None
+    assert Manifest.parse(MAGIC + b"size x\n") is None
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = ChunkStore(str(tmp_path / "store.git"), avg=AVG, jobs=2)
+    s.ensure()
+    return s
+
+
+@requires_git
+def test_split_assemble_round_trip(store):
+    data = _data(20 * 1024)
+    manifest = store.split(data)
+    assert sum(n for _, n in manifest.chunks) == len(data)
+    assert store.missing(oid for oid, _ in manifest.chunks) == []
+    assert store.assemble(manifest) == data
+    # 块以普通 blob 保存，git 自身也能读出
+    oid = manifest.chunks[0][0]
+    out = subprocess.run(["git", "cat-file", "blob", oid], cwd=store.path, capture_output=True, check=True).stdout
+    assert out == store.get(oid)
+
+
+@requires_git
+def test_split_registers_only_new_chunks(store):
+    data = _data(8 * 1024)
+    first = store.split(data)
+    pending = store.pending()
+    assert sorted(pending) == sorted({oid for oid, _ in first.chunks})
+    store.split(data)
+    assert store.pending() == pending
+
+
+# -------- pkt-line 过滤协议 --------
+def _client(*requests):
+    """按 git 的一侧编码握手与请求。"""
+    buf = io.BytesIO()
+    pkt = _PktIO(io.BytesIO(), buf)
+    pkt.write_text("git-filter-client", "version=2")
+    pkt.flush_pkt()
+    pkt.write_text("capability=clean", "capability=smudge", "capability=delay")
+    pkt.flush_pkt()
+    for meta, content in requests:
+        pkt.write_text(*meta)
+        pkt.flush_pkt()
+        pkt.write_content(content)
+    return io.BytesIO(buf.getvalue())
+
+
+def _serve(store, threshold, *requests):
+    out = io.BytesIO()
+    FilterProcess(store, threshold, _PktIO(_client(*requests), out)).serve()
+    reply = _PktIO(io.BytesIO(out.getvalue()), io.BytesIO())
+    assert reply.read_text_list() == ["git-filter-server", "version=2"]
+    assert reply.read_text_list() == ["capability=clean", "capability=smudge", "capability=delay"]
+    return reply
+
+
+def _response(reply):
+    status = reply.read_text_list()
+    content = reply.read_content()
+    assert reply.read_text_list() == []
+    return status, content
+
+
+@requires_git
+def test_filter_clean_then_smudge(store):
+    data = _data(16 * 1024)
+    reply = _serve(
+        store, 4096,
+        (["command=clean", "pathname=Saves/big"], data),
+        (["command=clean", "pathname=Saves/small"], b"tiny"),
+    )
+    status, manifest = _response(reply)
+    assert status == ["status=success"] and manifest.startswith(MAGIC)
+    assert _response(reply) == (["status=success"], b"tiny")
+
+    reply = _serve(store, 4096, (["command=smudge", "pathname=Saves/big"], manifest))
+    assert _response(reply) == (["status=success"], data)
+
+
+@requires_git
+def test_filter_reports_missing_chunks_as_error(store):
+    manifest = Manifest(3, blob_id(b"abc"), [(blob_id(b"abc"), 3)]).render()
+    reply = _serve(store, 4096, (["command=smudge", "pathname=Saves/x"], manifest))
+    assert reply.read_text_list() == ["status=error"]
+
+
+@requires_git
+def test_filter_installed_in_repository(git_repo, store):
+    (git_repo / "Saves").mkdir()
+    data = _data(16 * 1024)
+    (git_repo / "Saves" / "big").write_bytes(data)
+    install(str(git_repo), ["Saves/"], store, 4096)
+
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=git_repo, capture_output=True, check=True).stdout
+
+    git("add", "-A")
+    git("commit", "-q", "-m", "big")
+    assert Manifest.parse(git("cat-file", "blob", "HEAD:Saves/big")).size == len(data)
+    (git_repo / "Saves" / "big").unlink()
+    git("checkout", "--", "Saves/big")
+    assert (git_repo / "Saves" / "big").read_bytes() == data
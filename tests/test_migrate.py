@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+from sync.core import linker, migrate
+from sync.core.migrate import MigrationError, migrate_tree
+
+
+def _tree(root):
+    out = {}
+    for d, _, files in os.walk(root):
+        for name in files:
+            p = os.path.join(d, name)
+            with open(p, "rb") as f:
+                out[os.path.relpath(p, root)] = f.read()
+    return out
+
+
+@pytest.fixture
+def saves(tmp_path):
+    src = tmp_path / "base" / "Saves"
+    (src / "Farm_1").mkdir(parents=True)
+    (src / "Farm_1" / "Farm_1").write_bytes(b"<SaveGame>" + b"x" * 4096 + b"</SaveGame>")
+    (src / "Farm_1" / "SaveGameInfo").write_bytes(b"info")
+    (src / "empty").mkdir()
+    return src
+
+
+def test_rename_when_destination_absent(saves, tmp_path):
+    expected = _tree(saves)
+    dst = tmp_path / "hist" / "Saves"
+    stats = migrate_tree(str(saves), str(dst))
+    assert stats.method == "rename"
+    assert not saves.exists()
+    assert _tree(dst) == expected
+
+
+def test_copy_into_existing_destination(saves, tmp_path):
+    dst = tmp_path / "hist" / "Saves"
+    (dst / "Farm_1").mkdir(parents=True)
+    (dst / "old").write_bytes(b"keep")
+    # 与源相同大小与 mtime 的文件按 rsync -a 的规则跳过
+    info = saves / "Farm_1" / "SaveGameInfo"
+    (dst / "Farm_1" / "SaveGameInfo").write_bytes(info.read_bytes())
+    st = os.stat(info)
+    os.utime(dst / "Farm_1" / "SaveGameInfo", ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    stats = migrate_tree(str(saves), str(dst), workers=2)
+    assert stats.method in ("reflink", "copy_file_range", "copy")
+    assert stats.files == 1 and stats.skipped == 1
+    assert saves.exists()  # 拷贝方式下源目录由调用方删除
+    assert (dst / "empty").is_dir()
+    assert (dst / "old").read_bytes() == b"keep"
+    for rel, data in _tree(saves).items():
+        assert (dst / rel).read_bytes() == data
+
+
+def test_source_written_during_copy_fails_verification(saves, tmp_path, monkeypatch):
+    dst = tmp_path / "hist" / "Saves"
+    (dst / "other").mkdir(parents=True)  # 目标非空：不能 rename
+    real_copy = migrate._copy_one
+
+    def copy_then_game_saves(s, t, size):
+        method = real_copy(s, t, size)
+        with open(s, "r+b") as f:  # 游戏在拷贝之后、校验之前写入（大小不变）
+            f.write(b"Y")
+        return method
+
+    monkeypatch.setattr(migrate, "_copy_one", copy_then_game_saves)
+    with pytest.raises(MigrationError):
+        migrate_tree(str(saves), str(dst), workers=1, verify="checksum")
+    assert (saves / "Farm_1" / "Farm_1").exists()
+
+
+def test_failed_target_is_left_unlinked_and_reported(saves, tmp_path, monkeypatch):
+    base, hist = tmp_path / "base", tmp_path / "hist"
+
+    def fail(src, dst):
+        raise MigrationError("校验失败")
+
+    monkeypatch.setattr(linker, "migrate_tree", fail)
+    failed = linker.migrate_and_link(str(base), str(hist), ["Saves/", "Mods/"])
+    assert failed == ["Saves/"]
+    assert saves.is_dir() and not saves.is_symlink()
+    assert (base / "Mods").is_symlink()  # 其他目标照常链接
+
+    monkeypatch.undo()
+    assert linker.migrate_and_link(str(base), str(hist), ["Saves/"]) == []
+    assert saves.is_symlink()
@@ -0,0 +1,65 @@
+import random
+
+from sync.core.schedule import AdaptiveScheduler
+
+
+def _sched(**kw):
+    args = dict(
+        base_interval=60, min_interval=30, max_interval=1800,
+        backoff_base=5, backoff_max=900, jitter=0.0, rng=random.Random(0),
+    )
+    args.update(kw)
+    return AdaptiveScheduler(**args)
+
+
+def test_backoff_doubles_then_clamps_at_max():
+    s = _sched()
+    delays = [s.record_failure("boom", now=i) for i in range(12)]
+    assert delays[:5] == [5, 10, 20, 40, 80]
+    assert delays[-1] == 900
+
+
+def test_long_outage_does_not_overflow():
+    s = _sched(jitter=0.2)
+    for i in range(5000):
+        delay = s.record_failure("offline", now=i)
+    assert s.failure_streak == 5000
+    assert 900 * 0.8 <= delay <= 900 * 1.2
+
+
+def test_success_resets_backoff():
+    s = _sched()
+    for i in range(6):
+        s.record_failure("boom", now=i)
+    assert s.record_success(changed=False, now=10) < 900
+    assert s.failure_streak == 0 and s.last_error == ""
+    assert s.record_failure("again", now=20) == 5
+
+
+def test_idle_interval_grows_to_max_without_overflow():
+    s = _sched()
+    delays = [s.record_success(changed=False, now=i) for i in range(5000)]
+    assert delays[0] == 90
+    assert delays == sorted(delays)
+    assert delays[-1] == 1800
+
+
+def test_activity_shortens_interval_but_respects_min():
+    s = _sched()
+    delays = [s.record_success(changed=True, now=i) for i in range(5)]
+    assert delays[0] == 30  # 60 / 2
+    assert all(d == 30 for d in delays)
+    assert s.snapshot()["changes_in_window"] == 5
+    # 超出统计窗口的变更不再计入
+    s.record_success(changed=False, now=10_000)
+    assert s.snapshot()["changes_in_window"] == 0
+
+
+def test_jitter_stays_within_bounds():
+    s = _sched(jitter=0.2, rng=random.Random(1))
+    for i in range(200):
+        s.record_success(changed=False, now=i)
+        assert 30 <= s.delay <= 1800
+    for i in range(200):
+        delay = s.record_failure("x", now=i)
+        assert 2.5 <= delay <= 900 * 1.2